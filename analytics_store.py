@@ -0,0 +1,217 @@
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+# False drops every record instead of writing it
+ANALYTICS_ENABLED = True
+ANALYTICS_DB_PATH = 'analytics/miscrits.db'
+# The writer commits once this many records are queued, or after ANALYTICS_FLUSH_INTERVAL seconds
+ANALYTICS_BATCH_SIZE = 50
+ANALYTICS_FLUSH_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS encounters (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    species TEXT,
+    ocr_text TEXT,
+    ocr_confidence REAL,
+    is_target INTEGER NOT NULL,
+    turns INTEGER NOT NULL,
+    capture_attempts INTEGER NOT NULL,
+    capture_percent INTEGER,
+    outcome TEXT NOT NULL,
+    startup_seconds REAL,
+    farm_seconds REAL,
+    enemy_read_seconds REAL,
+    fight_seconds REAL,
+    post_battle_seconds REAL,
+    battle_seconds REAL NOT NULL,
+    training INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS encounters_started_at ON encounters (started_at);
+CREATE INDEX IF NOT EXISTS encounters_species ON encounters (species);
+"""
+
+ENCOUNTER_COLUMNS = ('started_at', 'finished_at', 'species', 'ocr_text', 'ocr_confidence', 'is_target', 'turns', 'capture_attempts',
+                     'capture_percent', 'outcome', 'startup_seconds', 'farm_seconds', 'enemy_read_seconds', 'fight_seconds',
+                     'post_battle_seconds', 'battle_seconds', 'training')
+INSERT_ENCOUNTER = f"INSERT INTO encounters ({', '.join(ENCOUNTER_COLUMNS)}) VALUES ({', '.join('?' * len(ENCOUNTER_COLUMNS))})"
+# Battle outcomes recorded by the battle engine. A capture counts as failed once a move is played after it
+OUTCOME_CAPTURED = 'captured'
+OUTCOME_CAPTURE_FAILED = 'capture_failed'
+OUTCOME_FINISHED = 'finished'
+OUTCOME_CONTINUE_MISSING = 'continue_missing'
+# Phases summed by summary(); together they make up the farm-to-farm cycle
+PHASE_COLUMNS = ('farm_seconds', 'enemy_read_seconds', 'fight_seconds', 'post_battle_seconds')
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=10)
+    # WAL lets summary() read while the writer appends; NORMAL only syncs at checkpoints
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class AnalyticsStore:
+    """SQLite (WAL) history of encounters, written in batches by a background thread.
+
+    record_encounter() only queues the row, so the battle loop never waits on disk. The
+    database and writer are created on first use.
+    """
+
+    def __init__(self, path=ANALYTICS_DB_PATH, enabled=ANALYTICS_ENABLED, batch_size=ANALYTICS_BATCH_SIZE,
+                 flush_interval=ANALYTICS_FLUSH_INTERVAL):
+        self.path = path
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.batches_written = 0
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                connection = _connect(self.path)
+                connection.executescript(SCHEMA)
+                connection.close()
+                self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+                self._thread.start()
+
+    def record_encounter(self, **fields):
+        """Queue one encounter row; fields are ENCOUNTER_COLUMNS (missing ones are NULL)."""
+        if not self.enabled:
+            return
+        self._ensure_writer()
+        self._queue.put(tuple(fields.get(column) for column in ENCOUNTER_COLUMNS))
+
+    def _run(self):
+        connection = _connect(self.path)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            # Gather until the batch is full, the interval is up or close() asks to stop
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany(INSERT_ENCOUNTER, batch)
+                    self.rows_written += len(batch)
+                    self.batches_written += 1
+                except sqlite3.Error as e:
+                    print(f"Error writing {len(batch)} encounters to {self.path}: {e}")
+            for _ in range(len(batch) + stopping):
+                self._queue.task_done()
+        connection.close()
+
+    def flush(self):
+        """Block until every queued row is committed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Commit what is queued and stop the writer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def summary(self, since=None):
+        """Aggregate the encounters started at or after the time.time() since (default: all of them).
+
+        Returns encounters per hour (over the span between the first and last encounter), target,
+        capture-attempt and capture rates, mean battle time and mean time per cycle phase, plus counts per species.
+        """
+        self.flush()
+        if not os.path.exists(self.path):
+            return None
+        connection = _connect(self.path)
+        try:
+            where, params = ('WHERE started_at >= ?', (since,)) if since is not None else ('', ())
+            phase_means = ', '.join(f'AVG({column})' for column in PHASE_COLUMNS)
+            row = connection.execute(
+                f"SELECT COUNT(*), MIN(started_at), MAX(finished_at), SUM(is_target), "
+                f"SUM(is_target AND capture_attempts > 0), SUM(outcome = ?), AVG(battle_seconds), AVG(turns), {phase_means} "
+                f"FROM encounters {where}", (OUTCOME_CAPTURED,) + params).fetchone()
+            count, first, last, targets, targets_attempted, captured, mean_battle, mean_turns = row[:8]
+            if not count:
+                return {'encounters': 0}
+            hours = (last - first) / 3600
+            species = connection.execute(
+                f"SELECT COALESCE(species, 'unknown'), COUNT(*), SUM(is_target) FROM encounters {where} "
+                f"GROUP BY species ORDER BY COUNT(*) DESC", params).fetchall()
+            outcomes = dict(connection.execute(f"SELECT outcome, COUNT(*) FROM encounters {where} GROUP BY outcome", params).fetchall())
+        finally:
+            connection.close()
+        return {
+            'encounters': count,
+            'hours': hours,
+            'encounters_per_hour': count / hours if hours else None,
+            'targets': targets,
+            'targets_per_hour': targets / hours if hours else None,
+            'capture_attempt_rate': targets_attempted / targets if targets else None,
+            'captured': captured,
+            # Of the targets a capture was attempted on
+            'capture_rate': captured / targets_attempted if targets_attempted else None,
+            'mean_battle_seconds': mean_battle,
+            'mean_turns': mean_turns,
+            'mean_phase_seconds': dict(zip(PHASE_COLUMNS, row[8:])),
+            'outcomes': outcomes,
+            'species': [{'species': name, 'encounters': n, 'targets': t} for name, n, t in species],
+        }
+
+    def report(self, since=None):
+        """Print summary() in a few lines."""
+        summary = self.summary(since)
+        if not summary or not summary['encounters']:
+            print("Analytics: no encounters recorded")
+            return
+        def fmt(value, spec='.1f'):
+            return '-' if value is None else format(value, spec)
+        def percent(rate):
+            return fmt(None if rate is None else rate * 100, '.0f')
+        print(f"Analytics: {summary['encounters']} encounters over {summary['hours']:.1f}h "
+              f"({fmt(summary['encounters_per_hour'])}/h), {summary['targets']} targets ({fmt(summary['targets_per_hour'])}/h), "
+              f"capture attempted on {percent(summary['capture_attempt_rate'])}% of targets, "
+              f"{summary['captured']} captured ({percent(summary['capture_rate'])}% of attempted)")
+        phases = ', '.join(f"{column.replace('_seconds', '')} {fmt(seconds)}s" for column, seconds in summary['mean_phase_seconds'].items())
+        print(f"  Mean battle {fmt(summary['mean_battle_seconds'])}s over {fmt(summary['mean_turns'])} turns; mean cycle: {phases}")
+        print(f"  Outcomes: {summary['outcomes']}")
+        for entry in summary['species'][:10]:
+            print(f"  {entry['species']}: {entry['encounters']} encounters{' (target)' if entry['targets'] else ''}")
+
+
+# Shared store used by the battle engine
+ANALYTICS = AnalyticsStore()
+
+
+if __name__ == '__main__':
+    # python analytics_store.py [hours]: summarise the last N hours (default: everything)
+    ANALYTICS.report(time.time() - float(sys.argv[1]) * 3600 if len(sys.argv) > 1 else None)
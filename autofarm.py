@@ -1,36 +1,59 @@
+import asyncio
+import os
 import subprocess
+import sys
 import time
-import cv2
-import pyautogui
-import pytesseract
-from utils import extract_text_from_screen_region, find_and_click_template_on_screen, convert_screenshot_to_bgr, fuzzy_text_match
+from utils import extract_text_from_screen_region, find_and_click_template_on_screen, convert_screenshot_to_bgr, fuzzy_text_match, capture_frame
+from pyramid_matcher import PYRAMID
+from farm_scheduler import FarmScheduler, SPOT_POLL_INTERVAL
+from mouse_control import click_at
+from battle_engine import BattleEngine, RECORD_REGIONS
+from change_detector import FrameChangeDetector
+from debug_writer import DEBUG_WRITER
+from metrics import METRICS
+from analytics_store import ANALYTICS
+from miscrit_roster import ENCOUNTERS, format_targets
+from session_recorder import get_recorder, start_recording, stop_recording
+from waits import wait_until, AdaptiveBackoff
 
 # =====================
 # USER CONFIGURABLE SETTINGS
 # =====================
-TARGET_MISCRIT_NAME = 'Light Nanaslug'
+TARGET_MISCRITS = {'Light Nanaslug': 85}  # Target name -> capture chance (%) above which capture is attempted
 PLATINUM_TRAINING = True
 FARM_COOLDOWN = 20
 BATTLE_CHECK_WINDOW = 15
 REFERENCE_OBJECT_PATH = 'Insert_images/reference_image.png'
+FARM_SPOTS = [REFERENCE_OBJECT_PATH]  # Spots farming rotates between, each with its own cooldown, e.g. every image in Insert_images/
 TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H = 522, 965, 180, 25
 POTION_DROP_PATH = 'reference_images/potion drop.png'
 GOLD_DROP_PATH = 'reference_images/gold drop.png'
 OKAY_TEMPLATE_PATH = 'reference_images/okay.png'
 BATTLE_ENGINE_SCRIPT = 'battle_engine.py'
+BATTLE_ENGINE_MODE = 'in_process'  # 'in_process' keeps one warm BattleEngine; 'subprocess' launches battle_engine.py per encounter
+FARM_CONTROLLER = 'loop'  # 'loop' uses the polling loop below; 'state_machine' runs farm_state_machine.py on asyncio (battles always in-process)
+MULTI_WINDOW = False  # True farms every open game window at once (multi_window.py); always uses the state machine, whatever FARM_CONTROLLER is
+RECORD_SESSION = False  # True records analysed frames, detections and clicks to recordings/ for replay and benchmarks
+RECORD_ROIS_ONLY = True  # Record only the battle regions plus a full frame every few seconds instead of every full frame
 # =====================
 
 def save_config_to_file():
     """Save current configuration to config_file.txt"""
+    content = f"{format_targets(TARGET_MISCRITS)}|{PLATINUM_TRAINING}"
     try:
+        # Only rewritten when the settings changed
+        if os.path.exists('config_file.txt'):
+            with open('config_file.txt', 'r') as f:
+                if f.read().strip() == content:
+                    return
         with open('config_file.txt', 'w') as f:
-            f.write(f"{TARGET_MISCRIT_NAME}|{PLATINUM_TRAINING}")
-        print(f"Configuration saved: {TARGET_MISCRIT_NAME}, Platinum Training: {PLATINUM_TRAINING}")
+            f.write(content)
+        print(f"Configuration saved: {format_targets(TARGET_MISCRITS)}, Platinum Training: {PLATINUM_TRAINING}")
     except Exception as e:
         print(f"Error saving configuration: {e}")
 
 def load_config_from_file():
-    """Load configuration from config_file.txt and return (target_name, platinum_training)"""
+    """Load configuration from config_file.txt and return (targets string, platinum_training)"""
     try:
         with open('config_file.txt', 'r') as f:
             content = f.read().strip()
@@ -42,116 +65,206 @@ def load_config_from_file():
                 # Legacy format - just target name
                 return content, True  # Default to True for platinum training
     except FileNotFoundError:
-        return TARGET_MISCRIT_NAME, PLATINUM_TRAINING  # Use defaults if file doesn't exist
+        return format_targets(TARGET_MISCRITS), PLATINUM_TRAINING  # Use defaults if file doesn't exist
     except Exception as e:
         print(f"Error loading configuration: {e}")
-        return TARGET_MISCRIT_NAME, PLATINUM_TRAINING  # Use defaults on error
-
-# Save current configuration to file
-save_config_to_file()
-print(f"Configuration saved to config_file.txt: {TARGET_MISCRIT_NAME}|{PLATINUM_TRAINING}")
+        return format_targets(TARGET_MISCRITS), PLATINUM_TRAINING  # Use defaults on error
 
 def detect_battle_from_turn_indicator(screenshot):
     """Detect if a battle has started by looking for the 'It's your turn!' indicator."""
     turn_card_text, turn_card_area = extract_text_from_screen_region(screenshot, TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H)
-    turn_card_area.save('screenshots/turn_card_area_farm.png')
+    DEBUG_WRITER.submit('screenshots/turn_card_area_farm.png', turn_card_area)
     print(f"OCR result for turn card (farm): {turn_card_text}")
     is_match, similarity = fuzzy_text_match(turn_card_text, "your turn")
     print(f"Similarity ratio with 'your turn': {similarity:.2f}")
     return is_match
 
-def find_and_click_farming_object(screenshot_bgr, reference_path, threshold=0.7):
-    """Find and click the farming object. If not found, check for 'Okay' button using template matching."""
-    template = cv2.imread(reference_path, cv2.IMREAD_UNCHANGED)
-    if template is None:
-        print(f"Warning: Reference image not found at {reference_path}")
-        print("Please ensure the reference image exists in the specified path.")
-        return False
-    result = cv2.matchTemplate(screenshot_bgr, template[:, :, :3], cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-    if max_val < threshold:
-        print(f"Farming object not found (max match: {max_val:.2f}). Skipping this cycle.")
-        # Check for 'Okay' button using template matching
-        screenshot_bgr2, _ = convert_screenshot_to_bgr()
-        if find_and_click_template_on_screen(screenshot_bgr2, OKAY_TEMPLATE_PATH):
-            print("'Okay' detected with template matching and clicked.")
-        return False
-    template_h, template_w = template.shape[:2]
-    center_x = max_loc[0] + template_w // 2
-    center_y = max_loc[1] + template_h // 2
-    print(f"Farming object found at ({center_x}, {center_y}) with match {max_val:.2f}. Clicking...")
-    pyautogui.moveTo(center_x, center_y, duration=0.3)
-    pyautogui.mouseDown()
-    pyautogui.mouseUp()
-    pyautogui.click()
-    return True
+def click_farming_object(center_x, center_y, match=None, spot=None):
+    """Click a farming object found at (center_x, center_y)."""
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.record_event('farm', {'match': match, 'x': center_x, 'y': center_y, 'spot': spot})
+    # Cycle time is measured from one farm click to the next
+    METRICS.count('farm_clicks_total')
+    METRICS.lap('farm_cycle_seconds')
+    # Press/release followed by a click, as the object needs two clicks to register
+    click_at(center_x, center_y, 0.3, clicks=2)
+
+def find_visible_drops(screenshot_bgr, drop_paths, threshold=0.7):
+    """Return the (x, y) centre of every drop (potions, gold, etc.) visible in the screenshot."""
+    frame = PYRAMID.prepare(screenshot_bgr)
+    drops = []
+    for drop_path in drop_paths:
+        max_val, max_loc, template_shape = PYRAMID.match(frame, drop_path, threshold)
+        if max_val is None:
+            print(f"Reference image not found at {drop_path}")
+            continue
+        if max_val > threshold:
+            template_h, template_w = template_shape
+            center_x = max_loc[0] + template_w // 2
+            center_y = max_loc[1] + template_h // 2
+            print(f"Drop found for {drop_path} at ({center_x}, {center_y}) with match {max_val:.2f}.")
+            drops.append((center_x, center_y))
+    return drops
+
+def click_drops(drops):
+    """Click each (x, y) drop found by find_visible_drops."""
+    for center_x, center_y in drops:
+        print(f"Collecting drop at ({center_x}, {center_y})...")
+        click_at(center_x, center_y, 0.3)
 
 def collect_any_visible_drops(drop_paths, threshold=0.7):
     """Check for and collect any visible drops (potions, gold, etc.)."""
     screenshot_bgr, _ = convert_screenshot_to_bgr()
-    for drop_path in drop_paths:
-        find_and_click_template_on_screen(screenshot_bgr, drop_path, threshold)
+    click_drops(find_visible_drops(screenshot_bgr, drop_paths, threshold))
 
-# Check if required files exist
-import os
-if not os.path.exists(REFERENCE_OBJECT_PATH):
-    print(f"Warning: Reference image not found at {REFERENCE_OBJECT_PATH}")
-    print("Please ensure the reference image exists before starting.")
-if not os.path.exists(BATTLE_ENGINE_SCRIPT):
-    print(f"Warning: Battle engine script not found at {BATTLE_ENGINE_SCRIPT}")
-    print("Please ensure battle_engine.py exists in the same directory.")
-
-print("Starting autofarm...")
-print(f"Target miscrit: {TARGET_MISCRIT_NAME}")
-print(f"Platinum training: {PLATINUM_TRAINING}")
-print(f"Farm cooldown: {FARM_COOLDOWN} seconds")
-print(f"Battle check window: {BATTLE_CHECK_WINDOW} seconds")
-
-last_farm_time = 0
-
-while True:
+def battle_started(farm_changes):
+    """Predicate for wait_until: True once the turn indicator shows a battle. OCR only runs when the turn card changed."""
+    def condition():
+        # Only the turn card is needed here, so capture just that region
+        turn_card_frame = capture_frame((TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H))
+        return 'turn_card' in farm_changes.update(turn_card_frame) and detect_battle_from_turn_indicator(turn_card_frame)
+    return condition
+
+def run_battle(battle_engine, detected_at):
+    """Fight one battle, in-process when battle_engine is given, otherwise by launching battle_engine.py."""
+    if battle_engine is not None:
+        try:
+            battle_engine.run_battle(detected_at)
+            battle_engine.report_startup_latency()
+            print("Battle finished. Resuming farming.")
+        except Exception as e:
+            print(f"Battle engine failed with error: {e}")
+            DEBUG_WRITER.flush_ring('battle engine error')
+        return
     try:
-        # Take a screenshot
-        screenshot_bgr, screenshot = convert_screenshot_to_bgr()
-
-        # Check if cooldown has passed
-        time_since_last_farm = time.time() - last_farm_time
-        if time_since_last_farm >= FARM_COOLDOWN:
-            print("Farming...")
-            farm_success = find_and_click_farming_object(screenshot_bgr, REFERENCE_OBJECT_PATH)
-            if farm_success:
-                last_farm_time = time.time()
+        subprocess.run([sys.executable, BATTLE_ENGINE_SCRIPT, '--detected-at', repr(detected_at)], check=True)
+        print("Battle finished. Resuming farming.")
+    except subprocess.CalledProcessError as e:
+        print(f"Battle engine failed with error: {e}")
+    except FileNotFoundError:
+        print(f"Battle engine script not found: {BATTLE_ENGINE_SCRIPT}")
+
+def main():
+    """Run the farming loop until interrupted."""
+    # Save current configuration to file
+    save_config_to_file()
+    print(f"Configuration saved to config_file.txt: {format_targets(TARGET_MISCRITS)}|{PLATINUM_TRAINING}")
+
+    # Check if required files exist
+    for spot_path in dict.fromkeys([REFERENCE_OBJECT_PATH] + FARM_SPOTS):
+        if not os.path.exists(spot_path):
+            print(f"Warning: Reference image not found at {spot_path}")
+            print("Please ensure the reference image exists before starting.")
+    if BATTLE_ENGINE_MODE == 'subprocess' and not os.path.exists(BATTLE_ENGINE_SCRIPT):
+        print(f"Warning: Battle engine script not found at {BATTLE_ENGINE_SCRIPT}")
+        print("Please ensure battle_engine.py exists in the same directory.")
+
+    print("Starting autofarm...")
+    print(f"Target miscrits: {', '.join(f'{name} (capture above {threshold}%)' for name, threshold in TARGET_MISCRITS.items())}")
+    print(f"Platinum training: {PLATINUM_TRAINING}")
+    print(f"Farm cooldown: {FARM_COOLDOWN} seconds")
+    print(f"Farm spots: {', '.join(FARM_SPOTS)}")
+    print(f"Battle check window: {BATTLE_CHECK_WINDOW} seconds")
+    print(f"Battle engine mode: {BATTLE_ENGINE_MODE}")
+    print(f"Farm controller: {FARM_CONTROLLER}")
+
+    METRICS.start_exporter()
+    if RECORD_SESSION:
+        start_recording(RECORD_REGIONS if RECORD_ROIS_ONLY else None)
+    if MULTI_WINDOW:
+        # Imported here because multi_window builds on this module's helpers
+        from multi_window import run_windows
+        try:
+            run_windows(sys.modules[__name__])
+        finally:
+            DEBUG_WRITER.close()
+            METRICS.close()
+            stop_recording()
+            ANALYTICS.close()
+            ENCOUNTERS.save()
+            ANALYTICS.report()
+        return
+    if FARM_CONTROLLER == 'state_machine':
+        # Imported here because farm_state_machine builds on this module's helpers
+        from farm_state_machine import FarmStateMachine
+        if BATTLE_ENGINE_MODE != 'in_process':
+            print(f"Warning: BATTLE_ENGINE_MODE '{BATTLE_ENGINE_MODE}' is ignored; the state machine runs battles in-process.")
+        machine = FarmStateMachine(sys.modules[__name__], BattleEngine(TARGET_MISCRITS, PLATINUM_TRAINING))
+        try:
+            asyncio.run(machine.run())
+        except KeyboardInterrupt:
+            print("\nFarming stopped by user.")
+        finally:
+            machine.close()
+            machine.report()
+            DEBUG_WRITER.close()
+            METRICS.close()
+            stop_recording()
+            ANALYTICS.close()
+            ENCOUNTERS.save()
+            ANALYTICS.report()
+        return
+
+    # Created once so templates, search windows and counters stay warm across battles
+    battle_engine = BattleEngine(TARGET_MISCRITS, PLATINUM_TRAINING) if BATTLE_ENGINE_MODE == 'in_process' else None
+    # The turn card is only re-OCR'd when its pixels change during the battle check window
+    farm_changes = FrameChangeDetector({'turn_card': (TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H)})
+    # Picks which farm spot to click next; FARM_COOLDOWN is each spot's fallback cooldown
+    farm_scheduler = FarmScheduler(FARM_SPOTS, FARM_COOLDOWN)
+
+    while True:
+        try:
+            # Take a screenshot
+            screenshot_bgr, screenshot = convert_screenshot_to_bgr()
+
+            spot = farm_scheduler.pick(screenshot_bgr)
+            if spot is not None:
+                print(f"Farming {spot.name} at {spot.location} (match {spot.match:.2f})...")
+                recorder = get_recorder()
+                if recorder is not None:
+                    recorder.record_frame(screenshot_bgr)
+                farm_scheduler.clicked(spot)
+                click_farming_object(*spot.location, spot.match, spot.name)
                 # After farming click, for the next BATTLE_CHECK_WINDOW seconds, check for battle
                 print(f"Checking for battle for the next {BATTLE_CHECK_WINDOW} seconds...")
-                battle_found = False
-                for _ in range(BATTLE_CHECK_WINDOW):
-                    _, screenshot = convert_screenshot_to_bgr()
-                    if detect_battle_from_turn_indicator(screenshot):
-                        print("Battle detected! Launching battle engine...")
-                        try:
-                            subprocess.run(['python', BATTLE_ENGINE_SCRIPT], check=True)
-                            print("Battle finished. Resuming farming.")
-                        except subprocess.CalledProcessError as e:
-                            print(f"Battle engine failed with error: {e}")
-                        except FileNotFoundError:
-                            print(f"Battle engine script not found: {BATTLE_ENGINE_SCRIPT}")
-                        battle_found = True
-                        break
-                    time.sleep(1)
-                if not battle_found:
+                farm_changes.mark_dirty()
+                battle_found = wait_until(battle_started(farm_changes), BATTLE_CHECK_WINDOW,
+                                          AdaptiveBackoff(initial=0.1, maximum=1.0), name='battle_check')
+                farm_changes.report('Battle check frames')
+                if battle_found:
+                    print("Battle detected! Launching battle engine...")
+                    run_battle(battle_engine, time.time())
+                    # A subprocess battle does not report back whether the enemy was a target
+                    farm_scheduler.record_outcome(True, battle_engine is not None and battle_engine.is_target)
+                else:
+                    farm_scheduler.record_outcome(False)
                     print("No battle detected. Checking for potion and gold drops...")
                     collect_any_visible_drops([POTION_DROP_PATH, GOLD_DROP_PATH])
             else:
-                print("Retrying in 5 seconds...")
-                time.sleep(5)
-        else:
-            wait_time = FARM_COOLDOWN - time_since_last_farm
-            print(f"Waiting {wait_time:.1f} seconds for cooldown...")
-            time.sleep(wait_time)
-    except KeyboardInterrupt:
-        print("\nFarming stopped by user.")
-        break
-    except Exception as e:
-        print(f"Error in farming loop: {e}")
-        print("Retrying in 5 seconds...")
-        time.sleep(5) 
\ No newline at end of file
+                wait_time = farm_scheduler.seconds_until_ready()
+                if not any(spot.location for spot in farm_scheduler.spots) and wait_time <= SPOT_POLL_INTERVAL:
+                    # Nothing on screen that should be: usually a dialog in the way
+                    print("No farm spot found. Checking for 'Okay'...")
+                    if find_and_click_template_on_screen(screenshot_bgr, OKAY_TEMPLATE_PATH):
+                        print("'Okay' detected with template matching and clicked.")
+                print(f"Waiting {wait_time:.1f} seconds for the next farm spot...")
+                time.sleep(wait_time)
+        except KeyboardInterrupt:
+            print("\nFarming stopped by user.")
+            farm_scheduler.report()
+            DEBUG_WRITER.close()
+            METRICS.close()
+            stop_recording()
+            ANALYTICS.close()
+            ENCOUNTERS.save()
+            ANALYTICS.report()
+            break
+        except Exception as e:
+            print(f"Error in farming loop: {e}")
+            DEBUG_WRITER.flush_ring('farming loop error')
+            print("Retrying in 5 seconds...")
+            time.sleep(5)
+
+if __name__ == '__main__':
+    main()
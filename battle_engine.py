@@ -1,11 +1,22 @@
-import cv2
-import numpy as np
-import pyautogui
-import pytesseract
 import time
 import re
-import os
-from utils import extract_text_from_screen_region, find_and_click_template_on_screen, find_template_on_screen, convert_screenshot_to_bgr, fuzzy_text_match
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from utils import extract_text_from_screen_region, extract_text_from_screen_regions, find_and_click_template_on_screen, find_template_on_screen, convert_screenshot_to_bgr, fuzzy_text_match, match_template, capture_frame, capture_regions
+from search_windows import SEARCH_WINDOWS
+from mouse_control import click_at
+from ocr_service import OCR, OcrRegion
+from digit_recognizer import DIGITS
+from change_detector import FrameChangeDetector, FULL_FRAME
+from debug_writer import DEBUG_WRITER
+from metrics import METRICS
+from analytics_store import ANALYTICS, OUTCOME_CAPTURED, OUTCOME_CAPTURE_FAILED, OUTCOME_FINISHED, OUTCOME_CONTINUE_MISSING
+from miscrit_roster import ROSTER, ENCOUNTERS, parse_targets, format_targets
+from session_recorder import get_recorder
+from move_policy import MOVE_POLICY, BattleState, create_policy, hp_fraction
+from frame_pipeline import LatestFrameBuffer, CaptureProducer, PIPELINE_WORKERS
+from waits import wait_until, report_wait_stats, around, template_visible, template_gone, text_visible, region_changed
 
 # Import PLATINUM_TRAINING from autofarm.py
 #try:
@@ -14,11 +25,47 @@ from utils import extract_text_from_screen_region, find_and_click_template_on_sc
 #    PLATINUM_TRAINING = False  # Default value if import fails
 # PLATINUM_TRAINING is now loaded from config file
 
+# =====================
+# BATTLE SCREEN COORDINATES
+# =====================
+CAPTURE_PERC_X, CAPTURE_PERC_Y, CAPTURE_PERC_W, CAPTURE_PERC_H = 556, 135, 40, 18
+ENEMY_NAME_X, ENEMY_NAME_Y, ENEMY_NAME_W, ENEMY_NAME_H = 774, 50, 100, 15
+# Enemy HP bar under its name, right of the heal icon and above the HP numbers, read by move policies that track the HP trend
+ENEMY_HP_X, ENEMY_HP_Y, ENEMY_HP_W, ENEMY_HP_H = 790, 69, 89, 4
+ATTACK_COORDS = [
+    (330, 1025),  # First attack
+    (500, 1025),  # Second attack
+    (670, 1025),  # Third attack
+    (840, 1025),  # Fourth attack
+]
+TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H = 522, 965, 180, 25
+TURN_CARD_REFERENCE_PATH = "reference_images/It's your turn!.png"
+CONTINUE_BUTTON_PATH = 'reference_images/Continue.png'
+CAPTURE_BUTTON_PATH = 'reference_images/Capture button.png'
+CAPTURE_PERC_WHITELIST = '0123456789%'
+# Capture is attempted on a target once the capture chance is above this, unless the target sets its own
+CAPTURE_CHANCE_THRESHOLD = 85
+OKAY2_AREA = (550, 742, 47, 16)
+# 'okay' popup shown after Continue when a miscrit is ready to train (OKAY2_AREA is the one shown otherwise)
+TRAINING_OKAY_AREA = (545, 622, 50, 20)
+# True overlaps capture with analysis: a producer thread captures while detectors run in parallel on the latest frame
+BATTLE_PIPELINE = False
+# After a click, how long the turn card may stay visible before the turn is played again
+ACTION_SETTLE_TIMEOUT = 2.0
+# Regions kept when a session is recorded in ROI mode (see session_recorder.py)
+RECORD_REGIONS = {
+    'turn_card': (TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H),
+    'capture': (CAPTURE_PERC_X, CAPTURE_PERC_Y, CAPTURE_PERC_W, CAPTURE_PERC_H),
+    'enemy_name': (ENEMY_NAME_X, ENEMY_NAME_Y, ENEMY_NAME_W, ENEMY_NAME_H),
+    'enemy_hp': (ENEMY_HP_X, ENEMY_HP_Y, ENEMY_HP_W, ENEMY_HP_H),
+}
+# =====================
+
 # =====================
 # Helper Functions
 # =====================
 def read_config_from_file():
-    """Read both target miscrit name and platinum training from config file (set by autofarm.py)."""
+    """Read the targets ('Name:threshold,...', or a single legacy name) and platinum training from config file (set by autofarm.py)."""
     try:
         with open('config_file.txt', 'r') as f:
             content = f.read().strip()
@@ -35,289 +82,633 @@ def read_config_from_file():
         print(f"Error reading config: {e}")
         return 'None', True  # Default fallback
 
-def read_target_miscrit_from_config():
-    """Read the target miscrit name from config file (set by autofarm.py)."""
-    target_name, _ = read_config_from_file()
-    return target_name
 
-def load_target_encounter_counter():
-    """Load the persistent encounter counter from file."""
-    try:
-        with open('target_encounters.txt', 'r') as f:
-            return int(f.read().strip())
-    except FileNotFoundError:
+def read_capture_percent_area(capture_area, learn=True):
+    """Read the capture chance from a capture box crop: glyph recognizer first, OCR when it is not confident. 0 if unreadable."""
+    capture_percent = DIGITS.read_number(capture_area)
+    if capture_percent is not None:
+        print(f"Capture chance read from glyphs: {capture_percent}%")
+        return capture_percent
+    capture_text = OCR.recognize(capture_area, 7, CAPTURE_PERC_WHITELIST)
+    print(f"Raw OCR result for capture chance: {capture_text}")
+    match = re.search(r'\d+', capture_text)
+    if not match:
         return 0
-
-def save_target_encounter_counter(counter):
-    """Save the encounter counter to file."""
-    with open('target_encounters.txt', 'w') as f:
-        f.write(str(counter))
-
-def check_and_update_target_miscrit(new_target_name):
-    """Check if the target miscrit name has changed and update the config file if so."""
-    try:
-        with open('config_file.txt', 'r') as f:
-            old_target = f.read().strip()
-        if old_target != new_target_name:
-            with open('config_file.txt', 'w') as f:
-                f.write(new_target_name)
-            return True
-        return False
-    except FileNotFoundError:
-        with open('config_file.txt', 'w') as f:
-            f.write(new_target_name)
-        return False
+    # Count frames Tesseract read cleanly towards the glyphs the recognizer may use
+    if learn and re.fullmatch(r'\d+%?', capture_text) and DIGITS.learn(capture_area, capture_text):
+        print(f"Capture percentage glyphs confirmed by '{capture_text}'")
+    return int(match.group())
 
 def execute_battle_move(move_index, attack_coords):
     """Execute a battle move by clicking the corresponding attack button."""
     if 0 <= move_index < len(attack_coords):
         x, y = attack_coords[move_index]
         print(f"Clicking move {move_index+1} at ({x}, {y})")
-        pyautogui.moveTo(x, y, duration=0.2)
-        pyautogui.click()
+        click_at(x, y, 0.2)
     else:
         print(f"Invalid move index: {move_index}")
 
-def end_battle_and_handle_training():
-    """End the battle by clicking Continue button and handle training sequence if needed."""
-    continue_button_path = 'reference_images/Continue.png'
-    time.sleep(1)
-    screenshot = pyautogui.screenshot()
-    screenshot_np = np.array(screenshot)
-    screenshot_bgr = cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR)
-    template = cv2.imread(continue_button_path, cv2.IMREAD_UNCHANGED)
-    if template is None:
-        print(f"Reference image not found at {continue_button_path}")
-        return
-    result = cv2.matchTemplate(screenshot_bgr, template[:, :, :3], cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-    if max_val >= 0.7:
-        # Before clicking, check for 'ready to train' using pytesseract
+
+# What the battle detectors currently see; fields that were not re-run keep their previous value
+BattleObservation = namedtuple('BattleObservation', ['screenshot_bgr', 'is_your_turn', 'is_continue', 'capture_percent', 'captured_at'])
+
+
+class BattleEngine:
+    """Battle automation that stays loaded between encounters so templates and counters remain warm."""
+
+    def __init__(self, targets=None, platinum_training_enabled=None, pipelined=BATTLE_PIPELINE, policy=MOVE_POLICY):
+        """targets is {name: capture threshold} or the config file's 'Name:threshold,Name' form (a single name also works).
+
+        policy is a move_policy.MovePolicy or the name of one ('first', 'learned').
+        """
+        config_targets, config_platinum = read_config_from_file()
+        if targets is None:
+            targets = config_targets
+        if isinstance(targets, str):
+            targets = parse_targets(targets, CAPTURE_CHANCE_THRESHOLD)
+        # Targets are indexed too, so they resolve even when missing from the roster file; keys use the roster's spelling
+        self.targets = {ROSTER.add(name): threshold for name, threshold in targets.items()}
+        self.platinum_training_enabled = config_platinum if platinum_training_enabled is None else platinum_training_enabled
+        self.pipelined = pipelined
+        self.policy = create_policy(policy, len(ATTACK_COORDS)) if isinstance(policy, str) else policy
+        # (move, BattleState before it) for the last policy move, observed once the next state is read
+        self._last_move = None
+        self.enemy_species = None
+        self.turn_card_reference_saved = True
+        self.battles_fought = 0
+        self.is_target = False
+        self.detected_at = None
+        self.first_action_pending = False
+        self._is_your_turn, self._is_continue, self._capture_percent = False, False, 0
+        # Seconds from battle detection to the first move/capture click, one entry per battle
+        self.startup_latencies = []
+        # Seconds from the turn card appearing to the move click, per battle loop mode
+        self.turn_latencies = {'serial': [], 'pipelined': []}
+        self._mode = 'serial'
+        # Estimated time.monotonic() the current turn card appeared; False once its click was timed
+        self._turn_visible_since = None
+        self._last_analysed_at = None
+        self._pipeline_pool = None
+        self._battle_started = None
+        self._battle_totals = {}
+        # What finish_battle() writes to the analytics store for the current battle
+        self._battle_record = None
+        self._last_battle_finished = None
+        self._enemy_read = (None, None)
+        # Detectors only run on regions whose pixels changed since they last ran
+        self.change_detector = FrameChangeDetector({
+            'turn_card': (TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H),
+            'capture': (CAPTURE_PERC_X, CAPTURE_PERC_Y, CAPTURE_PERC_W, CAPTURE_PERC_H),
+        })
+        # The turn card always appears at the same pixels, so it is only ever searched for there
+        SEARCH_WINDOWS.seed(TURN_CARD_REFERENCE_PATH, (TURN_CARD_X, TURN_CARD_Y), fixed=True)
+        print(f"Loaded configuration - Targets: {format_targets(self.targets)}, Platinum Training: {self.platinum_training_enabled}")
+
+    def detect_enemy(self):
+        """Read the enemy name once per battle, resolve it against the roster and count the encounter. Returns True for a target."""
+        screenshot = capture_frame((ENEMY_NAME_X, ENEMY_NAME_Y, ENEMY_NAME_W, ENEMY_NAME_H))
+        enemy_name, enemy_name_area = extract_text_from_screen_region(screenshot, ENEMY_NAME_X, ENEMY_NAME_Y, ENEMY_NAME_W, ENEMY_NAME_H)
+        species, confidence = ROSTER.resolve(enemy_name)
+        self.enemy_species = species
+        self._enemy_read = (enemy_name, confidence)
+        is_target = species in self.targets
+        print(f"Enemy miscrit name detected: {enemy_name} -> {species or 'unknown species'} (confidence {confidence:.2f})")
+        # Unresolved reads are the crops worth looking at when extending the roster
+        DEBUG_WRITER.submit('screenshots/enemy_name_area.png', enemy_name_area, mismatch=species is None)
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record_event('enemy', {'enemy_name': enemy_name, 'species': species, 'confidence': confidence, 'is_target': is_target})
+        if species is not None:
+            encounters = ENCOUNTERS.add(species)
+            print(f"{species} encounters: {encounters}{' (target)' if is_target else ''}")
+        return is_target
+
+    def _record_first_action(self, detected_at):
+        """Record the detection-to-first-click latency for this battle."""
+        if detected_at is None:
+            return
+        latency = time.time() - detected_at
+        self.startup_latencies.append(latency)
+        print(f"Battle startup latency (detection to first click): {latency * 1000:.0f} ms")
+
+    def report_startup_latency(self):
+        """Print the mean detection-to-first-click latency over all battles so far."""
+        if self.startup_latencies:
+            mean_latency = sum(self.startup_latencies) / len(self.startup_latencies)
+            print(f"Mean battle startup latency over {len(self.startup_latencies)} battles: {mean_latency * 1000:.0f} ms")
+
+    def read_capture_percent(self, screenshot):
+        """Read the capture chance with the glyph recognizer, falling back to OCR when it is not confident. Returns (percent, region)."""
+        capture_area = screenshot.crop((CAPTURE_PERC_X, CAPTURE_PERC_Y, CAPTURE_PERC_X + CAPTURE_PERC_W, CAPTURE_PERC_Y + CAPTURE_PERC_H))
+        return read_capture_percent_area(capture_area), capture_area
+
+    def start_battle(self, detected_at=None):
+        """Begin a battle: identify the enemy and reset the per-battle state. detected_at is the time.time() the battle was seen."""
+        self.battles_fought += 1
+        started = time.monotonic()
+        self.is_target = self.detect_enemy()
+        self.policy.start_battle(self.enemy_species, self.is_target, self.targets.get(self.enemy_species, CAPTURE_CHANCE_THRESHOLD))
+        self._last_move = None
+        self._battle_record = {
+            'started_at': time.time(),
+            # Farming time since the previous battle ended
+            'farm_seconds': started - self._last_battle_finished if self._last_battle_finished is not None else None,
+            'enemy_read_seconds': time.monotonic() - started,
+            'turns': 0,
+            'capture_attempts': 0,
+            # Turns played when the last capture was attempted; a later move means it failed
+            'turns_at_capture': None,
+            'training': False,
+            'continue_at': None,
+            'continue_found': True,
+        }
+        self.detected_at = detected_at
+        self.first_action_pending = True
+        self._is_your_turn, self._is_continue, self._capture_percent = False, False, 0
+        self._mode = 'serial'
+        self._turn_visible_since = None
+        self._last_analysed_at = None
+        self._battle_started = time.monotonic()
+        self._battle_totals = METRICS.totals()
+        self.change_detector.mark_dirty()
+
+    def _save_turn_card_reference(self, screenshot):
+        """Use OCR to find the turn card and save it as the template. Returns True once it is saved."""
+        turn_card_text, turn_card_area = extract_text_from_screen_region(screenshot, TURN_CARD_X, TURN_CARD_Y, TURN_CARD_W, TURN_CARD_H)
+        is_match, similarity = fuzzy_text_match(turn_card_text, 'your turn')
+        print(f"OCR result for turn card (battle): {turn_card_text}")
+        print(f"Similarity ratio with 'your turn': {similarity:.2f}")
+        if not is_match:
+            print("Not in battle or not your turn. Retrying...")
+            return False
+        turn_card_area.save(TURN_CARD_REFERENCE_PATH)
+        print(f"Saved turn card reference image to {TURN_CARD_REFERENCE_PATH}")
+        self.turn_card_reference_saved = True
+        return True
+
+    def observe(self):
+        """Capture a frame and re-run the detectors whose regions changed. Returns a BattleObservation, or None while nothing changed."""
+        captured_at = time.monotonic()
+        screenshot_bgr, screenshot = convert_screenshot_to_bgr()
+        # If we haven't saved the turn card reference yet, use OCR to detect and save it
+        if not self.turn_card_reference_saved and not self._save_turn_card_reference(screenshot):
+            return None
+        return self.analyse_frame(screenshot, captured_at)
+
+    def _detect_turn(self, screenshot_bgr):
+        turn_max_val, turn_max_loc, _ = match_template(screenshot_bgr, TURN_CARD_REFERENCE_PATH)
+        return turn_max_val > 0.7
+
+    def _detect_continue(self, screenshot_bgr):
+        cont_max_val, cont_max_loc, _ = match_template(screenshot_bgr, CONTINUE_BUTTON_PATH)
+        return cont_max_val > 0.7
+
+    def _detect_capture_percent(self, screenshot):
+        capture_percent, capture_area = self.read_capture_percent(screenshot)
+        DEBUG_WRITER.submit('screenshots/capture_percentage_area.png', capture_area, mismatch=capture_percent == 0)
+        print(f"Capture chance detected: {capture_percent}%")
+        return capture_percent
+
+    def analyse_frame(self, screenshot, captured_at, executor=None):
+        """Run the detectors whose regions changed on a Frame captured at time.monotonic() captured_at.
+
+        With an executor the detectors run in parallel (cv2 and Tesseract release the GIL).
+        Returns a BattleObservation, or None while nothing changed.
+        """
+        screenshot_bgr = screenshot.image
+        # Skip analysis entirely while the screen is unchanged (animations, waiting on the game)
+        dirty = self.change_detector.update(screenshot)
+        if not dirty:
+            self._last_analysed_at = captured_at
+            return None
+
+        # 1. Template matching for fast turn detection, 2. the Continue button, 3. the capture percentage
+        detectors = {}
+        if 'turn_card' in dirty:
+            detectors['turn_card'] = (self._detect_turn, screenshot_bgr)
+        if FULL_FRAME in dirty:
+            detectors[FULL_FRAME] = (self._detect_continue, screenshot_bgr)
+        if 'capture' in dirty:
+            detectors['capture'] = (self._detect_capture_percent, screenshot)
+        if executor is None:
+            results = {name: detector(arg) for name, (detector, arg) in detectors.items()}
+        else:
+            futures = {name: executor.submit(detector, arg) for name, (detector, arg) in detectors.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        self._is_your_turn = results.get('turn_card', self._is_your_turn)
+        self._is_continue = results.get(FULL_FRAME, self._is_continue)
+        self._capture_percent = results.get('capture', self._capture_percent)
+        recorder = get_recorder()
+        if recorder is not None:
+            seq = recorder.record_frame(screenshot)
+            recorder.record_event('detection', {'turn_card': self._is_your_turn, 'continue': self._is_continue,
+                                                'capture_percent': self._capture_percent}, seq)
+
+        # The card appeared somewhere between the previous analysed frame and this one
+        if not self._is_your_turn:
+            self._turn_visible_since = None
+        elif self._turn_visible_since is None:
+            previous = self._last_analysed_at if self._last_analysed_at is not None else captured_at
+            self._turn_visible_since = (previous + captured_at) / 2
+        self._last_analysed_at = captured_at
+
+        return BattleObservation(screenshot_bgr, self._is_your_turn, self._is_continue, self._capture_percent, captured_at)
+
+    def should_capture(self, observation):
+        """True when the enemy is a target and the capture chance is above that target's threshold."""
+        return self.is_target and observation.capture_percent > self.targets[self.enemy_species]
+
+    def _action_taken(self):
+        if self.first_action_pending:
+            self._record_first_action(self.detected_at)
+            self.first_action_pending = False
+
+    def try_capture(self, screenshot_bgr, wait=True):
+        """Click the capture button and, if wait, wait for the attempt to play out. Returns False if the button is not on screen."""
+        print("Target miscrit found and capture chance is high! Clicking capture button...")
+        cap_loc, cap_shape = find_template_on_screen(screenshot_bgr, CAPTURE_BUTTON_PATH)
+        if not cap_loc:
+            print("Capture button not found!")
+            DEBUG_WRITER.flush_ring('capture button not found')
+            return False
+        cap_x = cap_loc[0] + cap_shape[1] // 2
+        cap_y = cap_loc[1] + cap_shape[0] // 2
+        click_at(cap_x, cap_y, 0.2)
+        self._action_taken()
+        if self._battle_record is not None:
+            self._battle_record['capture_attempts'] += 1
+            self._battle_record['turns_at_capture'] = self._battle_record['turns']
+        if wait:
+            wait_until(template_gone(TURN_CARD_REFERENCE_PATH), ACTION_SETTLE_TIMEOUT, name='capture_attempt')
+        return True
+
+    def read_enemy_hp(self):
+        """Filled fraction of the enemy HP bar, or None when it cannot be read."""
+        frame = capture_frame((ENEMY_HP_X, ENEMY_HP_Y, ENEMY_HP_W, ENEMY_HP_H))
+        return hp_fraction(frame.image)
+
+    def battle_state(self):
+        """What the move policy sees now: the latest capture chance and, if the policy uses it, the enemy HP."""
+        hp = self.read_enemy_hp() if self.policy.needs_hp else None
+        turns = self._battle_record['turns'] if self._battle_record is not None else 0
+        return BattleState(self._capture_percent, hp, turns)
+
+    def choose_move(self):
+        """Let the policy learn from the previous move's effect, then pick this turn's move."""
+        state = self.battle_state()
+        if self._last_move is not None:
+            self.policy.observe(*self._last_move, state)
+        move_index = self.policy.choose(state)
+        self._last_move = (move_index, state)
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record_event('move', {'move': move_index, 'policy': self.policy.name,
+                                           'capture_percent': state.capture_percent, 'hp': state.hp})
+        return move_index
+
+    def play_turn(self, move_index=None, wait=True):
+        """Play move_index (by default the policy's choice) and, if wait, wait for the game to accept it."""
+        if move_index is None:
+            move_index = self.choose_move()
+        print(f"It's your turn! Playing move {move_index + 1} ({self.policy.name} policy)...")
+        execute_battle_move(move_index, ATTACK_COORDS)
+        self._action_taken()
+        if self._battle_record is not None:
+            self._battle_record['turns'] += 1
+        if self._turn_visible_since:
+            self.turn_latencies[self._mode].append(time.monotonic() - self._turn_visible_since)
+            self._turn_visible_since = False
+        # The turn card disappears once the move has been accepted
+        if wait:
+            wait_until(template_gone(TURN_CARD_REFERENCE_PATH), ACTION_SETTLE_TIMEOUT, name='move')
+
+    def report_turn_latency(self):
+        """Print turn-card-to-move-click latency for each battle loop mode that has been used."""
+        for mode, latencies in self.turn_latencies.items():
+            if latencies:
+                ordered = sorted(latencies)
+                p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                print(f"Turn-to-click latency ({mode}): {len(ordered)} turns, mean {sum(ordered) / len(ordered) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms")
+
+    def finish_battle(self):
+        """Record the battle's duration and outcome, save the encounter counts and print where the battle's time went."""
+        if self._battle_started is None:
+            return
+        finished = time.monotonic()
+        elapsed = finished - self._battle_started
+        self._battle_started = None
+        self._last_battle_finished = finished
+        target = 'true' if self.is_target else 'false'
+        METRICS.observe('battle_seconds', elapsed, target=target)
+        METRICS.count('battles_total', target=target)
+        self._record_encounter(elapsed, finished)
+        # Saved once per battle, so a crash loses at most the current battle's count
+        try:
+            ENCOUNTERS.save()
+        except OSError as e:
+            print(f"Could not save encounter counts to {ENCOUNTERS.path}: {e}")
+        # The last move's effect is not observed: the battle screen is gone by now
+        self._last_move = None
+        self.policy.finish_battle()
+        if METRICS.enabled:
+            totals = METRICS.totals()
+            # Waits include the captures and matches made while polling; pipelined capture overlaps analysis
+            spent = ', '.join(f"{stage} {totals.get(name, 0.0) - self._battle_totals.get(name, 0.0):.1f}s" for stage, name in
+                              (('capture', 'capture_seconds'), ('match', 'match_seconds'), ('ocr', 'ocr_seconds'),
+                               ('clicks', 'click_seconds'), ('waits', 'wait_seconds')))
+            print(f"Battle took {elapsed:.1f}s: {spent}")
+
+    def _record_encounter(self, elapsed, finished):
+        """Queue the finished battle's row for the analytics store."""
+        record, self._battle_record = self._battle_record, None
+        if record is None:
+            return
+        continue_at = record['continue_at']
+        fight_end = continue_at if continue_at is not None else finished
+        ocr_text, ocr_confidence = self._enemy_read
+        if not record['continue_found']:
+            outcome = OUTCOME_CONTINUE_MISSING
+        elif record['turns_at_capture'] is None:
+            outcome = OUTCOME_FINISHED
+        elif record['turns_at_capture'] == record['turns']:
+            # The battle ended on the capture attempt. A failed capture followed by a loss looks the same
+            outcome = OUTCOME_CAPTURED
+        else:
+            outcome = OUTCOME_CAPTURE_FAILED
+        ANALYTICS.record_encounter(
+            started_at=record['started_at'], finished_at=time.time(), species=self.enemy_species, ocr_text=ocr_text,
+            ocr_confidence=ocr_confidence, is_target=self.is_target, turns=record['turns'],
+            capture_attempts=record['capture_attempts'], capture_percent=self._capture_percent, outcome=outcome,
+            startup_seconds=self.startup_latencies[-1] if not self.first_action_pending and self.startup_latencies else None,
+            farm_seconds=record['farm_seconds'], enemy_read_seconds=record['enemy_read_seconds'],
+            fight_seconds=fight_end - (finished - elapsed),
+            post_battle_seconds=finished - fight_end, battle_seconds=elapsed, training=record['training'])
+
+    def report_battle(self):
+        """Print the per-battle matcher, OCR, wait, debug writer and change detector statistics."""
+        SEARCH_WINDOWS.report()
+        OCR.report()
+        report_wait_stats()
+        DEBUG_WRITER.report()
+        self.change_detector.report('Battle frames')
+        self.report_turn_latency()
+
+    def run_battle(self, detected_at=None):
+        """Fight one battle to completion. detected_at is the time.time() at which the farm loop saw the battle."""
+        if self.pipelined:
+            return self.run_battle_pipelined(detected_at)
+        self.start_battle(detected_at)
+
+        while True:
+            observation = self.observe()
+            if observation is None:
+                time.sleep(0.05)
+                continue
+
+            # 4. If enemy is target and capture chance is high, click capture
+            if self.should_capture(observation) and self.try_capture(observation.screenshot_bgr):
+                continue
+
+            if observation.is_your_turn:
+                self.play_turn()
+            elif observation.is_continue:
+                print("Continue button detected. Clicking to end battle...")
+                self.end_battle_and_handle_training()
+                self.report_battle()
+                break
+            else:
+                time.sleep(0.05)
+
+        self.end_battle_and_handle_training()
+        self.finish_battle()
+
+    def run_battle_pipelined(self, detected_at=None):
+        """run_battle with capture on a producer thread and the detectors of each frame run in parallel.
+
+        Frames go through a LatestFrameBuffer, so decisions are made on the newest capture rather
+        than one taken before the previous analysis started.
+        """
+        self.start_battle(detected_at)
+        self._mode = 'pipelined'
+        if self._pipeline_pool is None:
+            self._pipeline_pool = ThreadPoolExecutor(PIPELINE_WORKERS, thread_name_prefix='battle-detector')
+        frames = LatestFrameBuffer()
+        producer = CaptureProducer(frames)
+        producer.start()
+        # time.monotonic() of the last click; frames from before it are stale
+        acted_at = None
+        try:
+            while True:
+                item = frames.get(timeout=1.0)
+                if item is None:
+                    producer.check()
+                    continue
+                _, captured_at, screenshot = item
+                if acted_at is not None and captured_at <= acted_at:
+                    continue
+                if not self.turn_card_reference_saved and not self._save_turn_card_reference(screenshot):
+                    continue
+                observation = self.analyse_frame(screenshot, captured_at, self._pipeline_pool)
+                if observation is None:
+                    continue
+                if acted_at is not None:
+                    # Wait for the game to take the last action, as wait_until(template_gone) does in run_battle
+                    if observation.is_your_turn and time.monotonic() - acted_at < ACTION_SETTLE_TIMEOUT:
+                        continue
+                    acted_at = None
+
+                # 4. If enemy is target and capture chance is high, click capture
+                if self.should_capture(observation) and self.try_capture(observation.screenshot_bgr, wait=False):
+                    acted_at = time.monotonic()
+                    continue
+
+                if observation.is_your_turn:
+                    self.play_turn(wait=False)
+                    acted_at = time.monotonic()
+                elif observation.is_continue:
+                    print("Continue button detected. Clicking to end battle...")
+                    producer.stop()
+                    self.end_battle_and_handle_training()
+                    self.report_battle()
+                    frames.report('Battle pipeline')
+                    break
+        finally:
+            if producer.is_alive():
+                producer.stop()
+
+        self.end_battle_and_handle_training()
+        self.finish_battle()
+
+    def click_continue(self):
+        """Click the end-of-battle Continue button. Returns whether a miscrit is ready to train, or None if the button is not on screen."""
+        # run_battle calls this twice; only the first call ends the fight for the analytics record
+        record = self._battle_record if self._battle_record is not None and self._battle_record['continue_at'] is None else None
+        if record is not None:
+            record['continue_at'] = time.monotonic()
+        wait_until(template_visible(CONTINUE_BUTTON_PATH), 1, name='continue_visible')
+        screenshot_bgr, screenshot = convert_screenshot_to_bgr()
+        max_val, max_loc, template_shape = match_template(screenshot_bgr, CONTINUE_BUTTON_PATH)
+        if max_val is None:
+            print(f"Reference image not found at {CONTINUE_BUTTON_PATH}")
+            return None
+        if max_val < 0.7:
+            print("Continue button not found.")
+            # The second call usually finds no button; only a miss when ending the fight is worth the crops
+            if record is not None:
+                DEBUG_WRITER.flush_ring('continue button not found')
+                record['continue_found'] = False
+            return None
+        # Before clicking, check for 'ready to train'
         rtt_x, rtt_y, rtt_w, rtt_h = 472, 490, 78, 9
         ready_text, ready_area = extract_text_from_screen_region(screenshot, rtt_x, rtt_y, rtt_w, rtt_h)
-        ready_area.save('screenshots/ready_to_train_area.png')
         is_match, similarity = fuzzy_text_match(ready_text, 'ready to train')
+        DEBUG_WRITER.submit('screenshots/ready_to_train_area.png', ready_area)
         print(f"OCR result for ready to train area: {ready_text}")
         print(f"Similarity ratio with 'ready to train': {similarity:.2f}")
-        if is_match:
-            # 1. Click continue as usual, wait 2 seconds
-            template_h, template_w = template.shape[:2]
-            center_x = max_loc[0] + template_w // 2
-            center_y = max_loc[1] + template_h // 2
-            print(f"Continue button found at ({center_x}, {center_y}). Clicking once...")
-            pyautogui.moveTo(center_x, center_y, duration=0.2)
-            pyautogui.click()
-            time.sleep(2)
-            # 2. Check for 'okay' in okay area, click if found
-            okay_x, okay_y, okay_w, okay_h = 545, 622, 50, 20
-            okay_screenshot = pyautogui.screenshot()
-            okay_text, okay_area = extract_text_from_screen_region(okay_screenshot, okay_x, okay_y, okay_w, okay_h)
-            okay_area.save('screenshots/okay_area_after_train.png')
-            is_okay_match, okay_similarity = fuzzy_text_match(okay_text, 'okay')
-            print(f"OCR result for okay area after train: {okay_text}")
-            print(f"Similarity ratio with 'okay': {okay_similarity:.2f}")
-            if is_okay_match:
-                center_x = okay_x + okay_w // 2
-                center_y = okay_y + okay_h // 2
-                print(f"'Okay' detected after train. Clicking at ({center_x}, {center_y})")
-                pyautogui.moveTo(center_x, center_y, duration=0.3)
-                pyautogui.click()
-            # 3. Click train icon
-            pyautogui.moveTo(515, 60, duration=0.2)
-            pyautogui.click()
-            time.sleep(1)
-            # 4. Click second miscrit
-            pyautogui.moveTo(376, 414, duration=0.2)
-            pyautogui.click()
-            time.sleep(1)
-            # 5. Click train now
-            pyautogui.moveTo(600, 347, duration=0.2)
-            pyautogui.click()
-            time.sleep(5)
-            if platinum_training_enabled:
-                pyautogui.moveTo(530, 786, duration=0.2)
-                pyautogui.click()
-                time.sleep(3)
-                #Click continue
-                pyautogui.moveTo(579, 784, duration=0.2)
-                pyautogui.click()
-                time.sleep(1)
-            else:
-                # 6. Click continue
-                pyautogui.moveTo(681, 781, duration=0.2)
-                pyautogui.click()
-                time.sleep(1)
-            # 7.1. Check for and click continue button using OCR with hardcoded coordinates
-            continue_x, continue_y, continue_w, continue_h = 638, 660, 71, 20  # Adjust these coordinates as needed
-            continue_screenshot = pyautogui.screenshot()
-            continue_text, continue_area = extract_text_from_screen_region(continue_screenshot, continue_x, continue_y, continue_w, continue_h)
-            continue_area.save('screenshots/continue_button_area.png')
-            is_continue_match, continue_similarity = fuzzy_text_match(continue_text, 'continue')
-            print(f"OCR result for continue button area: {continue_text}")
-            print(f"Similarity ratio with 'continue': {continue_similarity:.2f}")
-            if is_continue_match:
-                center_x = continue_x + continue_w // 2
-                center_y = continue_y + continue_h // 2
-                print(f"'Continue' detected during training sequence. Clicking at ({center_x}, {center_y})")
-                pyautogui.moveTo(center_x, center_y, duration=0.2)
-                pyautogui.click()
-                time.sleep(1)
-            # 7.2. Check for 'okay' using template matching
-            screenshot_bgr2, _ = convert_screenshot_to_bgr()
-            if find_and_click_template_on_screen(screenshot_bgr2, 'reference_images/Okay.png'):
-                print("'Okay' detected with template matching and clicked.")
-                time.sleep(1)
-            # 8. Click click cross
-            pyautogui.moveTo(850, 325, duration=0.2)
-            pyautogui.click()
-            time.sleep(0.5)
-            # 9. Check for 'okay' in the specified region
-            okay2_x, okay2_y, okay2_w, okay2_h = 550, 742, 47, 16
-            okay2_screenshot = pyautogui.screenshot()
-            okay2_text, okay2_area = extract_text_from_screen_region(okay2_screenshot, okay2_x, okay2_y, okay2_w, okay2_h)
-            okay2_area.save('screenshots/okay2_area.png')
-            is_okay2_match, okay2_similarity = fuzzy_text_match(okay2_text, 'okay')
-            print(f"OCR result for okay2 area: {okay2_text}")
-            print(f"Similarity ratio with 'okay': {okay2_similarity:.2f}")
-            if is_okay2_match:
-                center_x = okay2_x + okay2_w // 2
-                center_y = okay2_y + okay2_h // 2
-                print(f"'Okay' detected in second area. Clicking at ({center_x}, {center_y})")
-                pyautogui.moveTo(center_x, center_y, duration=0.3)
-                pyautogui.click()
-            print("Training sequence complete. Returning to farming loop.")
-            return
-        # If not ready to train, just click continue as usual
-        template_h, template_w = template.shape[:2]
+        template_h, template_w = template_shape
         center_x = max_loc[0] + template_w // 2
         center_y = max_loc[1] + template_h // 2
         print(f"Continue button found at ({center_x}, {center_y}). Clicking once...")
-        pyautogui.moveTo(center_x, center_y, duration=0.2)
-        pyautogui.click()
-        time.sleep(3)
+        click_at(center_x, center_y, 0.2)
+        return is_match
 
-        #Check for okay button
-        okay2_x, okay2_y, okay2_w, okay2_h = 550, 742, 47, 16
-        okay2_screenshot = pyautogui.screenshot()
+    def _click_okay2_if_visible(self):
+        okay2_x, okay2_y, okay2_w, okay2_h = OKAY2_AREA
+        okay2_screenshot = capture_frame(OKAY2_AREA)
         okay2_text, okay2_area = extract_text_from_screen_region(okay2_screenshot, okay2_x, okay2_y, okay2_w, okay2_h)
-        okay2_area.save('screenshots/okay2_area.png')
         is_okay2_match, okay2_similarity = fuzzy_text_match(okay2_text, 'okay')
+        DEBUG_WRITER.submit('screenshots/okay2_area.png', okay2_area)
         print(f"OCR result for okay2 area: {okay2_text}")
         print(f"Similarity ratio with 'okay': {okay2_similarity:.2f}")
         if is_okay2_match:
             center_x = okay2_x + okay2_w // 2
             center_y = okay2_y + okay2_h // 2
             print(f"'Okay' detected in second area. Clicking at ({center_x}, {center_y})")
-            pyautogui.moveTo(center_x, center_y, duration=0.3)
-            pyautogui.click()
-    else:
-        print("Continue button not found.")
+            click_at(center_x, center_y, 0.3)
+        return is_okay2_match
 
+    def _read_post_continue_okays(self, report=True):
+        """Read both 'okay' popups that can follow Continue from one frame. Returns {'okay': bool, 'okay2': bool}."""
+        regions = [OcrRegion('okay', *TRAINING_OKAY_AREA), OcrRegion('okay2', *OKAY2_AREA)]
+        results = extract_text_from_screen_regions(capture_regions([TRAINING_OKAY_AREA, OKAY2_AREA]), regions)
+        matches = {}
+        for name, (text, area) in results.items():
+            is_match, similarity = fuzzy_text_match(text, 'okay')
+            if report:
+                DEBUG_WRITER.submit(f'screenshots/{name}_area_after_continue.png', area)
+                print(f"OCR result for {name} area after continue: {text} (similarity with 'okay': {similarity:.2f})")
+            matches[name] = is_match
+        return matches
 
+    def _wait_for_post_continue_okay(self, timeout, name):
+        return wait_until(lambda: any(self._read_post_continue_okays(report=False).values()), timeout, name=name)
 
-# =====================
-# MAIN BATTLE LOGIC
-# =====================
+    def dismiss_post_battle_okay(self):
+        """After Continue when nothing is ready to train, wait for and click the post-battle 'okay'."""
+        self._wait_for_post_continue_okay(3, 'okay2_after_continue')
+        matches = self._read_post_continue_okays()
+        if matches['okay2'] or not matches['okay']:
+            self._click_okay2_if_visible()
+            return
+        # 'ready to train' was misread: the training popup is up, so close it the way the training sequence does
+        okay_x, okay_y, okay_w, okay_h = TRAINING_OKAY_AREA
+        print("Training 'okay' shown instead of the post-battle one. Clicking it")
+        click_at(okay_x + okay_w // 2, okay_y + okay_h // 2, 0.3)
 
-# User-configurable coordinates (could be loaded from config if desired)
-capture_perc_x, capture_perc_y, capture_perc_w, capture_perc_h = 556, 135, 40, 18
-enemy_name_x, enemy_name_y, enemy_name_w, enemy_name_h = 774, 50, 100, 15
-attack_coords = [
-    (330, 1025),  # First attack
-    (500, 1025),  # Second attack
-    (670, 1025),  # Third attack
-    (840, 1025),  # Fourth attack
-]
-turn_card_x, turn_card_y, turn_card_w, turn_card_h = 522, 965, 180, 25
-target_miscrit_name, platinum_training_enabled = read_config_from_file()
-target_miscrit_encounters = load_target_encounter_counter()
-
-print(f"Loaded configuration - Target: {target_miscrit_name}, Platinum Training: {platinum_training_enabled}")
-print(f"Configuration loaded successfully from config_file.txt")
-
-# --- ENEMY NAME DETECTION (ONCE PER BATTLE) ---
-screenshot = pyautogui.screenshot()
-enemy_name, enemy_name_area = extract_text_from_screen_region(screenshot, enemy_name_x, enemy_name_y, enemy_name_w, enemy_name_h)
-enemy_name_area.save('screenshots/enemy_name_area.png')
-print(f"Enemy miscrit name detected: {enemy_name}")
-is_match, similarity = fuzzy_text_match(enemy_name, target_miscrit_name.lower())
-print(f"Similarity ratio with target: {similarity:.2f}")
-is_target_miscrit = is_match
-if is_target_miscrit:
-    target_miscrit_encounters += 1
-    save_target_encounter_counter(target_miscrit_encounters)
-    print(f"Target miscrit encounters: {target_miscrit_encounters}")
-
-# --- MAIN BATTLE LOOP ---
-turn_card_reference_path = "reference_images/It's your turn!.png"
-turn_card_reference_saved = True
-
-while True:
-    screenshot_bgr, screenshot = convert_screenshot_to_bgr()
-
-    # If we haven't saved the turn card reference yet, use OCR to detect and save it
-    if not turn_card_reference_saved:
-        turn_card_text, turn_card_area = extract_text_from_screen_region(screenshot, turn_card_x, turn_card_y, turn_card_w, turn_card_h)
-        is_match, similarity = fuzzy_text_match(turn_card_text, 'your turn')
-        print(f"OCR result for turn card (battle): {turn_card_text}")
-        print(f"Similarity ratio with 'your turn': {similarity:.2f}")
-        if is_match:
-            turn_card_area.save(turn_card_reference_path)
-            print(f"Saved turn card reference image to {turn_card_reference_path}")
-            turn_card_reference_saved = True
+    def run_training_sequence(self):
+        """After Continue when a miscrit is ready to train, train it and close the training window."""
+        if self._battle_record is not None:
+            self._battle_record['training'] = True
+        # 1. Wait up to 2 seconds for either 'okay' popup
+        okay_x, okay_y, okay_w, okay_h = TRAINING_OKAY_AREA
+        self._wait_for_post_continue_okay(2, 'okay_after_continue')
+        # 2. Check both okay areas in one frame, click the training one if found
+        matches = self._read_post_continue_okays()
+        if matches['okay2'] and not matches['okay']:
+            # 'ready to train' was misread: this is the post-battle popup, and the blind training clicks would miss
+            print("Post-battle 'okay' shown instead of the training one. Skipping training")
+            if self._battle_record is not None:
+                self._battle_record['training'] = False
+            self._click_okay2_if_visible()
+            return
+        if matches['okay']:
+            center_x = okay_x + okay_w // 2
+            center_y = okay_y + okay_h // 2
+            print(f"'Okay' detected after train. Clicking at ({center_x}, {center_y})")
+            click_at(center_x, center_y, 0.3)
+        # Each blind click waits until the area of the next click target changes
+        # 3. Click train icon
+        next_target_changed = region_changed(around(376, 414))
+        click_at(515, 60, 0.2)
+        wait_until(next_target_changed, 1, name='train_window')
+        # 4. Click second miscrit
+        next_target_changed = region_changed(around(600, 347))
+        click_at(376, 414, 0.2)
+        wait_until(next_target_changed, 1, name='miscrit_selected')
+        # 5. Click train now
+        next_target_changed = region_changed(around(530, 786) if self.platinum_training_enabled else around(681, 781))
+        click_at(600, 347, 0.2)
+        wait_until(next_target_changed, 5, name='training_result')
+        continue_x, continue_y, continue_w, continue_h = 638, 660, 71, 20  # Adjust these coordinates as needed
+        if self.platinum_training_enabled:
+            next_target_changed = region_changed(around(579, 784))
+            click_at(530, 786, 0.2)
+            wait_until(next_target_changed, 3, name='platinum_training')
+            #Click continue
+            click_at(579, 784, 0.2)
+            wait_until(text_visible((continue_x, continue_y, continue_w, continue_h), 'continue'), 1, name='training_continue')
         else:
-            print("Not in battle or not your turn. Retrying in 0.2s...")
-            time.sleep(0.2)
-            continue
-
-    # 1. Use template matching for fast turn detection
-    turn_template = cv2.imread(turn_card_reference_path, cv2.IMREAD_UNCHANGED)
-    result = cv2.matchTemplate(screenshot_bgr, turn_template[:, :, :3], cv2.TM_CCOEFF_NORMED)
-    _, turn_max_val, _, turn_max_loc = cv2.minMaxLoc(result)
-    is_your_turn = turn_max_val > 0.7
-
-    # 2. Check for Continue button
-    continue_button_path = 'reference_images/Continue.png'
-    continue_template = cv2.imread(continue_button_path, cv2.IMREAD_UNCHANGED)
-    result = cv2.matchTemplate(screenshot_bgr, continue_template[:, :, :3], cv2.TM_CCOEFF_NORMED)
-    _, cont_max_val, _, cont_max_loc = cv2.minMaxLoc(result)
-    is_continue = cont_max_val > 0.7
-
-    # 3. OCR capture percentage using pytesseract on the predetermined area
-    capture_text, capture_area = extract_text_from_screen_region(screenshot, capture_perc_x, capture_perc_y, capture_perc_w, capture_perc_h)
-    capture_area.save('screenshots/capture_percentage_area.png')
-    print(f"Raw OCR result for capture chance: {capture_text}")
-    match = re.search(r'\d+', capture_text)
-    if match:
-        capture_percent = int(match.group())
-    else:
-        capture_percent = 0
-    print(f"Capture chance detected: {capture_percent}%")
+            # 6. Click continue
+            click_at(681, 781, 0.2)
+            wait_until(text_visible((continue_x, continue_y, continue_w, continue_h), 'continue'), 1, name='training_continue')
+        # 7.1. Check for and click continue button using OCR with hardcoded coordinates
+        continue_screenshot = capture_frame((continue_x, continue_y, continue_w, continue_h))
+        continue_text, continue_area = extract_text_from_screen_region(continue_screenshot, continue_x, continue_y, continue_w, continue_h)
+        is_continue_match, continue_similarity = fuzzy_text_match(continue_text, 'continue')
+        DEBUG_WRITER.submit('screenshots/continue_button_area.png', continue_area, mismatch=not is_continue_match)
+        print(f"OCR result for continue button area: {continue_text}")
+        print(f"Similarity ratio with 'continue': {continue_similarity:.2f}")
+        if is_continue_match:
+            center_x = continue_x + continue_w // 2
+            center_y = continue_y + continue_h // 2
+            print(f"'Continue' detected during training sequence. Clicking at ({center_x}, {center_y})")
+            click_at(center_x, center_y, 0.2)
+            wait_until(template_visible('reference_images/Okay.png'), 1, name='okay_after_training')
+        # 7.2. Check for 'okay' using template matching
+        screenshot_bgr2, _ = convert_screenshot_to_bgr()
+        cross_changed = region_changed(around(850, 325))
+        if find_and_click_template_on_screen(screenshot_bgr2, 'reference_images/Okay.png'):
+            print("'Okay' detected with template matching and clicked.")
+            wait_until(cross_changed, 1, name='okay_dismissed')
+        # 8. Click click cross
+        click_at(850, 325, 0.2)
+        wait_until(text_visible(OKAY2_AREA, 'okay'), 0.5, name='okay2_after_cross')
+        # 9. Check for 'okay' in the specified region
+        self._click_okay2_if_visible()
+        print("Training sequence complete. Returning to farming loop.")
 
-    # 4. If enemy is target and capture chance > 85, click capture
-    if is_target_miscrit and capture_percent > 85:
-        print("Target miscrit found and capture chance is high! Clicking capture button...")
-        cap_loc, cap_shape = find_template_on_screen(screenshot_bgr, 'reference_images/Capture button.png')
-        if cap_loc:
-            cap_x = cap_loc[0] + cap_shape[1] // 2
-            cap_y = cap_loc[1] + cap_shape[0] // 2
-            pyautogui.moveTo(cap_x, cap_y, duration=0.2)
-            pyautogui.click()
-            time.sleep(2)
-            continue
+    def end_battle_and_handle_training(self):
+        """End the battle by clicking Continue button and handle training sequence if needed."""
+        ready_to_train = self.click_continue()
+        if ready_to_train is None:
+            return
+        if ready_to_train:
+            self.run_training_sequence()
         else:
-            print("Capture button not found!")
+            self.dismiss_post_battle_okay()
 
-    if is_your_turn:
-        print("It's your turn! Clicking first move (hardcoded)...")
-        execute_battle_move(0, attack_coords)
-        time.sleep(2)
-    elif is_continue:
-        print("Continue button detected. Clicking to end battle...")
-        end_battle_and_handle_training()
-        break
-    else:
-        time.sleep(0.05)
-        continue
 
-end_battle_and_handle_training() 
\ No newline at end of file
+# =====================
+# STANDALONE ENTRY POINT
+# =====================
+if __name__ == '__main__':
+    # autofarm.py passes --detected-at <epoch seconds> when launching battles as a subprocess
+    detected_at = None
+    if '--detected-at' in sys.argv:
+        detected_at = float(sys.argv[sys.argv.index('--detected-at') + 1])
+    engine = BattleEngine()
+    print(f"Configuration loaded successfully from config_file.txt")
+    engine.run_battle(detected_at)
+    METRICS.close()
+    ANALYTICS.close()
+    ENCOUNTERS.save()
@@ -0,0 +1,325 @@
+"""Offline latency and accuracy benchmarks over labelled frames, headless.
+
+Runs capture, template matching, OCR and fuzzy matching plus the turn card, Continue, capture %
+(with and without the OCR fallback), enemy name, enemy HP and drop detectors, and reports
+p50/p95/p99 latency, throughput and precision/recall as JSON. --compare flags regressions against
+an earlier run. Frames are listed in benchmark_corpus/labels.json: `offset` places a crop at its
+screen position and `crop: true` marks an image that is exactly a detector's region.
+
+    python benchmark.py [labels.json | recording.msr ...] [--repeat N] [--output results.json] [--compare previous.json]
+"""
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+from PIL import Image
+from utils import convert_screenshot_to_bgr, match_template, extract_text_from_screen_region, fuzzy_text_match
+from screen_capture import Frame, ReplayCapture, set_capture_backend
+from session_recorder import SessionReader, RECORDING_SUFFIX, FULL_STREAM
+from ocr_service import OCR, tesserocr
+from miscrit_roster import ROSTER
+from digit_recognizer import DIGITS
+from move_policy import hp_fraction
+import battle_engine
+import autofarm
+
+# Labelled frames used when no corpus is given on the command line
+BENCHMARK_CORPUS = 'benchmark_corpus/labels.json'
+BENCHMARK_REPEAT = 5
+# An HP reading within this fraction of the label counts as correct
+HP_LABEL_TOLERANCE = 0.05
+# --compare flags a stage/detector whose p95 grew by more than this fraction, or whose precision/recall dropped by more than this
+LATENCY_REGRESSION_TOLERANCE = 0.2
+ACCURACY_REGRESSION_TOLERANCE = 0.01
+
+# A corpus frame: the file as a Frame at its screen offset; crop=True means the file is exactly a detector's region
+Sample = namedtuple('Sample', ['path', 'frame', 'crop', 'labels'])
+
+CAPTURE_REGION = (battle_engine.CAPTURE_PERC_X, battle_engine.CAPTURE_PERC_Y, battle_engine.CAPTURE_PERC_W, battle_engine.CAPTURE_PERC_H)
+ENEMY_NAME_REGION = (battle_engine.ENEMY_NAME_X, battle_engine.ENEMY_NAME_Y, battle_engine.ENEMY_NAME_W, battle_engine.ENEMY_NAME_H)
+ENEMY_HP_REGION = (battle_engine.ENEMY_HP_X, battle_engine.ENEMY_HP_Y, battle_engine.ENEMY_HP_W, battle_engine.ENEMY_HP_H)
+TURN_CARD_REGION = (battle_engine.TURN_CARD_X, battle_engine.TURN_CARD_Y, battle_engine.TURN_CARD_W, battle_engine.TURN_CARD_H)
+DROP_PATHS = [autofarm.POTION_DROP_PATH, autofarm.GOLD_DROP_PATH]
+
+
+def load_recording(recording_path):
+    """Load the full frames of a session recording, labelled with the detector outputs the bot recorded for them.
+
+    Precision and recall over a recording therefore measure agreement with the live run,
+    which is what a threshold or matcher change needs to be checked against.
+    """
+    reader = SessionReader(recording_path)
+    samples = []
+    for tick in reader.ticks:
+        frame = reader.frame_at(FULL_STREAM, tick, exact=True)
+        labels = {}
+        for event in reader.events_at(tick):
+            labels.update({name: value for name, value in event.items() if name in DETECTORS})
+        if frame is not None and labels:
+            # Keyframes are views into the memory map; deltas are decoded once, in order
+            samples.append(Sample(f'{recording_path}#{tick}', frame, False, labels))
+    return samples
+
+
+def load_corpus(labels_path):
+    """Load the frames listed in a labels.json (paths are relative to the file), or a session recording."""
+    if labels_path.endswith(RECORDING_SUFFIX):
+        return load_recording(labels_path)
+    with open(labels_path, 'r') as f:
+        entries = json.load(f)['frames']
+    base = os.path.dirname(labels_path)
+    samples = []
+    for entry in entries:
+        path = os.path.normpath(os.path.join(base, entry['path']))
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"Skipping unreadable corpus frame: {path}")
+            continue
+        left, top = entry.get('offset', (0, 0))
+        samples.append(Sample(path, Frame(image, left, top), entry.get('crop', False), entry['labels']))
+    return samples
+
+
+def _region(sample, region):
+    """The RGB PIL image a region detector reads from this sample."""
+    if sample.crop:
+        return Image.fromarray(np.ascontiguousarray(sample.frame.image[:, :, ::-1]))
+    x, y, w, h = region
+    return sample.frame.crop((x, y, x + w, y + h))
+
+
+# =====================
+# Detectors: sample -> prediction, scored against sample.labels[name]
+# =====================
+def detect_turn_card(sample):
+    max_val, _, _ = match_template(sample.frame.image, battle_engine.TURN_CARD_REFERENCE_PATH)
+    return max_val is not None and max_val > 0.7
+
+
+def detect_continue(sample):
+    max_val, _, _ = match_template(sample.frame.image, battle_engine.CONTINUE_BUTTON_PATH)
+    return max_val is not None and max_val > 0.7
+
+
+def detect_capture_percent(sample):
+    # Learning is off so benchmarks never change the glyph set they measure
+    return battle_engine.read_capture_percent_area(_region(sample, CAPTURE_REGION), learn=False) or None
+
+
+def detect_capture_percent_glyphs(sample):
+    # The glyph fast path alone, without the OCR fallback
+    return DIGITS.read_number(_region(sample, CAPTURE_REGION))
+
+
+def detect_enemy_name(sample):
+    # Scored as the battle engine sees it: the OCR read resolved against the roster
+    text = OCR.recognize(_region(sample, ENEMY_NAME_REGION)).strip()
+    species, _ = ROSTER.resolve(text)
+    return species or text or None
+
+
+def detect_enemy_hp(sample):
+    x, y, w, h = ENEMY_HP_REGION
+    return hp_fraction(sample.frame.region(x, y, w, h))
+
+
+def detect_drops(sample):
+    return sorted(os.path.splitext(os.path.basename(path))[0] for path in DROP_PATHS
+                  if autofarm.find_visible_drops(sample.frame.image, [path]))
+
+
+# name -> (detector, scoring kind[, label scored against, when not the name])
+DETECTORS = {
+    'turn_card': (detect_turn_card, 'bool'),
+    'continue': (detect_continue, 'bool'),
+    'capture_percent': (detect_capture_percent, 'value'),
+    'capture_percent_glyphs': (detect_capture_percent_glyphs, 'value', 'capture_percent'),
+    'enemy_name': (detect_enemy_name, 'name'),
+    'enemy_hp': (detect_enemy_hp, 'fraction'),
+    'drops': (detect_drops, 'set'),
+}
+
+
+def score(kind, prediction, label):
+    """Return (true positives, false positives, false negatives) for one prediction."""
+    if kind == 'bool':
+        return int(prediction and label), int(prediction and not label), int(label and not prediction)
+    if kind == 'set':
+        predicted, expected = set(prediction or ()), set(label)
+        return len(predicted & expected), len(predicted - expected), len(expected - predicted)
+    if prediction is None:
+        return 0, 0, int(label is not None)
+    if kind == 'name':
+        correct = label is not None and fuzzy_text_match(prediction.lower(), label.lower())[0]
+    elif kind == 'fraction':
+        correct = label is not None and abs(prediction - label) <= HP_LABEL_TOLERANCE
+    else:
+        correct = prediction == label
+    # A wrong reading is both a false positive and a missed true value
+    return int(correct), int(not correct), int(label is not None and not correct)
+
+
+# =====================
+# Measurement
+# =====================
+def _percentile(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if latencies else None
+
+
+def time_calls(func, inputs, repeat=BENCHMARK_REPEAT):
+    """Call func on every input repeat times with a cold OCR cache. Returns (latency summary, last output per input)."""
+    latencies, outputs, errors = [], [], 0
+    # The detectors print as they work; keep the report readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for item in inputs:
+            output = None
+            for _ in range(repeat):
+                OCR.cache.invalidate()
+                started = time.perf_counter()
+                try:
+                    output = func(item)
+                except Exception as e:
+                    errors += 1
+                    output = e
+                    continue
+                latencies.append(time.perf_counter() - started)
+            outputs.append(output)
+    total = sum(latencies)
+    summary = {
+        'calls': len(latencies),
+        'errors': errors,
+        'mean_ms': total / len(latencies) * 1000 if latencies else None,
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'p99_ms': _percentile(latencies, 99),
+        'throughput_per_s': len(latencies) / total if total else None,
+    }
+    return summary, outputs
+
+
+def benchmark_stages(samples, repeat=BENCHMARK_REPEAT):
+    """Latency of the building blocks (capture, template match, OCR, fuzzy match) on the full-size frames."""
+    full_frames = [sample.frame for sample in samples if not sample.crop and sample.frame.left == 0 and sample.frame.top == 0]
+    results = {}
+    if full_frames:
+        set_capture_backend(ReplayCapture([frame.image for frame in full_frames]))
+        results['convert_screenshot_to_bgr'], _ = time_calls(lambda _: convert_screenshot_to_bgr(), full_frames, repeat)
+        templates = [battle_engine.TURN_CARD_REFERENCE_PATH, battle_engine.CONTINUE_BUTTON_PATH, battle_engine.CAPTURE_BUTTON_PATH]
+        results['match_template'], _ = time_calls(lambda case: match_template(case[0].image, case[1]),
+                                                  [(frame, path) for frame in full_frames for path in templates], repeat)
+        regions = [TURN_CARD_REGION, ENEMY_NAME_REGION, CAPTURE_REGION]
+        results['extract_text_from_screen_region'], _ = time_calls(lambda case: extract_text_from_screen_region(case[0], *case[1]),
+                                                                   [(frame, region) for frame in full_frames for region in regions], repeat)
+    pairs = [("It's your turn!", 'your turn'), ('Hawkai', 'light nanaslug'), ('Light Nanasiug', 'light nanaslug'), ('', 'okay')]
+    results['fuzzy_text_match'], _ = time_calls(lambda pair: fuzzy_text_match(*pair), pairs, repeat * 100)
+    return results
+
+
+def benchmark_detectors(samples, repeat=BENCHMARK_REPEAT):
+    """Latency plus precision/recall of each detector over the samples labelled for it."""
+    results = {}
+    for name, (detector, kind, *label) in DETECTORS.items():
+        label = label[0] if label else name
+        labelled = [sample for sample in samples if label in sample.labels]
+        if not labelled:
+            continue
+        summary, outputs = time_calls(detector, labelled, repeat)
+        tp = fp = fn = 0
+        for sample, prediction in zip(labelled, outputs):
+            if isinstance(prediction, Exception):
+                prediction = None
+            sample_tp, sample_fp, sample_fn = score(kind, prediction, sample.labels[label])
+            tp, fp, fn = tp + sample_tp, fp + sample_fp, fn + sample_fn
+        summary.update({
+            'frames': len(labelled),
+            'tp': tp, 'fp': fp, 'fn': fn,
+            'precision': tp / (tp + fp) if tp + fp else None,
+            'recall': tp / (tp + fn) if tp + fn else None,
+        })
+        results[name] = summary
+    return results
+
+
+def run_benchmarks(corpus_paths=(BENCHMARK_CORPUS,), repeat=BENCHMARK_REPEAT):
+    """Run every stage and detector benchmark over the given corpora. Returns a JSON-serialisable dict."""
+    samples = [sample for path in corpus_paths for sample in load_corpus(path)]
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'opencv': cv2.__version__,
+            'ocr_backend': 'tesserocr' if tesserocr is not None else 'pytesseract',
+        },
+        'corpus': list(corpus_paths),
+        'frames': len(samples),
+        'repeat': repeat,
+        'stages': benchmark_stages(samples, repeat),
+        'detectors': benchmark_detectors(samples, repeat),
+    }
+
+
+def _fmt(value, spec='.1f'):
+    return '-' if value is None else format(value, spec)
+
+
+def print_results(results):
+    print(f"{results['frames']} frames, {results['repeat']} repeats, OCR backend {results['environment']['ocr_backend']}")
+    print(f"\n{'stage':<32} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'per s':>9} {'err':>4}")
+    for name, stats in results['stages'].items():
+        print(f"{name:<32} {stats['calls']:>6} {_fmt(stats['p50_ms']):>8} {_fmt(stats['p95_ms']):>8} {_fmt(stats['p99_ms']):>8} "
+              f"{_fmt(stats['throughput_per_s'], '.0f'):>9} {stats['errors']:>4}")
+    print(f"\n{'detector':<24} {'frames':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'per s':>9} {'prec':>5} {'recall':>6} {'err':>4}")
+    for name, stats in results['detectors'].items():
+        print(f"{name:<24} {stats['frames']:>6} {_fmt(stats['p50_ms']):>8} {_fmt(stats['p95_ms']):>8} {_fmt(stats['p99_ms']):>8} "
+              f"{_fmt(stats['throughput_per_s'], '.0f'):>9} {_fmt(stats['precision'], '.2f'):>5} {_fmt(stats['recall'], '.2f'):>6} {stats['errors']:>4}")
+
+
+def compare_results(previous, current):
+    """Print p95 and accuracy changes against a previous result file. Returns the list of regressions."""
+    regressions = []
+    for section in ('stages', 'detectors'):
+        for name, stats in current[section].items():
+            before = previous.get(section, {}).get(name)
+            if before is None:
+                continue
+            if before.get('p95_ms') and stats.get('p95_ms') is not None:
+                change = stats['p95_ms'] / before['p95_ms'] - 1
+                print(f"{name:<32} p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms ({change:+.0%})")
+                if change > LATENCY_REGRESSION_TOLERANCE:
+                    regressions.append(f"{name} p95 latency {change:+.0%}")
+            for metric in ('precision', 'recall'):
+                if before.get(metric) is not None and stats.get(metric) is not None:
+                    if stats[metric] < before[metric] - ACCURACY_REGRESSION_TOLERANCE:
+                        regressions.append(f"{name} {metric} {before[metric]:.2f} -> {stats[metric]:.2f}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return regressions
+
+
+if __name__ == '__main__':
+    # python benchmark.py [labels.json or recording.msr ...] [--repeat N] [--output results.json] [--compare previous.json]
+    args = sys.argv[1:]
+    options = {}
+    for flag in ('--repeat', '--output', '--compare'):
+        if flag in args:
+            index = args.index(flag)
+            options[flag] = args[index + 1]
+            del args[index:index + 2]
+    results = run_benchmarks(args or [BENCHMARK_CORPUS], int(options.get('--repeat', BENCHMARK_REPEAT)))
+    print_results(results)
+    output_path = options.get('--output', 'benchmark_results.json')
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+    if '--compare' in options:
+        with open(options['--compare'], 'r') as f:
+            previous = json.load(f)
+        print(f"\nCompared with {options['--compare']} ({previous.get('created', 'unknown date')}):")
+        if compare_results(previous, results):
+            sys.exit(1)
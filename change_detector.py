@@ -0,0 +1,80 @@
+import time
+import numpy as np
+
+# Name reported when anything on the coarse full-frame grid changed
+FULL_FRAME = 'frame'
+# Pixel step used when sampling tracked regions and the full frame
+REGION_SAMPLE_STRIDE = 2
+FRAME_SAMPLE_STRIDE = 16
+# Mean absolute per-channel difference above which a region counts as changed
+CHANGE_TOLERANCE = 2.0
+# Every region is re-reported at least this often, so a missed click on a static screen is retried
+MAX_SKIP_SECONDS = 2.0
+
+
+class FrameChangeDetector:
+    """Compares each frame to the last analysed one and reports which tracked regions changed."""
+
+    def __init__(self, regions, region_stride=REGION_SAMPLE_STRIDE, frame_stride=FRAME_SAMPLE_STRIDE, tolerance=CHANGE_TOLERANCE,
+                 max_skip_seconds=MAX_SKIP_SECONDS):
+        self.regions = dict(regions)
+        self.region_stride = region_stride
+        self.frame_stride = frame_stride
+        self.tolerance = tolerance
+        self.max_skip_seconds = max_skip_seconds
+        self._baselines = {}
+        self._last_processed = 0.0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.dirty_counts = {name: 0 for name in list(self.regions) + [FULL_FRAME]}
+
+    def _sample(self, image, left, top, name):
+        """Return a strided, channel-summed sample of a tracked region (or the whole frame)."""
+        if name == FULL_FRAME:
+            sample = image[::self.frame_stride, ::self.frame_stride]
+        else:
+            x, y, w, h = self.regions[name]
+            x, y = x - left, y - top
+            sample = image[y:y + h:self.region_stride, x:x + w:self.region_stride]
+        # Summing the channels is enough to notice changes and avoids a colour conversion
+        return sample.sum(axis=2, dtype=np.int16) if sample.ndim == 3 else sample.astype(np.int16)
+
+    def update(self, frame):
+        """Compare a new BGR array or screen_capture.Frame with the baselines and return the set of dirty region names."""
+        image = getattr(frame, 'image', frame)
+        left, top = getattr(frame, 'left', 0), getattr(frame, 'top', 0)
+        now = time.monotonic()
+        if now - self._last_processed > self.max_skip_seconds:
+            self._baselines.clear()
+        dirty = set()
+        for name in list(self.regions) + [FULL_FRAME]:
+            sample = self._sample(image, left, top, name)
+            baseline = self._baselines.get(name)
+            if baseline is None or baseline.shape != sample.shape or np.abs(sample - baseline).mean() > self.tolerance * 3:  # three channels summed
+                # Baselines only move when a region is reported dirty, so slow drift still accumulates
+                self._baselines[name] = sample
+                self.dirty_counts[name] += 1
+                dirty.add(name)
+        if dirty:
+            self._last_processed = now
+            self.frames_processed += 1
+        else:
+            self.frames_skipped += 1
+        return dirty
+
+    def mark_dirty(self, name=None):
+        """Force a region (or every region) to be reported dirty on the next update."""
+        if name is None:
+            self._baselines.clear()
+        else:
+            self._baselines.pop(name, None)
+
+    def stats(self):
+        """Return skipped/processed frame counters and per-region dirty counts."""
+        return {'frames_processed': self.frames_processed, 'frames_skipped': self.frames_skipped, 'dirty_counts': dict(self.dirty_counts)}
+
+    def report(self, label='Change detector'):
+        """Print how many frames were skipped because nothing tracked had changed."""
+        total = self.frames_processed + self.frames_skipped
+        skipped_share = self.frames_skipped / total if total else 0.0
+        print(f"{label}: {self.frames_skipped} of {total} frames skipped ({skipped_share:.0%}), dirty counts {self.dirty_counts}")
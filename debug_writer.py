@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+# 'always' writes every crop, 'every_n' every DEBUG_WRITE_EVERY_N-th crop per path,
+# 'on_mismatch' only crops flagged as OCR mismatches, 'off' writes nothing
+DEBUG_WRITE_MODE = 'every_n'
+DEBUG_WRITE_EVERY_N = 20
+# Pending writes beyond this are dropped rather than blocking the caller
+DEBUG_QUEUE_SIZE = 32
+# Last K crops kept in memory and written to DEBUG_RING_DIR when something goes wrong (0 disables)
+DEBUG_RING_SIZE = 50
+DEBUG_RING_DIR = 'screenshots/ring'
+
+
+class DebugArtifactWriter:
+    """Writes debug crops on a background thread with sampling and an in-memory ring buffer of recent crops."""
+
+    def __init__(self, mode=DEBUG_WRITE_MODE, every_n=DEBUG_WRITE_EVERY_N, queue_size=DEBUG_QUEUE_SIZE,
+                 ring_size=DEBUG_RING_SIZE, ring_dir=DEBUG_RING_DIR):
+        self.mode = mode
+        self.every_n = every_n
+        self.ring_dir = ring_dir
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._ring = deque(maxlen=ring_size) if ring_size else None
+        self._counts = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='debug-writer', daemon=True)
+                self._thread.start()
+
+    def _should_write(self, path, mismatch):
+        if self.mode == 'always':
+            return True
+        if self.mode == 'on_mismatch':
+            return mismatch
+        if self.mode == 'every_n':
+            count = self._counts.get(path, 0)
+            self._counts[path] = count + 1
+            return mismatch or count % self.every_n == 0
+        return False
+
+    def _enqueue(self, item, count=1):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += count
+
+    def submit(self, path, image, mismatch=False):
+        """Queue a PIL image or BGR array for writing to path, subject to the sampling mode. Never blocks."""
+        if isinstance(image, np.ndarray):
+            # BGR arrays may be views into reusable capture buffers
+            image = image.copy()
+        if self._ring is not None:
+            self._ring.append((time.time(), os.path.basename(path), image))
+        if self._should_write(path, mismatch):
+            self._enqueue([(path, image)])
+        else:
+            self.skipped += 1
+
+    def flush_ring(self, reason):
+        """Write every crop in the ring buffer to DEBUG_RING_DIR, e.g. after an error or unexpected state."""
+        if not self._ring:
+            return
+        print(f"Flushing {len(self._ring)} recent debug crops to {self.ring_dir} ({reason})")
+        flush_dir = os.path.join(self.ring_dir, time.strftime('%Y%m%d-%H%M%S'))
+        items = []
+        while self._ring:
+            captured_at, file_name, image = self._ring.popleft()
+            millis = int((captured_at % 1) * 1000)
+            items.append((os.path.join(flush_dir, f"{time.strftime('%H%M%S', time.localtime(captured_at))}-{millis:03d}_{file_name}"), image))
+        # The whole ring takes one queue slot, so a flush never blocks the caller
+        self._enqueue(items, len(items))
+
+    def _run(self):
+        while True:
+            items = self._queue.get()
+            if items is None:
+                self._queue.task_done()
+                break
+            for path, image in items:
+                try:
+                    directory = os.path.dirname(path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    if hasattr(image, 'save'):
+                        image.save(path)
+                    else:
+                        cv2.imwrite(path, image)
+                    self.written += 1
+                except Exception as e:
+                    print(f"Error writing debug image {path}: {e}")
+            self._queue.task_done()
+
+    def close(self):
+        """Write everything still queued and stop the background thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def report(self):
+        """Print how many debug crops were written, skipped by sampling or dropped."""
+        print(f"Debug writer ({self.mode}): {self.written} written, {self.skipped} skipped, {self.dropped} dropped")
+
+
+# Shared writer for every debug crop
+DEBUG_WRITER = DebugArtifactWriter()
@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import cv2
+import numpy as np
+
+# Learned glyph templates; extend with `python digit_recognizer.py learn <image> <text>`
+DIGIT_GLYPHS_PATH = 'reference_images/digit_glyphs.npz'
+# Labelled captures the glyph set starts from when DIGIT_GLYPHS_PATH does not exist yet
+DIGIT_BOOTSTRAP_SAMPLES = [('reference_images/Capture percentage area.png', '39%')]
+# Every glyph is resampled to this (height, width) before matching
+GLYPH_SIZE = (12, 8)
+# The capture percentage is white text: darker pixels are never foreground, so the anti-aliased edges
+# between glyphs stay background however much of the surrounding box is in the crop
+DIGIT_MIN_BRIGHTNESS = 140
+# Glyphs smaller than this many foreground pixels are treated as noise
+MIN_GLYPH_PIXELS = 4
+# Readings whose weakest glyph correlates below this fall back to Tesseract
+DIGIT_MIN_CONFIDENCE = 0.85
+# Until every digit has an exemplar, an unseen digit could pass for a similar known one, so only near-exact glyphs are trusted
+DIGIT_PARTIAL_MIN_CONFIDENCE = 0.95
+# Exemplars kept per character
+MAX_EXEMPLARS_PER_LABEL = 8
+# Glyphs correlating above this are taken to be the same character drawn the same way
+GLYPH_MATCH_SCORE = 0.95
+# A learned glyph is only used for reading once this many reads agreed on its label; until then one
+# Tesseract misread (or a mislabelled bootstrap sample) cannot make the recognizer confidently wrong
+GLYPH_CONFIRMATIONS = 3
+
+
+def _otsu_threshold(gray):
+    """Return the Otsu threshold of a uint8 image."""
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weight_bg = np.cumsum(histogram)
+    weight_fg = weight_bg[-1] - weight_bg
+    intensity_sum = np.cumsum(histogram * np.arange(256))
+    mean_bg = intensity_sum / np.maximum(weight_bg, 1)
+    mean_fg = (intensity_sum[-1] - intensity_sum) / np.maximum(weight_fg, 1)
+    between_class = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between_class))
+
+
+def binarize(region):
+    """Return a boolean foreground mask for a PIL image or RGB/BGR array; text is assumed to be bright and the minority class."""
+    pixels = np.asarray(region)
+    gray = pixels[:, :, :3].mean(axis=2).astype(np.uint8) if pixels.ndim == 3 else pixels.astype(np.uint8)
+    mask = gray > max(_otsu_threshold(gray), DIGIT_MIN_BRIGHTNESS)
+    if mask.mean() > 0.5:
+        mask = ~mask
+    return mask
+
+
+def segment_glyphs(mask):
+    """Split a foreground mask into glyph masks, left to right.
+
+    Connected parts touching two or more sides of the mask (a box outline around the text) are
+    dropped, and parts whose columns mostly overlap (the circles and stroke of a '%') form one glyph.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=4)
+    height, width = mask.shape
+    groups = []
+    for label in range(1, count):
+        x, y, w, h = stats[label, :4]
+        if sum((x == 0, y == 0, x + w == width, y + h == height)) >= 2:
+            continue
+        groups.append([x, x + w, [label]])
+    groups.sort()
+    merged = []
+    for start, end, parts in groups:
+        if merged:
+            previous = merged[-1]
+            overlap = min(end, previous[1]) - max(start, previous[0])
+            if overlap * 2 >= min(end - start, previous[1] - previous[0]):
+                previous[1] = max(end, previous[1])
+                previous[2].extend(parts)
+                continue
+        merged.append([start, end, parts])
+    glyphs = []
+    for start, end, parts in merged:
+        glyph = np.isin(labels[:, start:end], parts)
+        rows = np.flatnonzero(glyph.any(axis=1))
+        glyph = glyph[rows[0]:rows[-1] + 1]
+        if glyph.sum() >= MIN_GLYPH_PIXELS:
+            glyphs.append(glyph)
+    return glyphs
+
+
+def glyph_vectors(glyphs):
+    """Resample glyph masks to GLYPH_SIZE and return zero-mean, unit-norm row vectors (N, H*W)."""
+    height, width = GLYPH_SIZE
+    vectors = np.empty((len(glyphs), height * width), dtype=np.float32)
+    for index, glyph in enumerate(glyphs):
+        rows = (np.arange(height) * glyph.shape[0] // height)
+        cols = (np.arange(width) * glyph.shape[1] // width)
+        vectors[index] = glyph[rows[:, None], cols[None, :]].ravel()
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-6)
+
+
+class DigitRecognizer:
+    """NumPy glyph-template reader for small fixed-font numbers such as the capture percentage.
+
+    Each exemplar counts the reads that agreed on its label; only exemplars with GLYPH_CONFIRMATIONS
+    agreeing reads are used by read().
+    """
+
+    def __init__(self, path=DIGIT_GLYPHS_PATH, samples=DIGIT_BOOTSTRAP_SAMPLES):
+        self.path = path
+        self.labels = np.empty(0, dtype='<U1')
+        self.templates = np.empty((0, GLYPH_SIZE[0] * GLYPH_SIZE[1]), dtype=np.float32)
+        self.confirmations = np.empty(0, dtype=np.int32)
+        self.load(samples)
+
+    def load(self, samples=DIGIT_BOOTSTRAP_SAMPLES):
+        """Load learned glyphs from disk, or start from the bootstrap samples when none were saved yet."""
+        if os.path.exists(self.path):
+            data = np.load(self.path)
+            self.labels = data['labels']
+            self.templates = data['templates'].astype(np.float32)
+            # Glyph files written before confirmations were counted only held glyphs already in use
+            if 'confirmations' in data.files:
+                self.confirmations = data['confirmations'].astype(np.int32)
+            else:
+                self.confirmations = np.full(len(self.labels), GLYPH_CONFIRMATIONS, dtype=np.int32)
+        else:
+            self.bootstrap(samples)
+
+    def bootstrap(self, samples=DIGIT_BOOTSTRAP_SAMPLES):
+        """Learn glyphs from labelled images without saving them. Each sample counts as one read, like a Tesseract read."""
+        from PIL import Image
+        for path, text in samples:
+            if not os.path.exists(path):
+                continue
+            self.learn(Image.open(path).convert('RGB'), text, save=False)
+
+    def save(self):
+        """Write the learned glyphs, confirmed or not, to disk."""
+        np.savez(self.path, labels=self.labels, templates=self.templates, confirmations=self.confirmations)
+
+    def _trusted(self):
+        return self.confirmations >= GLYPH_CONFIRMATIONS
+
+    def knows_all_digits(self):
+        """True once at least one confirmed exemplar of each digit 0-9 has been learned."""
+        return set('0123456789').issubset(self.labels[self._trusted()].tolist())
+
+    def read(self, region):
+        """Return (text, confidence) for a region; confidence is the weakest glyph's correlation (0.0 if unreadable)."""
+        glyphs = segment_glyphs(binarize(region))
+        trusted = self._trusted()
+        if not glyphs or not trusted.any():
+            return '', 0.0
+        scores = glyph_vectors(glyphs) @ self.templates[trusted].T
+        best = scores.argmax(axis=1)
+        text = ''.join(self.labels[trusted][best])
+        return text, float(scores[np.arange(len(glyphs)), best].min())
+
+    def read_number(self, region, min_confidence=DIGIT_MIN_CONFIDENCE):
+        """Return the first integer in the region, or None when the reading is not confident enough."""
+        if not self.knows_all_digits():
+            min_confidence = max(min_confidence, DIGIT_PARTIAL_MIN_CONFIDENCE)
+        text, confidence = self.read(region)
+        match = re.search(r'\d+', text)
+        if match is None or confidence < min_confidence:
+            return None
+        return int(match.group())
+
+    def learn(self, region, text, save=True, confirmed=False):
+        """Count a read of the region as text. Returns True if a glyph became confirmed.
+
+        A glyph that a confirmed exemplar of another character matches rejects the whole read;
+        unconfirmed exemplars of other characters that match are dropped as misreads. confirmed=True
+        (a label checked by hand) makes the glyphs usable at once.
+        """
+        text = text.replace(' ', '')
+        glyphs = segment_glyphs(binarize(region))
+        if not text or len(glyphs) != len(text):
+            return False
+        vectors = glyph_vectors(glyphs)
+        trusted = self._trusted()
+        for label, vector in zip(text, vectors):
+            others = trusted & (self.labels != label)
+            if others.any() and float((self.templates[others] @ vector).max()) > GLYPH_MATCH_SCORE:
+                return False
+        changed = promoted = False
+        for label, vector in zip(text, vectors):
+            scores = self.templates @ vector
+            keep = (self.labels == label) | self._trusted() | (scores <= GLYPH_MATCH_SCORE)
+            if not keep.all():
+                self.labels, self.templates, self.confirmations = self.labels[keep], self.templates[keep], self.confirmations[keep]
+                scores = scores[keep]
+                changed = True
+            same = np.flatnonzero((self.labels == label) & (scores > GLYPH_MATCH_SCORE))
+            if len(same):
+                index = same[scores[same].argmax()]
+                if self.confirmations[index] < GLYPH_CONFIRMATIONS:
+                    self.confirmations[index] = GLYPH_CONFIRMATIONS if confirmed else self.confirmations[index] + 1
+                    promoted = promoted or self.confirmations[index] >= GLYPH_CONFIRMATIONS
+                    changed = True
+                continue
+            if np.count_nonzero(self.labels == label) >= MAX_EXEMPLARS_PER_LABEL:
+                continue
+            self.labels = np.append(self.labels, label)
+            self.templates = np.vstack([self.templates, vector[None, :]])
+            self.confirmations = np.append(self.confirmations, np.int32(GLYPH_CONFIRMATIONS if confirmed else 1))
+            promoted = promoted or confirmed
+            changed = True
+        if changed and save:
+            self.save()
+        return promoted
+
+
+# Shared recognizer used by the battle engine for the capture percentage
+DIGITS = DigitRecognizer()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'learn':
+        from PIL import Image
+        learned = DIGITS.learn(Image.open(sys.argv[2]).convert('RGB'), sys.argv[3], confirmed=True)
+        print(f"Learned glyphs from {sys.argv[2]}: {learned}. Known characters: {''.join(sorted(set(DIGITS.labels[DIGITS.confirmations >= GLYPH_CONFIRMATIONS])))}")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'read':
+        from PIL import Image
+        text, confidence = DIGITS.read(Image.open(sys.argv[2]).convert('RGB'))
+        print(f"Read '{text}' with confidence {confidence:.2f}")
+    else:
+        print("Usage: python digit_recognizer.py learn <image> <text> | read <image>")
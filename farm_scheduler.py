@@ -0,0 +1,214 @@
+import json
+import os
+import statistics
+import sys
+import time
+from pyramid_matcher import PYRAMID
+
+# Learned per-spot rates and cooldowns, kept between runs
+FARM_SPOT_STATS_PATH = 'farm_spot_stats.json'
+# A spot is never clicked again sooner than this, even if it still looks ready
+SPOT_MIN_COOLDOWN = 3.0
+# While no spot is ready, the screen is rescanned at least this often (seconds)
+SPOT_POLL_INTERVAL = 1.0
+# Spots are not matched until this fraction of their learned cooldown has passed
+SPOT_SKIP_FRACTION = 0.8
+# Cooldown observations kept per spot
+SPOT_COOLDOWN_SAMPLES = 20
+
+
+class FarmSpot:
+    """A farming spot (one Insert_images template) with its cooldown state and learned rates."""
+
+    def __init__(self, path, cooldown):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        # Fallback when the spot looks the same during its cooldown
+        self.cooldown = cooldown
+        self.clicked_at = None
+        # True once the spot was seen gone (on cooldown) since the last click, so its reappearance means ready
+        self.went_away = False
+        self.reappeared_at = None
+        self.location = None
+        self.match = None
+        self.cooldown_samples = []
+        self.clicks = 0
+        self.encounters = 0
+        self.targets = 0
+        self.idle_seconds = 0.0
+
+    def learned_cooldown(self):
+        """Median observed click-to-ready time, or None before any was observed."""
+        return statistics.median(self.cooldown_samples) if self.cooldown_samples else None
+
+    def expected_cooldown(self):
+        learned = self.learned_cooldown()
+        return self.cooldown if learned is None else learned
+
+    def seconds_until_ready(self, now):
+        if self.clicked_at is None:
+            return 0.0
+        return max(0.0, self.expected_cooldown() - (now - self.clicked_at))
+
+    def target_rate(self):
+        """Targets per click, smoothed so untried spots start optimistic and get explored."""
+        return (self.targets + 1) / (self.clicks + 2)
+
+    def encounter_rate(self):
+        return (self.encounters + 1) / (self.clicks + 2)
+
+    def to_dict(self):
+        return {'clicks': self.clicks, 'encounters': self.encounters, 'targets': self.targets,
+                'cooldown_samples': self.cooldown_samples, 'idle_seconds': self.idle_seconds}
+
+    def load(self, data):
+        self.clicks = data.get('clicks', 0)
+        self.encounters = data.get('encounters', 0)
+        self.targets = data.get('targets', 0)
+        self.cooldown_samples = data.get('cooldown_samples', [])[-SPOT_COOLDOWN_SAMPLES:]
+        self.idle_seconds = data.get('idle_seconds', 0.0)
+
+
+class FarmScheduler:
+    """Rotates farm clicks across several spots, each with its own cooldown.
+
+    Readiness is visual: a spot is ready when its template matches again after it was seen
+    gone. Spots that look unchanged during their cooldown fall back to the cooldown timer.
+    Among ready spots, the one with the best learned target rate is clicked; any ready spot
+    is clicked straight away, so no spot waits on another's cooldown.
+    """
+
+    def __init__(self, spot_paths, cooldown, threshold=0.7, stats_path=FARM_SPOT_STATS_PATH):
+        self.spots = [FarmSpot(path, cooldown) for path in spot_paths]
+        self.threshold = threshold
+        self.stats_path = stats_path
+        self.started = time.monotonic()
+        self.idle_seconds = 0.0
+        self._idle_since = None
+        self._pending = None
+        self.load()
+
+    def load(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r') as f:
+                stats = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read farm spot stats from {self.stats_path}: {e}")
+            return
+        for spot in self.spots:
+            if spot.name in stats:
+                spot.load(stats[spot.name])
+
+    def save(self):
+        if not self.stats_path:
+            return
+        stats = {spot.name: spot.to_dict() for spot in self.spots}
+        temp_path = self.stats_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.replace(temp_path, self.stats_path)
+
+    def scan(self, screenshot_bgr):
+        """Match every spot that could be ready and update its visibility. Returns how many spots are visible."""
+        now = time.monotonic()
+        frame = PYRAMID.prepare(screenshot_bgr)
+        visible = 0
+        for spot in self.spots:
+            elapsed = None if spot.clicked_at is None else now - spot.clicked_at
+            learned = spot.learned_cooldown()
+            # Skip the match while the spot cannot be ready yet
+            if elapsed is not None and (elapsed < SPOT_MIN_COOLDOWN or (learned is not None and elapsed < learned * SPOT_SKIP_FRACTION)):
+                spot.location = None
+                continue
+            max_val, max_loc, template_shape = PYRAMID.match(frame, spot.path, self.threshold)
+            spot.match = max_val
+            if max_val is None or max_val < self.threshold:
+                spot.location = None
+                if spot.clicked_at is not None:
+                    spot.went_away = True
+                continue
+            visible += 1
+            if spot.went_away and spot.reappeared_at is None:
+                # Gone after the click and back now: one cooldown observation
+                spot.reappeared_at = now
+                spot.cooldown_samples = (spot.cooldown_samples + [now - spot.clicked_at])[-SPOT_COOLDOWN_SAMPLES:]
+            template_h, template_w = template_shape
+            spot.location = (max_loc[0] + template_w // 2, max_loc[1] + template_h // 2)
+        return visible
+
+    def is_ready(self, spot, now):
+        if spot.location is None:
+            return False
+        if spot.clicked_at is None:
+            return True
+        return spot.went_away or now - spot.clicked_at >= spot.cooldown
+
+    def pick(self, screenshot_bgr):
+        """Scan the screenshot and return the ready spot to click, or None (idle time starts counting)."""
+        self.scan(screenshot_bgr)
+        now = time.monotonic()
+        ready = [spot for spot in self.spots if self.is_ready(spot, now)]
+        if not ready:
+            if self._idle_since is None:
+                self._idle_since = now
+            return None
+        return max(ready, key=lambda spot: (spot.target_rate(), spot.encounter_rate()))
+
+    def clicked(self, spot):
+        """Record a click on spot; idle time since the last click is charged to it."""
+        now = time.monotonic()
+        if self._idle_since is not None:
+            idle = now - self._idle_since
+            self.idle_seconds += idle
+            spot.idle_seconds += idle
+            self._idle_since = None
+        spot.clicked_at = now
+        spot.went_away = False
+        spot.reappeared_at = None
+        spot.clicks += 1
+        self._pending = spot
+
+    def record_outcome(self, encounter, target=False):
+        """Attribute the result of the last click: whether it started a battle and whether the enemy was a target."""
+        spot, self._pending = self._pending, None
+        if spot is None:
+            return
+        if encounter:
+            spot.encounters += 1
+        if target:
+            spot.targets += 1
+
+    def seconds_until_ready(self):
+        """How long until the soonest spot is expected to be ready, but at least SPOT_POLL_INTERVAL."""
+        now = time.monotonic()
+        return max(SPOT_POLL_INTERVAL, min((spot.seconds_until_ready(now) for spot in self.spots), default=SPOT_POLL_INTERVAL))
+
+    def report(self):
+        """Print per-spot clicks, encounter and target yield, learned cooldown and idle time, and save the stats."""
+        elapsed = time.monotonic() - self.started
+        print(f"Farm scheduler: {len(self.spots)} spots, idle {self.idle_seconds:.0f}s of {elapsed:.0f}s")
+        for spot in sorted(self.spots, key=lambda spot: -spot.targets):
+            learned = spot.learned_cooldown()
+            cooldown = f"{learned:.1f}s learned" if learned is not None else f"{spot.cooldown}s timer"
+            encounter_pct = 100 * spot.encounters / spot.clicks if spot.clicks else 0.0
+            target_pct = 100 * spot.targets / spot.encounters if spot.encounters else 0.0
+            print(f"  {spot.name}: {spot.clicks} clicks, {spot.encounters} encounters ({encounter_pct:.0f}%), "
+                  f"{spot.targets} targets ({target_pct:.0f}% of encounters), cooldown {cooldown}, idle {spot.idle_seconds:.0f}s")
+        try:
+            self.save()
+        except OSError as e:
+            print(f"Could not save farm spot stats to {self.stats_path}: {e}")
+
+
+if __name__ == '__main__':
+    # python farm_scheduler.py [stats.json]: print the learned per-spot stats
+    path = sys.argv[1] if len(sys.argv) > 1 else FARM_SPOT_STATS_PATH
+    with open(path, 'r') as f:
+        stats = json.load(f)
+    for name, data in sorted(stats.items(), key=lambda item: -item[1]['targets']):
+        samples = data['cooldown_samples']
+        cooldown = f"{statistics.median(samples):.1f}s" if samples else '-'
+        print(f"{name}: {data['clicks']} clicks, {data['encounters']} encounters, {data['targets']} targets, "
+              f"cooldown {cooldown}, idle {data['idle_seconds']:.0f}s")
@@ -0,0 +1,297 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from battle_engine import BattleEngine
+from change_detector import FrameChangeDetector
+from debug_writer import DEBUG_WRITER
+from farm_scheduler import FarmScheduler, SPOT_POLL_INTERVAL
+from metrics import METRICS
+from mouse_control import RecordingMouse, set_mouse
+from screen_capture import ReplayCapture, set_capture_backend
+from session_recorder import RecordingCapture, RECORDING_SUFFIX, get_recorder
+from utils import convert_screenshot_to_bgr, find_and_click_template_on_screen
+from waits import async_wait_until, AdaptiveBackoff
+
+# Threads for capture, template matching and OCR; clicks always go through a single action thread
+ANALYSIS_WORKERS = 2
+# How often drops are looked for while the farm cooldown counts down
+DROP_SCAN_INTERVAL = 2.0
+
+
+class FarmState(Enum):
+    FARM_READY = 'farm_ready'
+    AWAIT_BATTLE = 'await_battle'
+    MY_TURN = 'my_turn'
+    CAPTURE = 'capture'
+    POST_BATTLE = 'post_battle'
+    TRAINING = 'training'
+    COLLECT_DROPS = 'collect_drops'
+
+
+# Seconds a state may run before it is abandoned for its recovery state
+STATE_TIMEOUTS = {
+    FarmState.FARM_READY: 15,
+    FarmState.MY_TURN: 300,
+    FarmState.CAPTURE: 10,
+    FarmState.POST_BATTLE: 15,
+    FarmState.TRAINING: 60,
+}
+# Seconds on top of the battle check window and farm cooldown before those states time out
+AWAIT_BATTLE_TIMEOUT_MARGIN = 5
+COLLECT_DROPS_TIMEOUT_MARGIN = 30
+
+# Where to go when a state times out or raises
+RECOVERY_TRANSITIONS = {
+    FarmState.FARM_READY: FarmState.COLLECT_DROPS,
+    FarmState.AWAIT_BATTLE: FarmState.COLLECT_DROPS,
+    # A stuck battle is usually a missed Continue button
+    FarmState.MY_TURN: FarmState.POST_BATTLE,
+    FarmState.CAPTURE: FarmState.MY_TURN,
+    FarmState.POST_BATTLE: FarmState.COLLECT_DROPS,
+    FarmState.TRAINING: FarmState.COLLECT_DROPS,
+    FarmState.COLLECT_DROPS: FarmState.FARM_READY,
+}
+# States left with the battle over; recovering from them still closes the battle record
+POST_BATTLE_STATES = (FarmState.POST_BATTLE, FarmState.TRAINING)
+
+
+class FarmStateMachine:
+    """Drives farming, battles and post-battle handling as one asyncio state machine.
+
+    Each state is a coroutine returning the next state. Capture, matching and OCR run on
+    analysis threads and clicks on one action thread, so the event loop stays free for
+    concurrent work such as scanning for drops while the farm cooldown counts down.
+
+    farm is the autofarm module, passed in rather than imported so running autofarm.py does
+    not load it a second time; its settings are the defaults and its helpers do the clicking.
+    """
+
+    def __init__(self, farm, battle_engine, spot_paths=None, drop_paths=None, cooldown=None, battle_check_window=None,
+                 timeouts=None, thread_setup=None):
+        self.farm = farm
+        self.battle_engine = battle_engine
+        cooldown = farm.FARM_COOLDOWN if cooldown is None else cooldown
+        # cooldown is each spot's fallback when its readiness cannot be seen
+        self.scheduler = FarmScheduler(farm.FARM_SPOTS if spot_paths is None else spot_paths, cooldown)
+        self.drop_paths = list((farm.POTION_DROP_PATH, farm.GOLD_DROP_PATH) if drop_paths is None else drop_paths)
+        self.battle_check_window = farm.BATTLE_CHECK_WINDOW if battle_check_window is None else battle_check_window
+        self.timeouts = {
+            **STATE_TIMEOUTS,
+            FarmState.AWAIT_BATTLE: self.battle_check_window + AWAIT_BATTLE_TIMEOUT_MARGIN,
+            FarmState.COLLECT_DROPS: farm.FARM_COOLDOWN + COLLECT_DROPS_TIMEOUT_MARGIN,
+            **(timeouts or {}),
+        }
+        self.farm_changes = FrameChangeDetector({'turn_card': (farm.TURN_CARD_X, farm.TURN_CARD_Y, farm.TURN_CARD_W, farm.TURN_CARD_H)})
+        self.state = FarmState.FARM_READY
+        # (time.time(), from state, to state, reason) for every transition
+        self.transitions = []
+        self.time_in_state = {state: 0.0 for state in FarmState}
+        self.recoveries = 0
+        # thread_setup runs once on every worker thread, e.g. to bind a game window's capture and mouse
+        self._analysis = ThreadPoolExecutor(ANALYSIS_WORKERS, thread_name_prefix='analysis', initializer=thread_setup)
+        # A click abandoned by a timeout still finishes before the next one starts
+        self._action = ThreadPoolExecutor(1, thread_name_prefix='action', initializer=thread_setup)
+        self._cooldown = None
+        self._observation = None
+
+    async def _analyse(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._analysis, func, *args)
+
+    async def _act(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._action, func, *args)
+
+    def _start_cooldown(self, seconds):
+        if self._cooldown is not None:
+            self._cooldown.cancel()
+        self._cooldown = asyncio.ensure_future(asyncio.sleep(seconds))
+
+    # =====================
+    # States
+    # =====================
+    async def farm_ready(self):
+        if self._cooldown is not None and not self._cooldown.done():
+            return FarmState.COLLECT_DROPS
+        screenshot_bgr, _ = await self._analyse(convert_screenshot_to_bgr)
+        spot = await self._analyse(self.scheduler.pick, screenshot_bgr)
+        if spot is not None:
+            print(f"Farming {spot.name} at {spot.location} (match {spot.match:.2f})...")
+            self.scheduler.clicked(spot)
+            await self._act(self.farm.click_farming_object, *spot.location, spot.match, spot.name)
+            self.farm_changes.mark_dirty()
+            return FarmState.AWAIT_BATTLE
+        if not any(spot.location for spot in self.scheduler.spots) and self.scheduler.seconds_until_ready() <= SPOT_POLL_INTERVAL:
+            # Nothing on screen that should be: usually a dialog in the way
+            if await self._act(find_and_click_template_on_screen, screenshot_bgr, self.farm.OKAY_TEMPLATE_PATH):
+                print("'Okay' detected with template matching and clicked.")
+        # Collect drops until the soonest spot is expected back
+        self._start_cooldown(min(self.scheduler.seconds_until_ready(), self.timeouts[FarmState.COLLECT_DROPS] / 2))
+        return FarmState.COLLECT_DROPS
+
+    async def await_battle(self):
+        print(f"Checking for battle for the next {self.battle_check_window} seconds...")
+        battle_found = await async_wait_until(self.farm.battle_started(self.farm_changes), self.battle_check_window,
+                                              AdaptiveBackoff(initial=0.1, maximum=1.0), name='battle_check', executor=self._analysis)
+        self.farm_changes.report('Battle check frames')
+        if not battle_found:
+            self.scheduler.record_outcome(False)
+            print("No battle detected. Checking for potion and gold drops...")
+            return FarmState.COLLECT_DROPS
+        print("Battle detected!")
+        await self._analyse(self.battle_engine.start_battle, time.time())
+        self.scheduler.record_outcome(True, self.battle_engine.is_target)
+        return FarmState.MY_TURN
+
+    async def my_turn(self):
+        while True:
+            observation = await self._analyse(self.battle_engine.observe)
+            if observation is None:
+                await asyncio.sleep(0.05)
+                continue
+            if self.battle_engine.should_capture(observation):
+                self._observation = observation
+                return FarmState.CAPTURE
+            if observation.is_your_turn:
+                await self._act(self.battle_engine.play_turn)
+            elif observation.is_continue:
+                print("Continue button detected. Clicking to end battle...")
+                return FarmState.POST_BATTLE
+            else:
+                await asyncio.sleep(0.05)
+
+    async def capture(self):
+        observation = self._observation
+        if not await self._act(self.battle_engine.try_capture, observation.screenshot_bgr) and observation.is_your_turn:
+            # Capture button missing: play the turn as usual
+            await self._act(self.battle_engine.play_turn)
+        return FarmState.MY_TURN
+
+    async def post_battle(self):
+        ready_to_train = await self._act(self.battle_engine.click_continue)
+        self.battle_engine.report_battle()
+        self.battle_engine.report_startup_latency()
+        if ready_to_train:
+            return FarmState.TRAINING
+        if ready_to_train is not None:
+            await self._act(self.battle_engine.dismiss_post_battle_okay)
+        self.battle_engine.finish_battle()
+        print("Battle finished. Resuming farming.")
+        return FarmState.COLLECT_DROPS
+
+    async def training(self):
+        await self._act(self.battle_engine.run_training_sequence)
+        self.battle_engine.finish_battle()
+        return FarmState.COLLECT_DROPS
+
+    async def collect_drops(self):
+        # Drops are collected while the cooldown counts down instead of after it
+        while True:
+            screenshot_bgr, _ = await self._analyse(convert_screenshot_to_bgr)
+            drops = await self._analyse(self.farm.find_visible_drops, screenshot_bgr, self.drop_paths)
+            if drops:
+                await self._act(self.farm.click_drops, drops)
+            if self._cooldown is None or self._cooldown.done():
+                return FarmState.FARM_READY
+            await asyncio.wait({self._cooldown}, timeout=DROP_SCAN_INTERVAL)
+            if self._cooldown.done():
+                return FarmState.FARM_READY
+
+    # =====================
+    # Driver
+    # =====================
+    def _handler(self, state):
+        return getattr(self, state.value)
+
+    def _transition(self, next_state, reason):
+        self.transitions.append((time.time(), self.state, next_state, reason))
+        METRICS.count('state_transitions_total', source=self.state.value, target=next_state.value)
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record_event('transition', {'source': self.state.value, 'target': next_state.value, 'reason': reason})
+        if next_state != self.state:
+            print(f"State: {self.state.value} -> {next_state.value} ({reason})")
+        self.state = next_state
+
+    async def step(self):
+        """Run the current state to completion (or its timeout) and move to the next one."""
+        state = self.state
+        started = time.monotonic()
+        try:
+            next_state = await asyncio.wait_for(self._handler(state)(), self.timeouts[state])
+            reason = 'done'
+        except asyncio.TimeoutError:
+            next_state, reason = RECOVERY_TRANSITIONS[state], f'timed out after {self.timeouts[state]}s'
+        except Exception as e:
+            next_state, reason = RECOVERY_TRANSITIONS[state], f'error: {e}'
+        finally:
+            self.time_in_state[state] += time.monotonic() - started
+            METRICS.observe('state_seconds', time.monotonic() - started, state=state.value)
+        if reason != 'done':
+            self.recoveries += 1
+            METRICS.count('state_recoveries_total', state=state.value)
+            print(f"State {state.value} {reason}. Recovering to {next_state.value}.")
+            DEBUG_WRITER.flush_ring(f'{state.value} {reason}')
+            if state in POST_BATTLE_STATES:
+                self.battle_engine.finish_battle()
+        self._transition(next_state, reason)
+
+    async def run(self, max_transitions=None):
+        """Run until cancelled, or for max_transitions state changes."""
+        try:
+            while max_transitions is None or len(self.transitions) < max_transitions:
+                await self.step()
+        finally:
+            if self._cooldown is not None:
+                self._cooldown.cancel()
+
+    def close(self):
+        """Stop the analysis and action threads."""
+        self._analysis.shutdown(wait=True)
+        self._action.shutdown(wait=True)
+
+    def report(self):
+        """Print time spent per state, transitions and recoveries, and the per-spot farm yield."""
+        print(f"State machine: {len(self.transitions)} transitions, {self.recoveries} recoveries")
+        for state, seconds in self.time_in_state.items():
+            if seconds:
+                print(f"  {state.value}: {seconds:.1f}s")
+        self.scheduler.report()
+
+
+def run_replay(source, max_transitions=20, cooldown=0):
+    """Drive the state machine over a frames directory or session recording with a recording mouse; no display needed.
+
+    Returns (machine, clicks).
+    """
+    # Imported here so autofarm.py can import this module while running as __main__
+    import autofarm
+    mouse = RecordingMouse()
+    previous_capture = set_capture_backend(RecordingCapture(source) if isinstance(source, str) and source.endswith(RECORDING_SUFFIX)
+                                           else ReplayCapture(source))
+    previous_mouse = set_mouse(mouse)
+    try:
+        # Replayed frames do not react to the moves played, so replays play move 1 and learn no move statistics
+        machine = FarmStateMachine(autofarm, BattleEngine(autofarm.TARGET_MISCRITS, autofarm.PLATINUM_TRAINING, policy='first'), cooldown=cooldown)
+        # Replays must not feed the learned spot stats
+        machine.scheduler.stats_path = None
+        try:
+            asyncio.run(machine.run(max_transitions))
+        finally:
+            machine.close()
+    finally:
+        set_capture_backend(previous_capture)
+        set_mouse(previous_mouse)
+    return machine, mouse.clicks
+
+
+if __name__ == '__main__':
+    # python farm_state_machine.py <frames directory or .msr recording> [max transitions]
+    if len(sys.argv) < 2:
+        print("Usage: python farm_state_machine.py <frames directory or .msr recording> [max transitions]")
+        sys.exit(1)
+    machine, clicks = run_replay(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    for _, from_state, to_state, reason in machine.transitions:
+        print(f"{from_state.value} -> {to_state.value}: {reason}")
+    print(f"{len(clicks)} clicks: {[(x, y) for _, x, y, _ in clicks]}")
+    machine.report()
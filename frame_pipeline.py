@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import deque
+from screen_capture import Frame, get_capture_backend
+
+# Frames waiting for analysis; older ones are dropped when the producer gets ahead (1 = always the latest)
+PIPELINE_DEPTH = 1
+# Threads running the template and OCR detectors of one frame in parallel
+PIPELINE_WORKERS = 3
+# Seconds between captures; the analysis loop cannot use frames faster than about 30 per second,
+# and capturing without a pause would spin a core and compete with the detectors for the GIL
+CAPTURE_INTERVAL = 1 / 30
+
+
+class LatestFrameBuffer:
+    """Bounded hand-off between a capture producer and the analysis loop that drops the stalest frame instead of blocking."""
+
+    def __init__(self, depth=PIPELINE_DEPTH):
+        self._frames = deque(maxlen=depth)
+        self._condition = threading.Condition()
+        self._seq = 0
+        self.published = 0
+        self.dropped = 0
+
+    def put(self, frame, captured_at):
+        """Publish a frame captured at time.monotonic() captured_at. Never blocks."""
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._seq += 1
+            self.published += 1
+            self._frames.append((self._seq, captured_at, frame))
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Return the oldest buffered (seq, captured_at, frame), waiting up to timeout seconds. None on timeout."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frames, timeout):
+                return None
+            return self._frames.popleft()
+
+    def report(self, label='Frame buffer'):
+        """Print how many captured frames were analysed and how many went stale."""
+        print(f"{label}: {self.published} frames captured, {self.dropped} dropped as stale")
+
+
+class CaptureProducer(threading.Thread):
+    """Captures continuously into a LatestFrameBuffer on its own thread."""
+
+    def __init__(self, buffer, bbox=None, backend=None, min_interval=CAPTURE_INTERVAL):
+        super().__init__(name='capture-producer', daemon=True)
+        self.buffer = buffer
+        self.bbox = bbox
+        # Resolved on the creating thread, which may have a per-window backend bound
+        self.backend = backend or get_capture_backend()
+        self.min_interval = min_interval
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                captured_at = time.monotonic()
+                frame = self.backend.grab(self.bbox)
+                # The backend reuses its buffers, so frames handed to other threads are copied
+                self.buffer.put(Frame(frame.image.copy(), frame.left, frame.top), captured_at)
+                remaining = self.min_interval - (time.monotonic() - captured_at)
+                if remaining > 0:
+                    self._stop_event.wait(remaining)
+        except Exception as e:
+            self.error = e
+
+    def check(self):
+        """Re-raise the error that stopped the producer, if any."""
+        if self.error is not None:
+            raise RuntimeError(f"Capture producer stopped: {self.error}") from self.error
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
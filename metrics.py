@@ -0,0 +1,236 @@
+"""In-process timers, counters and histograms for capture, matching, OCR, clicks, waits, state transitions,
+farm cycles and battles.
+
+While autofarm.py runs they are exported every METRICS_EXPORT_INTERVAL seconds to METRICS_JSONL_PATH
+(one snapshot per line) and the Prometheus textfile METRICS_PROM_PATH. Label names must not be
+`name`, which is the metric name argument.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# False turns every timer and counter into a no-op
+METRICS_ENABLED = True
+# Seconds between exports once start_exporter() has been called
+METRICS_EXPORT_INTERVAL = 30.0
+METRICS_JSONL_PATH = 'metrics/metrics.jsonl'
+# Point node_exporter's textfile collector at this directory to scrape it
+METRICS_PROM_PATH = 'metrics/miscrits_bot.prom'
+METRICS_PREFIX = 'miscrits_'
+# Histogram bucket upper bounds in seconds
+HISTOGRAM_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus-style cumulative export)."""
+
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (the maximum for the overflow bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(HISTOGRAM_BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.total, 'mean': self.total / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'max': self.maximum}
+
+
+class _Timer:
+    __slots__ = ('registry', 'key', 'started')
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._observe(self.key, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+class MetricsRegistry:
+    """In-process counters and latency histograms with periodic JSON lines and Prometheus textfile export."""
+
+    def __init__(self, enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_PATH, prom_path=METRICS_PROM_PATH):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._counters = {}
+        self._histograms = {}
+        self._laps = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+        self._stop = threading.Event()
+
+    def timer(self, name, **labels):
+        """Context manager recording its duration in the name histogram."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, _key(name, labels))
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration in the name histogram."""
+        if self.enabled:
+            self._observe(_key(name, labels), seconds)
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        """Add value to the name counter."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def lap(self, name, **labels):
+        """Record the time since the previous lap of the same name (e.g. farm click to farm click)."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        now = time.monotonic()
+        with self._lock:
+            previous = self._laps.get(key)
+            self._laps[key] = now
+        if previous is not None:
+            self._observe(key, now - previous)
+
+    def totals(self):
+        """Return {histogram name: total seconds} summed over labels; diff two calls to attribute time to stages."""
+        totals = {}
+        with self._lock:
+            for (name, _), histogram in self._histograms.items():
+                totals[name] = totals.get(name, 0.0) + histogram.total
+        return totals
+
+    def snapshot(self):
+        """Return counters and histogram summaries as a JSON-serialisable dict."""
+        def label_text(name, labels):
+            return name + ('{' + ','.join(f'{k}={v}' for k, v in labels) + '}' if labels else '')
+        with self._lock:
+            return {
+                'ts': time.time(),
+                'counters': {label_text(name, labels): value for (name, labels), value in sorted(self._counters.items())},
+                'histograms': {label_text(name, labels): histogram.summary() for (name, labels), histogram in sorted(self._histograms.items())},
+            }
+
+    def prometheus_text(self):
+        """Render every metric in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in list(labels) + list(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.total)) for key, h in self._histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} counter')
+                typed.add(metric)
+            lines.append(f'{metric}{label_text(labels)} {value}')
+        for (name, labels), (counts, count, total) in histograms:
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} histogram')
+                typed.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(HISTOGRAM_BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{label_text(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{metric}_bucket{label_text(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{metric}_sum{label_text(labels)} {total}')
+            lines.append(f'{metric}_count{label_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Append a snapshot to the JSON lines file and rewrite the Prometheus textfile."""
+        if not self.enabled:
+            return
+        for path in (self.jsonl_path, self.prom_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        with open(self.jsonl_path, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+        # The textfile collector must never see a half-written file
+        temp_path = self.prom_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, self.prom_path)
+
+    def start_exporter(self, interval=METRICS_EXPORT_INTERVAL):
+        """Export every interval seconds on a background thread."""
+        if not self.enabled or self._exporter is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.export()
+                except Exception as e:
+                    print(f"Error exporting metrics: {e}")
+
+        self._exporter = threading.Thread(target=run, name='metrics-exporter', daemon=True)
+        self._exporter.start()
+
+    def close(self):
+        """Stop the exporter and write a final export."""
+        if self._exporter is not None:
+            self._stop.set()
+            self._exporter.join()
+            self._exporter = None
+        self.export()
+
+
+# Shared registry for the farm loop, battle engine and state machine
+METRICS = MetricsRegistry()
@@ -0,0 +1,206 @@
+import difflib
+import heapq
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+# Known miscrit names, one per line; add species here as they are met
+ROSTER_PATH = 'miscrit_roster.txt'
+ENCOUNTERS_PATH = 'target_encounters.txt'
+# Light and Dark forms are indexed for every base name in the roster
+ROSTER_VARIANT_PREFIXES = ('Light', 'Dark')
+# Reads resolving below this confidence are treated as an unknown species. Misreads of roster names
+# score 0.85 and up; off-roster names land on an unrelated roster name at up to ~0.65
+ROSTER_MIN_CONFIDENCE = 0.75
+# The nearest name must also beat the next nearest by this much, or the read is ambiguous and unknown
+ROSTER_MIN_MARGIN = 0.1
+# Trigram candidates re-scored by edit similarity in a lookup
+ROSTER_CANDIDATES = 5
+# Capture threshold for a target listed without one
+DEFAULT_CAPTURE_THRESHOLD = 85
+# A legacy encounters file held a single count for whichever target was set at the time
+LEGACY_COUNT_KEY = 'unattributed'
+
+
+def normalize_name(text):
+    """Lowercase, drop everything but letters and spaces, and collapse whitespace."""
+    return ' '.join(re.sub(r'[^a-z ]', ' ', text.lower()).split())
+
+
+def trigrams(text):
+    """Character trigrams of a normalized name, padded so the first and last letters carry weight."""
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RosterIndex:
+    """Trigram index over known miscrit names that resolves an OCR read to the nearest real name in one lookup."""
+
+    def __init__(self, names=()):
+        self.names = {}
+        self._postings = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        """Index a name. Returns the display name already indexed for it, if any."""
+        key = normalize_name(name)
+        with self._lock:
+            if key in self.names:
+                return self.names[key]
+            self.names[key] = name
+            grams = trigrams(key)
+            self._sizes[key] = len(grams)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(key)
+        return name
+
+    def _nearest(self, text):
+        """Return up to two (similarity, key) pairs for the roster names nearest to text, best first."""
+        query = normalize_name(text)
+        if not query:
+            return []
+        if query in self.names:
+            return [(1.0, query)]
+        grams = trigrams(query)
+        shared = Counter()
+        with self._lock:
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            # Trigram overlap (Dice) shortlists candidates; edit similarity decides between them
+            candidates = heapq.nlargest(ROSTER_CANDIDATES, shared, key=lambda key: 2 * shared[key] / (len(grams) + self._sizes[key]))
+        return heapq.nlargest(2, ((difflib.SequenceMatcher(None, query, key).ratio(), key) for key in candidates))
+
+    def lookup(self, text):
+        """Return (name, confidence in 0-1) for the roster name nearest to text, or (None, 0.0) when none shares a trigram."""
+        nearest = self._nearest(text)
+        if not nearest:
+            return None, 0.0
+        confidence, best = nearest[0]
+        return self.names[best], confidence
+
+    def resolve(self, text, min_confidence=ROSTER_MIN_CONFIDENCE, min_margin=ROSTER_MIN_MARGIN):
+        """Like lookup, but the name is None unless it is at least min_confidence and min_margin ahead of the next nearest name."""
+        nearest = self._nearest(text)
+        if not nearest:
+            return None, 0.0
+        confidence, best = nearest[0]
+        runner_up = nearest[1][0] if len(nearest) > 1 else 0.0
+        if confidence < min_confidence or (confidence < 1.0 and confidence - runner_up < min_margin):
+            return None, confidence
+        return self.names[best], confidence
+
+    def __len__(self):
+        return len(self.names)
+
+
+def load_roster(path=ROSTER_PATH):
+    """Build a RosterIndex from the roster file (blank lines and # comments ignored), with Light/Dark forms."""
+    index = RosterIndex()
+    if not os.path.exists(path):
+        print(f"Warning: miscrit roster not found at {path}; only targets will be recognised")
+        return index
+    with open(path, 'r') as f:
+        for line in f:
+            name = line.split('#', 1)[0].strip()
+            if not name:
+                continue
+            index.add(name)
+            if name.split(' ', 1)[0] not in ROSTER_VARIANT_PREFIXES:
+                for prefix in ROSTER_VARIANT_PREFIXES:
+                    index.add(f'{prefix} {name}')
+    return index
+
+
+def parse_targets(text, default_threshold=DEFAULT_CAPTURE_THRESHOLD):
+    """Parse 'Name:threshold,Name' into {name: capture threshold}. A bare (legacy) name or an unreadable threshold gets default_threshold."""
+    targets = {}
+    for entry in text.split(','):
+        name, _, threshold = entry.partition(':')
+        name = name.strip()
+        if not name:
+            continue
+        targets[name] = default_threshold
+        if threshold.strip():
+            try:
+                targets[name] = int(threshold)
+            except ValueError:
+                print(f"Warning: capture threshold '{threshold.strip()}' for {name} is not a whole number; using {default_threshold}.")
+    return targets
+
+
+def format_targets(targets):
+    """Inverse of parse_targets, for config_file.txt."""
+    return ','.join(f'{name}:{threshold}' for name, threshold in targets.items())
+
+
+class EncounterCounts:
+    """Per-species encounter counts persisted as 'name|count' lines. A legacy single-integer file is read under LEGACY_COUNT_KEY.
+
+    Counts are kept in memory and written by save() after each battle and when the bot stops; every encounter is also in the analytics store.
+    """
+
+    def __init__(self, path=ENCOUNTERS_PATH):
+        self.path = path
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                lines = [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            return
+        counts = {}
+        for line in lines:
+            name, separator, count = line.rpartition('|')
+            if not separator:
+                name, count = LEGACY_COUNT_KEY, line
+            try:
+                counts[name] = counts.get(name, 0) + int(count)
+            except ValueError:
+                print(f"Skipping malformed encounter count line: {line}")
+        self.counts = {name: count for name, count in counts.items() if count}
+
+    def save(self):
+        """Write the counts if any were added since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                for name, count in sorted(self.counts.items()):
+                    f.write(f'{name}|{count}\n')
+            os.replace(temp_path, self.path)
+            self._dirty = False
+
+    def add(self, name):
+        """Count one encounter with name. Returns the new count."""
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self._dirty = True
+            return self.counts[name]
+
+    def get(self, name):
+        return self.counts.get(name, 0)
+
+
+# Shared by every battle engine (and window), so counts are never overwritten by another engine's copy
+ROSTER = load_roster()
+ENCOUNTERS = EncounterCounts()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        nearest, _ = ROSTER.lookup(sys.argv[1])
+        name, confidence = ROSTER.resolve(sys.argv[1])
+        print(f"'{sys.argv[1]}' -> {name or f'unknown (nearest {nearest})'} (confidence {confidence:.2f}; {len(ROSTER)} names indexed)")
+    else:
+        for name, count in sorted(ENCOUNTERS.counts.items(), key=lambda item: -item[1]):
+            print(f"{name}: {count}")
@@ -0,0 +1,69 @@
+import threading
+import time
+from metrics import METRICS
+from session_recorder import get_recorder
+
+
+class PyAutoGuiMouse:
+    """Clicks the real screen through pyautogui (imported on first use so headless runs never load it)."""
+
+    def __init__(self):
+        self._pyautogui = None
+
+    def click(self, x, y, duration=0.2, clicks=1):
+        if self._pyautogui is None:
+            import pyautogui
+            self._pyautogui = pyautogui
+        self._pyautogui.moveTo(x, y, duration=duration)
+        self._pyautogui.click(clicks=clicks)
+
+
+class RecordingMouse:
+    """Records clicks instead of performing them, for replays and tests."""
+
+    def __init__(self):
+        self.clicks = []
+
+    def click(self, x, y, duration=0.2, clicks=1):
+        self.clicks.append((time.time(), x, y, clicks))
+
+
+_mouse = None
+_lock = threading.Lock()
+# Per-thread overrides, so each game window's action thread clicks in that window (see multi_window.py)
+_thread_mouse = threading.local()
+
+
+def get_mouse():
+    """Return this thread's bound mouse backend, else the shared one (creating the pyautogui one on first use)."""
+    global _mouse
+    mouse = getattr(_thread_mouse, 'mouse', None)
+    if mouse is not None:
+        return mouse
+    with _lock:
+        if _mouse is None:
+            _mouse = PyAutoGuiMouse()
+        return _mouse
+
+
+def set_mouse(mouse):
+    """Replace the active mouse backend (e.g. with a RecordingMouse for replays). Returns the one replaced."""
+    global _mouse
+    with _lock:
+        previous, _mouse = _mouse, mouse
+    return previous
+
+
+def bind_mouse(mouse):
+    """Make mouse the calling thread's mouse backend, overriding the shared one; None removes the binding."""
+    _thread_mouse.mouse = mouse
+
+
+def click_at(x, y, duration=0.2, clicks=1):
+    """Move to (x, y) and click with the active mouse backend."""
+    METRICS.count('clicks_total')
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.record_event('click', {'x': x, 'y': y, 'clicks': clicks})
+    with METRICS.timer('click_seconds'):
+        get_mouse().click(x, y, duration, clicks)
@@ -0,0 +1,331 @@
+"""Which move the battle engine plays each turn.
+
+'first' always plays move 1, as the bot always did; replays always use it. 'learned' reads the
+capture chance and enemy HP bar before every move and learns each move's HP damage and capture
+gain per species (kept in move_stats.json). Against a target it plays the move that gains the
+most capture chance without being expected to knock the target out; against anything else the
+most damaging move. Moves are explored until MIN_MOVE_SAMPLES observations over all species,
+and per species once that species has SPECIES_EXPLORE_SAMPLES observed moves.
+
+ENEMY_HP_X/Y/W/H in battle_engine.py was measured on benchmark_corpus/enemy_hp_full_grubbean.png;
+confirm it on your own battle screenshots before switching to 'learned'.
+
+    python move_policy.py [battles] [species] [--no-hp]   # both policies on simulated battles
+"""
+import json
+import os
+import random
+import sys
+import threading
+from collections import namedtuple
+import numpy as np
+
+# 'first' always plays move 1 (the old behaviour); 'learned' picks moves from per-species statistics
+MOVE_POLICY = 'first'
+MOVE_STATS_PATH = 'move_stats.json'
+MOVE_COUNT = 4
+# Targets are never hit by a move expected to leave them below this HP fraction
+TARGET_MIN_HP = 0.12
+# Untried moves are only tried on a target while its HP is above this (a strong unknown move could knock it out)
+TARGET_EXPLORE_HP = 0.6
+# Observations of a move before its statistics are trusted over exploring it
+MIN_MOVE_SAMPLES = 3
+# Observed moves of a species before its own move counts decide what to explore; until then the all-species counts do
+SPECIES_EXPLORE_SAMPLES = 20
+# Weight (in observations) of the all-species statistics behind a species' own
+SPECIES_PRIOR_WEIGHT = 2.0
+# Expected per-move HP damage before any was observed, for the knock-out check on targets
+DEFAULT_MOVE_DAMAGE = 0.1
+# HP bar pixels brighter and more saturated than this count as filled
+HP_FILL_SATURATION = 80
+HP_FILL_VALUE = 80
+ALL_SPECIES = '*'
+
+# What the policy sees before each move; hp is the enemy's HP fraction (None when unreadable)
+BattleState = namedtuple('BattleState', ['capture_percent', 'hp', 'turn'])
+
+
+def hp_fraction(bar_bgr):
+    """Estimate the filled fraction of a left-to-right HP bar crop (None for an empty crop)."""
+    # int32: (high - low) * 255 overflows int16
+    bar = np.asarray(bar_bgr, dtype=np.int32)
+    if bar.size == 0:
+        return None
+    high = bar.max(axis=2)
+    low = bar.min(axis=2)
+    # Saturation and value as in HSV (0-255), without a colour conversion
+    saturation = np.where(high > 0, (high - low) * 255 // np.maximum(high, 1), 0)
+    filled = ((saturation > HP_FILL_SATURATION) & (high > HP_FILL_VALUE)).mean(axis=0) > 0.5
+    columns = np.flatnonzero(filled)
+    if not len(columns):
+        return 0.0
+    return (columns[-1] + 1) / filled.shape[0]
+
+
+class MoveStats:
+    """Per-species, per-move HP damage and capture % gain, shared by every battle engine and saved as JSON."""
+
+    def __init__(self, path=MOVE_STATS_PATH, moves=MOVE_COUNT):
+        self.path = path
+        self.moves = moves
+        # species -> move -> [observations, damage sum, damage observations, capture gain sum, capture observations]
+        self.species = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.species = {name: [list(move) for move in moves] for name, moves in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            print(f"Could not read move statistics from {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.species, indent=1)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+    def _entry(self, species, move):
+        moves = self.species.setdefault(species, [[0, 0.0, 0, 0.0, 0] for _ in range(self.moves)])
+        return moves[move]
+
+    def add(self, species, move, damage, capture_gain):
+        """Record one observed move; damage or capture_gain may be None when unreadable."""
+        with self._lock:
+            for name in (species, ALL_SPECIES):
+                entry = self._entry(name, move)
+                entry[0] += 1
+                if damage is not None:
+                    entry[1] += damage
+                    entry[2] += 1
+                if capture_gain is not None:
+                    entry[3] += capture_gain
+                    entry[4] += 1
+
+    def observations(self, species):
+        """Return the number of observations of each move against species."""
+        with self._lock:
+            return [self._entry(species, move)[0] for move in range(self.moves)]
+
+    def estimate(self, species, move):
+        """Return (observations, expected damage, expected capture gain), blending the species with all species.
+
+        Damage and gain are None until the move's HP drop or capture chance change was observed on any species.
+        """
+        with self._lock:
+            overall = self._entry(ALL_SPECIES, move)
+            own = self._entry(species, move)
+            return own[0], self._blend(own[1], own[2], overall[1], overall[2]), self._blend(own[3], own[4], overall[3], overall[4])
+
+    @staticmethod
+    def _blend(own_sum, own_count, overall_sum, overall_count):
+        if not overall_count:
+            return None
+        return (own_sum + SPECIES_PRIOR_WEIGHT * overall_sum / overall_count) / (own_count + SPECIES_PRIOR_WEIGHT)
+
+
+class MovePolicy:
+    """Chooses the move to play each turn. Subclasses override choose() and may learn in observe()."""
+
+    name = 'base'
+    # Whether the battle engine should read the enemy HP bar for this policy
+    needs_hp = False
+
+    def __init__(self, moves=MOVE_COUNT):
+        self.moves = moves
+        self.species = None
+        self.is_target = False
+        self.threshold = 100
+
+    def start_battle(self, species, is_target, threshold):
+        """Called once the enemy is identified; threshold is the capture % at which a target is captured."""
+        self.species = species
+        self.is_target = is_target
+        self.threshold = threshold
+
+    def choose(self, state):
+        """Return the index of the move to play in this BattleState."""
+        raise NotImplementedError
+
+    def observe(self, move, before, after):
+        """Called with the BattleStates before a move and before the next one."""
+
+    def finish_battle(self):
+        """Called when the battle is over."""
+
+
+class FirstMovePolicy(MovePolicy):
+    """Always plays the first move."""
+
+    name = 'first'
+
+    def choose(self, state):
+        return 0
+
+
+class LearnedMovePolicy(MovePolicy):
+    """Learns each move's HP damage and capture % gain per species and plays to end battles in the fewest turns.
+
+    Against a target it plays the move with the largest expected capture % gain that is not
+    expected to push the enemy's HP below TARGET_MIN_HP, so the capture threshold is reached
+    quickly without a knock-out. Against anything else it plays the most damaging move.
+    Moves seen fewer than MIN_MOVE_SAMPLES times over all species are tried first, on targets only
+    while it is safe; a species only has its own moves explored once SPECIES_EXPLORE_SAMPLES of them
+    were observed, so rare species do not each repeat the exploration.
+    """
+
+    name = 'learned'
+    needs_hp = True
+
+    def __init__(self, moves=MOVE_COUNT, stats=None):
+        super().__init__(moves)
+        self.stats = MOVE_STATS if stats is None else stats
+
+    def _key(self):
+        return self.species or 'unknown'
+
+    @staticmethod
+    def _hp_above(state, hp, gain=0.0):
+        """Whether the enemy's HP (after a move gaining gain capture %) is expected to stay above hp.
+
+        Without an HP read the capture chance stands in for it: it nears 100 as the HP nears 0.
+        """
+        if state.hp is not None:
+            return state.hp > hp
+        if not state.capture_percent:
+            return True
+        return state.capture_percent + (gain or 0.0) <= 100 * (1 - hp)
+
+    def choose(self, state):
+        estimates = [self.stats.estimate(self._key(), move) for move in range(self.moves)]
+        counts = [count for count, _, _ in estimates]
+        if sum(counts) < SPECIES_EXPLORE_SAMPLES:
+            counts = self.stats.observations(ALL_SPECIES)
+        untried = [move for move in range(self.moves) if counts[move] < MIN_MOVE_SAMPLES]
+        if untried and (not self.is_target or self._hp_above(state, TARGET_EXPLORE_HP)):
+            return min(untried, key=lambda move: counts[move])
+        if not self.is_target:
+            # Most damage ends the battle soonest; the capture chance rises with damage, so it ranks moves when the HP is unread
+            return max(range(self.moves), key=lambda move: (estimates[move][1] or 0.0, estimates[move][2] or 0.0))
+
+        def damage(move):
+            value = estimates[move][1]
+            return DEFAULT_MOVE_DAMAGE if value is None else value
+
+        def safe_move(move):
+            if state.hp is not None:
+                return state.hp - damage(move) >= TARGET_MIN_HP
+            return self._hp_above(state, TARGET_MIN_HP, estimates[move][2])
+
+        # Largest step towards the threshold among moves that leave the target standing
+        safe = [move for move in range(self.moves) if safe_move(move)]
+        if not safe:
+            return min(range(self.moves), key=lambda move: (damage(move), estimates[move][2] or 0.0))
+        return max(safe, key=lambda move: (estimates[move][2] or 0.0, damage(move)))
+
+    def observe(self, move, before, after):
+        damage = None
+        if before.hp is not None and after.hp is not None:
+            # Heals between turns show up as negative damage; they say nothing about the move
+            damage = max(0.0, before.hp - after.hp)
+        capture_gain = None
+        if before.capture_percent and after.capture_percent:
+            capture_gain = after.capture_percent - before.capture_percent
+        if damage is not None or capture_gain is not None:
+            self.stats.add(self._key(), move, damage, capture_gain)
+
+    def finish_battle(self):
+        try:
+            self.stats.save()
+        except OSError as e:
+            print(f"Could not save move statistics to {self.stats.path}: {e}")
+
+
+# Shared by every battle engine (and window), so no engine saves over another's observations
+MOVE_STATS = MoveStats()
+POLICIES = {'first': FirstMovePolicy, 'learned': LearnedMovePolicy}
+
+
+def create_policy(name=MOVE_POLICY, moves=MOVE_COUNT):
+    """Build a move policy by name: 'first' or 'learned'."""
+    if name not in POLICIES:
+        raise ValueError(f"Unknown move policy: {name}")
+    return POLICIES[name](moves)
+
+
+# =====================
+# Offline evaluation
+# =====================
+class BattleSimulator:
+    """Simulated battles for evaluating a policy offline.
+
+    Each move removes a noisy fraction of the enemy's HP, and the capture % rises linearly
+    from base_capture at full HP to 100 at zero HP. A target is won once the capture %
+    passes the threshold with the enemy still standing; any other battle ends at a knock-out.
+    """
+
+    def __init__(self, move_damage=(0.08, 0.15, 0.25, 0.4), noise=0.25, base_capture=30, hp_visible=True, seed=None):
+        self.move_damage = move_damage
+        # False hides the HP from the policy, as when the HP bar cannot be read
+        self.hp_visible = hp_visible
+        self.noise = noise
+        self.base_capture = base_capture
+        self.random = random.Random(seed)
+
+    def capture_percent(self, hp):
+        return int(self.base_capture + (100 - self.base_capture) * (1 - hp))
+
+    def run(self, policy, species='Simulated', is_target=True, threshold=85, max_turns=50):
+        """Fight one battle. Returns (turns, outcome) with outcome 'capture', 'knocked_out', 'defeated' or 'timeout'."""
+        policy.start_battle(species, is_target, threshold)
+        hp = 1.0
+        state = BattleState(self.capture_percent(hp), hp if self.hp_visible else None, 0)
+        outcome = 'timeout'
+        for turn in range(1, max_turns + 1):
+            if is_target and state.capture_percent > threshold:
+                outcome = 'capture'
+                break
+            move = policy.choose(state)
+            damage = self.move_damage[move] * self.random.uniform(1 - self.noise, 1 + self.noise)
+            hp = max(0.0, hp - damage)
+            after = BattleState(self.capture_percent(hp), hp if self.hp_visible else None, turn)
+            policy.observe(move, state, after)
+            state = after
+            if hp <= 0:
+                outcome = 'knocked_out' if is_target else 'defeated'
+                break
+        policy.finish_battle()
+        return state.turn, outcome
+
+    def evaluate(self, policy, battles=200, target_share=0.5, species=1):
+        """Run battles against species kinds of enemy and return mean turns per target and non-target battle,
+        and the share of targets knocked out."""
+        target_turns, other_turns, knocked_out = [], [], 0
+        for _ in range(battles):
+            is_target = self.random.random() < target_share
+            turns, outcome = self.run(policy, f'Simulated {self.random.randrange(species)}', is_target=is_target)
+            (target_turns if is_target else other_turns).append(turns)
+            knocked_out += outcome == 'knocked_out'
+        return {
+            'target_turns': sum(target_turns) / len(target_turns) if target_turns else None,
+            'other_turns': sum(other_turns) / len(other_turns) if other_turns else None,
+            'knockout_rate': knocked_out / len(target_turns) if target_turns else None,
+        }
+
+
+if __name__ == '__main__':
+    # python move_policy.py [battles] [species] [--no-hp]: compare the policies on simulated battles (learned stats are not saved)
+    args = [arg for arg in sys.argv[1:] if arg != '--no-hp']
+    battles = int(args[0]) if args else 500
+    species = int(args[1]) if len(args) > 1 else 1
+    for name, policy in (('first', FirstMovePolicy()), ('learned', LearnedMovePolicy(stats=MoveStats(path=None)))):
+        result = BattleSimulator(hp_visible='--no-hp' not in sys.argv, seed=1).evaluate(policy, battles, species=species)
+        print(f"{name}: {result['target_turns']:.1f} turns per target, {result['other_turns']:.1f} per other battle, "
+              f"{result['knockout_rate'] * 100:.0f}% of targets knocked out")
@@ -0,0 +1,306 @@
+"""Farms several game windows at once from one process.
+
+MULTI_WINDOW = True in autofarm.py (or `python multi_window.py`) finds up to MAX_WINDOWS windows
+titled GAME_WINDOW_TITLE and runs one state machine per window. Each window is captured and
+clicked relative to its game area (set CLIENT_AREA_OFFSET if the title bar and border are
+included), so the bot's screen coordinates apply to every window. Capture, matching and OCR run
+in parallel per window while one MouseScheduler serializes clicks.
+
+Windows are captured from the screen, so they must be tiled without overlapping and kept clear
+of other windows; farming refuses to start if two game windows overlap.
+
+    python multi_window.py --fake <frames dir or .msr> <frames dir or .msr> ... [--transitions N]
+"""
+import asyncio
+import sys
+import threading
+import time
+from battle_engine import BattleEngine
+from farm_state_machine import FarmStateMachine, FarmState
+from metrics import METRICS
+from mouse_control import RecordingMouse, bind_mouse, get_mouse
+from move_policy import create_policy
+from screen_capture import CaptureBackend, Frame, ReplayCapture, bind_capture_backend, create_capture_backend
+from session_recorder import RecordingCapture, RECORDING_SUFFIX
+
+# Windows whose title contains this are driven
+GAME_WINDOW_TITLE = 'Miscrits'
+# Most windows to drive at once; extra matches are ignored
+MAX_WINDOWS = 4
+# (x, y) from a window's outer corner to its game area, e.g. (8, 31) for a bordered window on Windows
+CLIENT_AREA_OFFSET = (0, 0)
+# Bring a window to the front before clicking in it when the previous click went to another window
+ACTIVATE_BEFORE_CLICK = True
+
+
+class FakeWindow:
+    """Stands in for a pygetwindow window in tests and replays."""
+
+    def __init__(self, title, left, top, width, height):
+        self.title = title
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.activations = 0
+
+    def activate(self):
+        self.activations += 1
+
+
+def find_game_windows(title=GAME_WINDOW_TITLE, limit=MAX_WINDOWS):
+    """Return up to limit visible, non-minimised windows whose title contains title, top-left first."""
+    import pygetwindow
+    windows = [window for window in pygetwindow.getWindowsWithTitle(title)
+               if window.width > 0 and window.height > 0 and not window.isMinimized]
+    windows.sort(key=lambda window: (window.top, window.left))
+    return windows[:limit]
+
+
+def overlapping_windows(windows):
+    """Return the (window, window) pairs whose outer rectangles overlap.
+
+    Windows are captured from the screen, so a window partly covered by another reads the other's pixels.
+    """
+    pairs = []
+    for index, first in enumerate(windows):
+        for second in windows[index + 1:]:
+            if (first.left < second.left + second.width and second.left < first.left + first.width
+                    and first.top < second.top + second.height and second.top < first.top + first.height):
+                pairs.append((first, second))
+    return pairs
+
+
+def window_origin(window):
+    """Screen position of the window's game area."""
+    return window.left + CLIENT_AREA_OFFSET[0], window.top + CLIENT_AREA_OFFSET[1]
+
+
+class WindowCapture(CaptureBackend):
+    """Captures one game window, in coordinates relative to its game area.
+
+    Frames are positioned in window coordinates, so the bot's screen constants, Frame.region
+    and the search windows apply unchanged to every window. The window's position is read on
+    every grab, so moving a window is picked up.
+    """
+
+    name = 'window'
+
+    def __init__(self, window, backend=None):
+        super().__init__()
+        self.window = window
+        # One screen backend per window, so windows never recycle each other's buffers
+        self.backend = backend or create_capture_backend()
+
+    def screen_size(self):
+        return self.window.width - CLIENT_AREA_OFFSET[0], self.window.height - CLIENT_AREA_OFFSET[1]
+
+    def grab(self, bbox=None):
+        if bbox is None:
+            width, height = self.screen_size()
+            bbox = (0, 0, width, height)
+        x, y, w, h = bbox
+        left, top = window_origin(self.window)
+        frame = self.backend.grab((left + x, top + y, w, h))
+        self.frames_captured += 1
+        return Frame(frame.image, x, y)
+
+
+class MouseScheduler:
+    """Serializes clicks from every window's action thread onto the one real mouse.
+
+    Only the move and click hold the lock; the waits that follow a click run on the
+    window's own action thread, so other windows keep clicking meanwhile.
+    """
+
+    def __init__(self, mouse=None, activate=ACTIVATE_BEFORE_CLICK):
+        self.mouse = mouse or get_mouse()
+        self.activate = activate
+        self._lock = threading.Lock()
+        self._last_window = None
+        self.clicks = 0
+
+    def click(self, window, x, y, duration=0.2, clicks=1):
+        """Click the window-relative (x, y) once no other window is clicking."""
+        requested = time.monotonic()
+        with self._lock:
+            METRICS.observe('mouse_wait_seconds', time.monotonic() - requested)
+            if self.activate and window is not self._last_window:
+                try:
+                    window.activate()
+                except Exception as e:
+                    print(f"Could not activate window {window.title}: {e}")
+                self._last_window = window
+            left, top = window_origin(window)
+            self.mouse.click(left + x, top + y, duration, clicks)
+            self.clicks += 1
+
+
+class WindowMouse:
+    """Mouse backend for one window: clicks go through the shared MouseScheduler."""
+
+    def __init__(self, window, scheduler):
+        self.window = window
+        self.scheduler = scheduler
+
+    def click(self, x, y, duration=0.2, clicks=1):
+        self.scheduler.click(self.window, x, y, duration, clicks)
+
+
+class FarmWindow:
+    """One game window with its own capture, mouse, battle engine and state machine.
+
+    The template registry, search windows, OCR service and debug writer are module-level and
+    therefore shared by every window.
+    """
+
+    def __init__(self, farm, window, scheduler, backend=None, targets=None, platinum=None, **machine_options):
+        self.window = window
+        self.capture = WindowCapture(window, backend)
+        self.mouse = WindowMouse(window, scheduler)
+        self.battle_engine = BattleEngine(farm.TARGET_MISCRITS if targets is None else targets,
+                                          farm.PLATINUM_TRAINING if platinum is None else platinum)
+        self.machine = FarmStateMachine(farm, self.battle_engine, thread_setup=self.bind, **machine_options)
+
+    def bind(self):
+        """Route the calling thread's captures and clicks to this window."""
+        bind_capture_backend(self.capture)
+        bind_mouse(self.mouse)
+
+    def encounters(self):
+        """Number of battles started in this window so far."""
+        return sum(1 for _, from_state, to_state, _ in self.machine.transitions
+                   if from_state == FarmState.AWAIT_BATTLE and to_state == FarmState.MY_TURN)
+
+
+class MultiWindowFarm:
+    """Runs one farm state machine per game window on a single event loop.
+
+    Capture, matching and OCR run on each window's analysis threads in parallel (cv2 and
+    Tesseract release the GIL); clicks are serialized by one MouseScheduler. farm is the
+    autofarm module, as for FarmStateMachine.
+    """
+
+    def __init__(self, farm, windows, scheduler=None, backend=None, **machine_options):
+        overlaps = overlapping_windows(windows)
+        if overlaps:
+            raise ValueError("Game windows overlap, so captures would read the wrong window: "
+                             + ', '.join(f"'{first.title}' and '{second.title}'" for first, second in overlaps))
+        self.scheduler = scheduler or MouseScheduler()
+        self.windows = [FarmWindow(farm, window, self.scheduler, backend, **machine_options) for window in windows]
+        self.started = None
+
+    async def run(self, max_transitions=None):
+        """Run every window until cancelled, or until each has made max_transitions state changes."""
+        self.started = time.monotonic()
+        await asyncio.gather(*(window.machine.run(max_transitions) for window in self.windows))
+
+    def close(self):
+        for window in self.windows:
+            window.machine.close()
+
+    def report(self):
+        """Print encounters per hour for each window and in total."""
+        elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+        hours = elapsed / 3600
+        total = 0
+        for window in self.windows:
+            encounters = window.encounters()
+            total += encounters
+            rate = f"{encounters / hours:.1f}/h" if hours else '-'
+            print(f"{window.window.title}: {encounters} encounters ({rate})")
+            window.machine.report()
+        rate = f"{total / hours:.1f}/h" if hours else '-'
+        print(f"{len(self.windows)} windows: {total} encounters in {elapsed:.0f}s ({rate}), {self.scheduler.clicks} clicks")
+
+
+class FakeDesktop(CaptureBackend):
+    """A virtual screen tiling one frame source per FakeWindow, for running several windows without a display."""
+
+    name = 'fake_desktop'
+
+    def __init__(self, windows_and_sources):
+        super().__init__()
+        self.windows_and_sources = list(windows_and_sources)
+
+    def screen_size(self):
+        return (max(window.left + window.width for window, _ in self.windows_and_sources),
+                max(window.top + window.height for window, _ in self.windows_and_sources))
+
+    def grab(self, bbox=None):
+        x, y, w, h = bbox
+        for window, source in self.windows_and_sources:
+            left, top = window_origin(window)
+            if left <= x and top <= y and x + w <= left + window.width and y + h <= top + window.height:
+                self.frames_captured += 1
+                return Frame(source.grab((x - left, y - top, w, h)).image, x, y)
+        raise ValueError(f"No fake window covers {bbox}")
+
+
+def run_fake(sources, max_transitions=20, cooldown=0):
+    """Drive one fake window per frames directory or session recording, side by side, with a recording mouse.
+
+    Returns (farm, clicks) with clicks in desktop coordinates.
+    """
+    # Imported here so autofarm.py can import this module while running as __main__
+    import autofarm
+    backends = [RecordingCapture(source) if source.endswith(RECORDING_SUFFIX) else ReplayCapture(source) for source in sources]
+    windows = []
+    left = 0
+    for index, backend in enumerate(backends):
+        width, height = backend.screen_size()
+        windows.append(FakeWindow(f'{GAME_WINDOW_TITLE} {index + 1}', left, 0, width + CLIENT_AREA_OFFSET[0], height + CLIENT_AREA_OFFSET[1]))
+        left += width + CLIENT_AREA_OFFSET[0]
+    desktop = FakeDesktop(zip(windows, backends))
+    mouse = RecordingMouse()
+    multi = MultiWindowFarm(autofarm, windows, MouseScheduler(mouse), desktop, cooldown=cooldown)
+    for window in multi.windows:
+        window.machine.scheduler.stats_path = None
+        window.battle_engine.policy = create_policy('first')
+    try:
+        asyncio.run(multi.run(max_transitions))
+    finally:
+        multi.close()
+    return multi, mouse.clicks
+
+
+def run_windows(farm, windows=None):
+    """Farm every discovered game window with the autofarm module's settings until interrupted."""
+    windows = find_game_windows() if windows is None else windows
+    if not windows:
+        print(f"No windows titled '{GAME_WINDOW_TITLE}' found.")
+        return
+    print(f"Farming {len(windows)} windows: {[window.title for window in windows]}")
+    try:
+        multi = MultiWindowFarm(farm, windows)
+    except ValueError as e:
+        print(f"{e}. Tile the windows side by side so none covers another, then start again.")
+        return
+    try:
+        asyncio.run(multi.run())
+    except KeyboardInterrupt:
+        print("\nFarming stopped by user.")
+    finally:
+        multi.close()
+        multi.report()
+
+
+if __name__ == '__main__':
+    # python multi_window.py                                   farm every game window
+    # python multi_window.py --fake <source> [<source> ...] [--transitions N]
+    args = sys.argv[1:]
+    if args and args[0] == '--fake':
+        transitions = 20
+        if '--transitions' in args:
+            transitions = int(args[args.index('--transitions') + 1])
+            del args[args.index('--transitions'):args.index('--transitions') + 2]
+        multi, clicks = run_fake(args[1:], transitions)
+        multi.report()
+        for window in multi.windows:
+            left, top = window_origin(window.window)
+            inside = [(x, y) for _, x, y, _ in clicks
+                      if left <= x < left + window.window.width and top <= y < top + window.window.height]
+            print(f"{window.window.title}: {len(inside)} clicks {inside}")
+    else:
+        import autofarm
+        run_windows(autofarm)
@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from metrics import METRICS
+
+# tesserocr (optional, see requirements.txt) keeps a Tesseract engine loaded per worker; without it each call spawns tesseract via pytesseract
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Number of long-lived recognizer workers
+OCR_WORKERS = 2
+# Maximum number of distinct (pixels, config) results kept by the OCR cache
+OCR_CACHE_SIZE = 256
+
+# A screen region to recognise: psm is the Tesseract page segmentation mode, whitelist limits the characters
+OcrRegion = namedtuple('OcrRegion', ['name', 'x', 'y', 'w', 'h', 'psm', 'whitelist'], defaults=[7, None])
+
+
+class OcrResultCache:
+    """Bounded LRU cache of OCR results keyed on a hash of the region's pixels plus the OCR config."""
+
+    def __init__(self, maxsize=OCR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image, psm, whitelist):
+        """Build the cache key for a cropped PIL image and OCR config."""
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+        return digest, image.size, image.mode, psm, whitelist
+
+    def get(self, key):
+        """Return the cached text for key, or None on a miss."""
+        with self._lock:
+            text = self._results.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        """Store a result, evicting the least recently used entry when full."""
+        with self._lock:
+            self._results[key] = text
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached result."""
+        with self._lock:
+            self._results.clear()
+
+    def resize(self, maxsize):
+        """Change the cache bound, evicting the least recently used results if needed. 0 disables caching."""
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results), 'maxsize': self.maxsize,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+class OcrService:
+    """Pool of OCR worker threads, each keeping its own Tesseract engine loaded (with tesserocr)."""
+
+    def __init__(self, workers=OCR_WORKERS, cache_size=OCR_CACHE_SIZE):
+        self.workers = workers
+        self.cache = OcrResultCache(cache_size)
+        self.backend = 'tesserocr' if tesserocr is not None else 'pytesseract'
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr')
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+        self._warned = False
+
+    def _worker_api(self):
+        """Return this worker thread's Tesseract engine, creating it on first use."""
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI()
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def _recognize(self, image, psm, whitelist):
+        """Run OCR on an already cropped PIL image. Executes on a worker thread."""
+        if tesserocr is not None:
+            api = self._worker_api()
+            api.SetPageSegMode(psm)
+            api.SetVariable('tessedit_char_whitelist', whitelist or '')
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+        else:
+            import pytesseract
+            if not self._warned:
+                self._warned = True
+                print("Warning: tesserocr is not installed; every OCR call starts a tesseract process (see requirements.txt)")
+            config = f'--psm {psm}'
+            if whitelist:
+                config += f' -c tessedit_char_whitelist={whitelist}'
+            text = pytesseract.image_to_string(image, config=config)
+        return text.strip().lower()
+
+    def _record_latency(self, started, source):
+        latency = time.perf_counter() - started
+        METRICS.observe('ocr_seconds', latency, source=source)
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+
+    def recognize(self, image, psm=7, whitelist=None):
+        """Recognise text in one cropped image and return it stripped and lower-cased. Identical pixels are served from the cache."""
+        started = time.perf_counter()
+        key = self.cache.key(image, psm, whitelist)
+        text = self.cache.get(key)
+        source = 'cache'
+        if text is None:
+            text = self._executor.submit(self._recognize, image, psm, whitelist).result()
+            self.cache.put(key, text)
+            source = 'tesseract'
+        self._record_latency(started, source)
+        return text
+
+    def recognize_batch(self, screenshot, regions):
+        """Recognise several OcrRegions of one screenshot in parallel. Returns {name: (text, region_image)}.
+
+        Every uncached region is submitted before any result is awaited, so the workers read them concurrently.
+        """
+        started = time.perf_counter()
+        results, pending = {}, {}
+        for region in regions:
+            region_image = screenshot.crop((region.x, region.y, region.x + region.w, region.y + region.h))
+            key = self.cache.key(region_image, region.psm, region.whitelist)
+            text = self.cache.get(key)
+            if text is not None:
+                results[region.name] = (text, region_image)
+            else:
+                pending[region.name] = (key, region_image, self._executor.submit(self._recognize, region_image, region.psm, region.whitelist))
+        for name, (key, region_image, future) in pending.items():
+            text = future.result()
+            self.cache.put(key, text)
+            results[name] = (text, region_image)
+        self._record_latency(started, 'tesseract' if pending else 'cache')
+        return results
+
+    def latency_stats(self):
+        """Return call count and mean/max/last latency in seconds."""
+        with self._lock:
+            mean_latency = self.total_latency / self.calls if self.calls else 0.0
+            return {'calls': self.calls, 'mean': mean_latency, 'max': self.max_latency, 'last': self.last_latency}
+
+    def report(self):
+        """Print a one-line OCR latency summary."""
+        stats = self.latency_stats()
+        cache_stats = self.cache.stats()
+        print(f"OCR ({self.backend}, {self.workers} workers): {stats['calls']} calls, mean {stats['mean'] * 1000:.1f} ms, max {stats['max'] * 1000:.1f} ms, "
+              f"cache {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+
+    def close(self):
+        """Stop the workers and release their Tesseract engines."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis.clear()
+
+
+# Shared service used by utils.extract_text_from_screen_region(s)
+OCR = OcrService()
@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+import cv2
+import numpy as np
+from PIL import Image
+from metrics import METRICS
+
+# 'auto' picks mss when installed, otherwise pyautogui; 'replay' needs CAPTURE_REPLAY_SOURCE (a frames directory or a session recording)
+CAPTURE_BACKEND = 'auto'
+CAPTURE_REPLAY_SOURCE = 'screenshots'
+# Each backend cycles through this many buffers per capture size, so the last few frames stay valid
+CAPTURE_BUFFER_COUNT = 2
+# Replays follow the recorded timestamps at this speed; frames without timestamps are this many seconds apart
+REPLAY_SPEED = 1.0
+REPLAY_FRAME_INTERVAL = 1.0
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+
+class Frame:
+    """A captured BGR image plus the screen position of its top-left pixel.
+
+    crop() takes a PIL-style (left, top, right, bottom) box in screen coordinates and
+    returns a PIL image, so a Frame can be passed wherever a pyautogui screenshot was.
+    """
+
+    def __init__(self, image, left=0, top=0):
+        self.image = image
+        self.left = left
+        self.top = top
+
+    @property
+    def size(self):
+        """(width, height), matching PIL's Image.size."""
+        return self.image.shape[1], self.image.shape[0]
+
+    def region(self, x, y, w, h):
+        """Return a BGR view of a region given in screen coordinates."""
+        x -= self.left
+        y -= self.top
+        return self.image[y:y + h, x:x + w]
+
+    def crop(self, box):
+        """Return the (left, top, right, bottom) screen box as an RGB PIL image."""
+        left, top, right, bottom = box
+        return Image.fromarray(np.ascontiguousarray(self.region(left, top, right - left, bottom - top)[:, :, ::-1]))
+
+
+def union_bbox(regions):
+    """Return the (x, y, w, h) box covering every (x, y, w, h) region."""
+    regions = list(regions)
+    left = min(x for x, _, _, _ in regions)
+    top = min(y for _, y, _, _ in regions)
+    right = max(x + w for x, _, w, _ in regions)
+    bottom = max(y + h for _, y, _, h in regions)
+    return left, top, right - left, bottom - top
+
+
+class CaptureBackend:
+    """Base class for screen grabbers that write into reusable NumPy buffers."""
+
+    name = 'base'
+
+    def __init__(self, buffer_count=CAPTURE_BUFFER_COUNT):
+        self.buffer_count = buffer_count
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self.frames_captured = 0
+
+    def _next_buffer(self, height, width):
+        """Return the next preallocated (height, width, 3) buffer for this size."""
+        with self._lock:
+            ring = self._buffers.get((height, width))
+            if ring is None:
+                ring = [[np.empty((height, width, 3), dtype=np.uint8) for _ in range(self.buffer_count)], 0]
+                self._buffers[(height, width)] = ring
+            buffers, index = ring
+            ring[1] = (index + 1) % len(buffers)
+            self.frames_captured += 1
+            return buffers[index]
+
+    def screen_size(self):
+        raise NotImplementedError
+
+    def _grab_into(self, left, top, width, height, out):
+        raise NotImplementedError
+
+    def grab(self, bbox=None):
+        """Capture the (x, y, w, h) box, or the whole screen, and return it as a Frame."""
+        if bbox is None:
+            width, height = self.screen_size()
+            bbox = (0, 0, width, height)
+        left, top, width, height = bbox
+        out = self._next_buffer(height, width)
+        with METRICS.timer('capture_seconds', backend=self.name):
+            self._grab_into(left, top, width, height, out)
+        return Frame(out, left, top)
+
+    def grab_regions(self, regions):
+        """Capture only the union of several (x, y, w, h) regions. Use Frame.region/crop with screen coordinates."""
+        return self.grab(union_bbox(regions))
+
+
+class PyAutoGuiCapture(CaptureBackend):
+    """pyautogui screenshots, converted to BGR straight into the reusable buffer."""
+
+    name = 'pyautogui'
+
+    def __init__(self, buffer_count=CAPTURE_BUFFER_COUNT):
+        super().__init__(buffer_count)
+        import pyautogui
+        self._pyautogui = pyautogui
+
+    def screen_size(self):
+        return tuple(self._pyautogui.size())
+
+    def _grab_into(self, left, top, width, height, out):
+        screenshot = self._pyautogui.screenshot(region=(left, top, width, height))
+        cv2.cvtColor(np.asarray(screenshot), cv2.COLOR_RGB2BGR, dst=out)
+
+
+class MssCapture(CaptureBackend):
+    """mss grabber (XGetImage/MIT-SHM on X11, BitBlt on Windows); one mss handle per thread."""
+
+    name = 'mss'
+
+    def __init__(self, buffer_count=CAPTURE_BUFFER_COUNT):
+        super().__init__(buffer_count)
+        self._local = threading.local()
+
+    def _sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def screen_size(self):
+        monitor = self._sct().monitors[1]
+        return monitor['width'], monitor['height']
+
+    def _grab_into(self, left, top, width, height, out):
+        shot = self._sct().grab({'left': left, 'top': top, 'width': width, 'height': height})
+        # mss returns BGRA; dropping alpha is the only copy made
+        np.copyto(out, np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)[:, :, :3])
+
+
+class ReplayClock:
+    """Maps time since the first read onto recorded timestamps, so a replay shows each frame for as long as it was
+    on screen however many grabs are made of it."""
+
+    def __init__(self, timestamps, loop=True, speed=REPLAY_SPEED):
+        self.offsets = [timestamp - timestamps[0] for timestamp in timestamps]
+        self.loop = loop
+        self.speed = speed
+        # The last frame is shown for the mean frame interval before a loop starts over
+        self.period = self.offsets[-1] * len(self.offsets) / (len(self.offsets) - 1) if len(self.offsets) > 1 else 0.0
+        self._started = None
+
+    def _elapsed(self):
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now
+        return (now - self._started) * self.speed
+
+    def index(self):
+        """Return the index of the frame on screen now."""
+        elapsed = self._elapsed()
+        if self.loop and self.period > 0:
+            elapsed %= self.period
+        return bisect_right(self.offsets, elapsed) - 1
+
+    def seek(self, index):
+        """Restart the clock so frame index is on screen now."""
+        self._started = time.monotonic() - self.offsets[index] / self.speed
+
+
+class ReplayCapture(CaptureBackend):
+    """Serves recorded frames (a directory of images or a list of arrays) instead of the screen, for tests and benchmarks.
+
+    With realtime the frames follow timestamps (default: REPLAY_FRAME_INTERVAL apart), otherwise only advance() moves on.
+    """
+
+    name = 'replay'
+
+    def __init__(self, source=CAPTURE_REPLAY_SOURCE, loop=True, realtime=True, timestamps=None, speed=REPLAY_SPEED,
+                 buffer_count=CAPTURE_BUFFER_COUNT):
+        super().__init__(buffer_count)
+        if isinstance(source, str):
+            paths = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+            frames = [cv2.imread(path, cv2.IMREAD_COLOR) for path in paths]
+            # Keep only full-size frames; region crops in the same directory are skipped
+            frames = [frame for frame in frames if frame is not None]
+            largest = max(frame.shape[:2] for frame in frames)
+            self.frames = [frame for frame in frames if frame.shape[:2] == largest]
+        else:
+            self.frames = list(source)
+        self.loop = loop
+        self.index = 0
+        if timestamps is None:
+            timestamps = [index * REPLAY_FRAME_INTERVAL for index in range(len(self.frames))]
+        self.clock = ReplayClock(timestamps, loop, speed) if realtime else None
+
+    def screen_size(self):
+        return self.frames[0].shape[1], self.frames[0].shape[0]
+
+    def current(self):
+        """Return the full recorded frame that grabs are currently served from."""
+        if self.clock is not None:
+            self.index = self.clock.index()
+        return self.frames[min(self.index, len(self.frames) - 1)]
+
+    def advance(self):
+        """Move to the next recorded frame. Returns False once exhausted when not looping."""
+        if self.clock is not None:
+            self.index = self.clock.index()
+        self.index += 1
+        if self.index >= len(self.frames):
+            if not self.loop:
+                self.index = len(self.frames) - 1
+                return False
+            self.index = 0
+        if self.clock is not None:
+            self.clock.seek(self.index)
+        return True
+
+    def _grab_into(self, left, top, width, height, out):
+        np.copyto(out, self.current()[top:top + height, left:left + width])
+
+
+def create_capture_backend(name=CAPTURE_BACKEND):
+    """Build a capture backend by name: 'auto', 'mss', 'pyautogui' or 'replay'."""
+    if name == 'auto':
+        name = 'mss' if mss is not None else 'pyautogui'
+    if name == 'mss':
+        return MssCapture()
+    if name == 'pyautogui':
+        return PyAutoGuiCapture()
+    if name == 'replay':
+        if CAPTURE_REPLAY_SOURCE.endswith('.msr'):
+            # session_recorder imports this module, so it is only loaded when needed
+            from session_recorder import RecordingCapture
+            return RecordingCapture(CAPTURE_REPLAY_SOURCE)
+        return ReplayCapture()
+    raise ValueError(f"Unknown capture backend: {name}")
+
+
+# Shared backend used by utils.capture_frame and convert_screenshot_to_bgr, created on first use
+_capture = None
+_capture_lock = threading.Lock()
+# Per-thread overrides, so each game window's threads capture from that window (see multi_window.py)
+_thread_capture = threading.local()
+
+
+def get_capture_backend():
+    """Return this thread's bound capture backend, else the shared one (creating the CAPTURE_BACKEND one on first use)."""
+    global _capture
+    backend = getattr(_thread_capture, 'backend', None)
+    if backend is not None:
+        return backend
+    with _capture_lock:
+        if _capture is None:
+            _capture = create_capture_backend()
+        return _capture
+
+
+def set_capture_backend(backend):
+    """Replace the shared capture backend (e.g. with a ReplayCapture to run without a display). Returns the one replaced."""
+    global _capture
+    with _capture_lock:
+        previous, _capture = _capture, backend
+    return previous
+
+
+def bind_capture_backend(backend):
+    """Make backend the calling thread's capture backend, overriding the shared one; None removes the binding."""
+    _thread_capture.backend = backend
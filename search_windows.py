@@ -0,0 +1,114 @@
+import time
+import cv2
+from template_registry import template_key
+
+# Pixels added around the last match location when searching the window first
+SEARCH_WINDOW_PADDING = 40
+# After a window miss, the whole frame is searched again at most this often per template (seconds),
+# so polling for an absent template mostly costs the window match. A template that moved out of its
+# window is found up to this late; 0 searches the whole frame on every miss
+FULL_SEARCH_INTERVAL = 0.5
+
+
+class SpatialPriorIndex:
+    """Remembers where each template last matched and searches a padded window there first."""
+
+    def __init__(self, padding=SEARCH_WINDOW_PADDING, full_search_interval=FULL_SEARCH_INTERVAL):
+        self.padding = padding
+        self.full_search_interval = full_search_interval
+        self._locations = {}
+        # Templates that only ever appear at their seeded location and are never searched for elsewhere
+        self._fixed = set()
+        self._last_full_search = {}
+        self.hits = 0
+        self.misses = 0
+        self.full_searches = 0
+        self._per_template = {}
+
+    def seed(self, template_path, location, fixed=False):
+        """Prime the index with a known top-left location, e.g. a hardcoded UI position.
+
+        A fixed template is only searched for in the window around that location.
+        """
+        key = template_key(template_path)
+        self._locations[key] = tuple(location)
+        if fixed:
+            self._fixed.add(key)
+        else:
+            self._fixed.discard(key)
+
+    def forget(self, template_path=None):
+        """Drop the remembered location for one template, or for all of them."""
+        if template_path is None:
+            self._locations.clear()
+            self._fixed.clear()
+        else:
+            self._locations.pop(template_key(template_path), None)
+            self._fixed.discard(template_key(template_path))
+
+    def _count(self, key, field):
+        counts = self._per_template.setdefault(key, {'hits': 0, 'misses': 0, 'full_searches': 0})
+        counts[field] += 1
+
+    def match(self, template_path, screenshot_bgr, template, threshold=0.7):
+        """Match template against the screenshot, window first. Returns (max_val, max_loc, (h, w)).
+
+        A match counts when max_val > threshold, as in utils.find_template_on_screen.
+        """
+        key = template_key(template_path)
+        template_h, template_w = template.shape[:2]
+        frame_h, frame_w = screenshot_bgr.shape[:2]
+        last = self._locations.get(key)
+        if last is not None:
+            x0 = max(0, last[0] - self.padding)
+            y0 = max(0, last[1] - self.padding)
+            x1 = min(frame_w, last[0] + template_w + self.padding)
+            y1 = min(frame_h, last[1] + template_h + self.padding)
+            if x1 - x0 >= template_w and y1 - y0 >= template_h:
+                window = screenshot_bgr[y0:y1, x0:x1]
+                result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+                _, max_val, _, max_loc = cv2.minMaxLoc(result)
+                if max_val > threshold:
+                    self.hits += 1
+                    self._count(key, 'hits')
+                    location = (max_loc[0] + x0, max_loc[1] + y0)
+                    self._locations[key] = location
+                    return max_val, location, (template_h, template_w)
+                self.misses += 1
+                self._count(key, 'misses')
+                # An absent template is the usual case when polling; don't pay for a full search every call
+                recent = time.monotonic() - self._last_full_search.get(key, float('-inf')) < self.full_search_interval
+                if key in self._fixed or recent:
+                    return max_val, (max_loc[0] + x0, max_loc[1] + y0), (template_h, template_w)
+            else:
+                self.misses += 1
+                self._count(key, 'misses')
+
+        # Fall back to searching the whole frame
+        self._last_full_search[key] = time.monotonic()
+        self.full_searches += 1
+        self._count(key, 'full_searches')
+        result = cv2.matchTemplate(screenshot_bgr, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if max_val > threshold:
+            self._locations[key] = max_loc
+        return max_val, max_loc, (template_h, template_w)
+
+    def stats(self):
+        """Return hit/miss counters overall and per template."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'full_searches': self.full_searches,
+            'per_template': {key: dict(counts) for key, counts in self._per_template.items()},
+        }
+
+    def report(self):
+        """Print a one-line summary of window hits and misses."""
+        lookups = self.hits + self.full_searches
+        hit_rate = self.hits / lookups if lookups else 0.0
+        print(f"Search windows: {self.hits} hits, {self.misses} misses, {self.full_searches} full-frame searches ({hit_rate:.0%} served from window)")
+
+
+# Shared index used by the template matchers in utils
+SEARCH_WINDOWS = SpatialPriorIndex()
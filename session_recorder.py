@@ -0,0 +1,443 @@
+"""Compact recordings of what the bot saw and did, and a replay backend that plays them back.
+
+With RECORD_SESSION = True in autofarm.py the frames the bot analysed are written to
+recordings/session-*.msr with their timestamps, detector outputs, farm clicks and state
+transitions. In ROI mode only the tracked regions are kept per frame, plus a full frame every
+RECORD_FULL_FRAME_INTERVAL seconds; a replayed grab sees the last full frame with the regions
+recorded since pasted on top.
+
+Replays memory-map the file, serve keyframes without copying and follow the recorded
+timestamps (REPLAY_SPEED in screen_capture.py speeds them up). Recordings can be replayed
+through the bot with `python farm_state_machine.py <file>` or CAPTURE_BACKEND = 'replay', and
+benchmarked with `python benchmark.py <file>`.
+
+    python session_recorder.py info <file>            # chunk counts and sizes
+    python session_recorder.py export <file> <dir>    # full frames as PNGs
+"""
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from collections import namedtuple
+import cv2
+import numpy as np
+from metrics import METRICS
+from screen_capture import CaptureBackend, Frame, ReplayClock, REPLAY_SPEED
+
+RECORDING_DIR = 'recordings'
+RECORDING_SUFFIX = '.msr'
+# A stream stores a raw keyframe after this many deltas, bounding how far a seek has to decode
+RECORD_KEYFRAME_EVERY = 30
+# In ROI mode the whole screen is only stored this often (seconds)
+RECORD_FULL_FRAME_INTERVAL = 5.0
+# Frames waiting for the writer beyond this are dropped rather than slowing the bot
+RECORD_QUEUE_SIZE = 64
+RECORD_ZLIB_LEVEL = 1
+
+FILE_MAGIC = b'MSREC\x00\x01\x00'
+# kind, codec, stream, payload length, timestamp, left, top, width, height, seq
+CHUNK_HEADER = struct.Struct('<cBHIdiiiiI')
+KEYFRAME, DELTA, EVENT = b'K', b'D', b'E'
+CODEC_RAW, CODEC_ZLIB = 0, 1
+# Stream 0 is the full frame; tracked ROIs are streams 1..N in the order given
+FULL_STREAM = 0
+
+ChunkInfo = namedtuple('ChunkInfo', ['kind', 'codec', 'stream', 'offset', 'length', 'timestamp', 'left', 'top', 'width', 'height', 'seq'])
+
+
+class SessionRecorder:
+    """Records frames (or only tracked ROIs plus periodic full frames), detector outputs and actions to a chunked file.
+
+    Each chunk is a fixed header plus payload. Frames are stored per stream as raw keyframes
+    or zlib-compressed XOR deltas against the stream's previous frame; events are JSON.
+    Encoding and writing happen on a background thread, and frames are dropped rather than
+    queued without bound, so recording never blocks the caller.
+    """
+
+    def __init__(self, path, regions=None, keyframe_every=RECORD_KEYFRAME_EVERY, full_frame_interval=RECORD_FULL_FRAME_INTERVAL,
+                 queue_size=RECORD_QUEUE_SIZE):
+        self.path = path
+        self.regions = dict(regions or {})
+        self.keyframe_every = keyframe_every
+        self.full_frame_interval = full_frame_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._previous = {}
+        self._since_keyframe = {}
+        self._seq = 0
+        self._last_full_frame = None
+        self._lock = threading.Lock()
+        self.frames_recorded = 0
+        # A frame counts as dropped when any of its chunks (ROI crops or full frame) could not be queued
+        self.frames_dropped = 0
+        self.events_dropped = 0
+        self.bytes_written = 0
+        self.raw_bytes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'wb')
+        self._file.write(FILE_MAGIC)
+        self._thread = threading.Thread(target=self._run, name='session-recorder', daemon=True)
+        self._thread.start()
+        self.record_event('streams', {'streams': {str(stream): name for stream, name in enumerate(self.regions, start=1)},
+                                      'regions': {name: list(region) for name, region in self.regions.items()}})
+
+    def _next_seq(self):
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def _enqueue(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def record_frame(self, frame, timestamp=None):
+        """Queue a BGR array or screen_capture.Frame. In ROI mode only the tracked regions are kept. Returns the frame's seq."""
+        image = getattr(frame, 'image', frame)
+        left, top = getattr(frame, 'left', 0), getattr(frame, 'top', 0)
+        timestamp = time.time() if timestamp is None else timestamp
+        seq = self._next_seq()
+        queued = True
+        # Copies are taken here because capture buffers are reused
+        if self.regions:
+            for stream, (x, y, w, h) in enumerate(self.regions.values(), start=1):
+                crop = image[y - top:y - top + h, x - left:x - left + w]
+                if crop.shape[:2] == (h, w):
+                    queued = self._enqueue(('frame', seq, timestamp, stream, x, y, crop.copy())) and queued
+            if self._last_full_frame is None or timestamp - self._last_full_frame >= self.full_frame_interval:
+                self._last_full_frame = timestamp
+                queued = self._enqueue(('frame', seq, timestamp, FULL_STREAM, left, top, image.copy())) and queued
+        else:
+            queued = self._enqueue(('frame', seq, timestamp, FULL_STREAM, left, top, image.copy()))
+        self.frames_recorded += 1
+        if not queued:
+            self.frames_dropped += 1
+        return seq
+
+    def record_event(self, kind, data=None, seq=None):
+        """Record a detector output, action or other event dict as JSON, attached to seq (default: the latest frame)."""
+        data = dict(data or {}, type=kind)
+        payload = json.dumps(data, default=str).encode('utf-8')
+        if not self._enqueue(('event', self._seq if seq is None else seq, time.time(), payload)):
+            self.events_dropped += 1
+
+    def _write_chunk(self, kind, codec, stream, payload, timestamp, left, top, width, height, seq):
+        self._file.write(CHUNK_HEADER.pack(kind, codec, stream, len(payload), timestamp, left, top, width, height, seq))
+        self._file.write(payload)
+        self.bytes_written += CHUNK_HEADER.size + len(payload)
+
+    def _write_frame(self, seq, timestamp, stream, left, top, image):
+        height, width = image.shape[:2]
+        previous = self._previous.get(stream)
+        since_keyframe = self._since_keyframe.get(stream, 0)
+        if previous is None or previous.shape != image.shape or since_keyframe >= self.keyframe_every:
+            # Keyframes stay uncompressed so the reader can serve them straight from the memory map
+            self._write_chunk(KEYFRAME, CODEC_RAW, stream, memoryview(np.ascontiguousarray(image)).cast('B'), timestamp, left, top, width, height, seq)
+            self._since_keyframe[stream] = 0
+        else:
+            delta = np.bitwise_xor(image, previous)
+            self._write_chunk(DELTA, CODEC_ZLIB, stream, zlib.compress(delta, RECORD_ZLIB_LEVEL), timestamp, left, top, width, height, seq)
+            self._since_keyframe[stream] = since_keyframe + 1
+        self._previous[stream] = image
+        self.raw_bytes += image.nbytes
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == 'frame':
+                    self._write_frame(*item[1:])
+                else:
+                    _, seq, timestamp, payload = item
+                    self._write_chunk(EVENT, CODEC_RAW, 0, payload, timestamp, 0, 0, 0, 0, seq)
+            except Exception as e:
+                print(f"Error writing session recording {self.path}: {e}")
+
+    def close(self):
+        """Write everything still queued and close the file."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def report(self):
+        """Print how many frames were recorded, how many frames and events were dropped and the achieved compression."""
+        ratio = self.raw_bytes / self.bytes_written if self.bytes_written else 0.0
+        print(f"Session recorder {self.path}: {self.frames_recorded} frames, {self.frames_dropped} dropped, {self.events_dropped} events dropped, "
+              f"{self.bytes_written / 1e6:.1f} MB written ({ratio:.1f}x smaller than raw)")
+
+
+class SessionReader:
+    """Memory-maps a recording. Raw keyframes are served as read-only views of the map; deltas are decoded on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"Not a session recording: {path}")
+        self.chunks = []
+        self.events = []
+        offset = len(FILE_MAGIC)
+        # A recording cut short by a crash simply ends at its last complete chunk
+        while offset + CHUNK_HEADER.size <= len(self._mm):
+            kind, codec, stream, length, timestamp, left, top, width, height, seq = CHUNK_HEADER.unpack_from(self._mm, offset)
+            offset += CHUNK_HEADER.size
+            if offset + length > len(self._mm):
+                break
+            if kind == EVENT:
+                self.events.append((seq, timestamp, json.loads(bytes(self._mm[offset:offset + length]))))
+            else:
+                self.chunks.append(ChunkInfo(kind, codec, stream, offset, length, timestamp, left, top, width, height, seq))
+            offset += length
+        self._streams = {}
+        for index, chunk in enumerate(self.chunks):
+            self._streams.setdefault(chunk.stream, []).append(index)
+        self._stream_seqs = {stream: [self.chunks[index].seq for index in indices] for stream, indices in self._streams.items()}
+        # Every recorded frame, in order; ROI streams and full frames of the same frame share a seq
+        capture_times = {}
+        for chunk in self.chunks:
+            capture_times.setdefault(chunk.seq, chunk.timestamp)
+        self.ticks = sorted(capture_times)
+        self.tick_times = [capture_times[tick] for tick in self.ticks]
+        self._composite = None
+        self._cache = {}
+        self.regions = {}
+        for _, _, event in self.events:
+            if event['type'] == 'streams':
+                self.regions = {name: tuple(region) for name, region in event['regions'].items()}
+
+    def _payload(self, chunk):
+        return memoryview(self._mm)[chunk.offset:chunk.offset + chunk.length]
+
+    def _decode(self, stream, position):
+        """Return the image at position in a stream's chunk list, decoding forward from the nearest keyframe or cached frame."""
+        indices = self._streams[stream]
+        cached = self._cache.get(stream)
+        if cached is not None and cached[0] == position:
+            return cached[1]
+        start = position
+        while self.chunks[indices[start]].kind != KEYFRAME:
+            start -= 1
+        if cached is not None and start <= cached[0] < position:
+            start, image = cached[0] + 1, cached[1]
+        else:
+            chunk = self.chunks[indices[start]]
+            shape = (chunk.height, chunk.width, 3)
+            if chunk.codec == CODEC_RAW:
+                image = np.frombuffer(self._mm, dtype=np.uint8, count=chunk.length, offset=chunk.offset).reshape(shape)
+            else:
+                image = np.frombuffer(zlib.decompress(self._payload(chunk)), dtype=np.uint8).reshape(shape)
+            start += 1
+        for delta_position in range(start, position + 1):
+            chunk = self.chunks[indices[delta_position]]
+            delta = np.frombuffer(zlib.decompress(self._payload(chunk)), dtype=np.uint8).reshape(image.shape)
+            image = np.bitwise_xor(image, delta)
+        self._cache[stream] = (position, image)
+        return image
+
+    def _position(self, stream, tick):
+        """Return the position in a stream's chunk list of its latest frame at or before tick (-1 for none)."""
+        seqs = self._stream_seqs.get(stream)
+        if not seqs:
+            return -1
+        return bisect_right(seqs, tick) - 1
+
+    def frame_at(self, stream, tick, exact=False):
+        """Return the stream's latest Frame at or before tick (only one recorded at tick when exact), or None."""
+        position = self._position(stream, tick)
+        if position < 0 or (exact and self._stream_seqs[stream][position] != tick):
+            return None
+        chunk = self.chunks[self._streams[stream][position]]
+        return Frame(self._decode(stream, position), chunk.left, chunk.top)
+
+    def frames_at(self, tick):
+        """Return [Frame] for every stream as of tick, ROI streams first so they take precedence over a stale full frame."""
+        streams = sorted(self._streams, key=lambda stream: stream == FULL_STREAM)
+        return [frame for frame in (self.frame_at(stream, tick) for stream in streams) if frame is not None]
+
+    def composite_at(self, tick):
+        """Return the full Frame as of tick with every ROI recorded after it pasted on top, or None.
+
+        In ROI mode the full frame can be RECORD_FULL_FRAME_INTERVAL old; the pasted ROIs are what
+        changed since. The result is cached for the tick and shares no memory with the decoded streams.
+        """
+        if self._composite is not None and self._composite[0] == tick:
+            return self._composite[1]
+        position = self._position(FULL_STREAM, tick)
+        if position < 0:
+            return None
+        full = self.chunks[self._streams[FULL_STREAM][position]]
+        image = self._decode(FULL_STREAM, position)
+        copied = False
+        for stream in self._streams:
+            roi_position = self._position(stream, tick) if stream != FULL_STREAM else -1
+            if roi_position < 0:
+                continue
+            chunk = self.chunks[self._streams[stream][roi_position]]
+            # An ROI from the full frame's own seq (or earlier) is already in it
+            if chunk.seq <= full.seq:
+                continue
+            if not copied:
+                image = image.copy()
+                copied = True
+            x, y = chunk.left - full.left, chunk.top - full.top
+            image[y:y + chunk.height, x:x + chunk.width] = self._decode(stream, roi_position)
+        frame = Frame(image, full.left, full.top)
+        self._composite = (tick, frame)
+        return frame
+
+    def events_at(self, tick):
+        """Return the event dicts attached to a frame seq."""
+        return [event for seq, _, event in self.events if seq == tick]
+
+    def screen_size(self):
+        chunk_indices = self._streams.get(FULL_STREAM)
+        if not chunk_indices:
+            raise ValueError(f"Recording has no full frames: {self.path}")
+        chunk = self.chunks[chunk_indices[0]]
+        return chunk.width, chunk.height
+
+    def stats(self):
+        """Return chunk counts and sizes per kind."""
+        stats = {'ticks': len(self.ticks), 'events': len(self.events), 'bytes': len(self._mm)}
+        for name, kind in (('keyframes', KEYFRAME), ('deltas', DELTA)):
+            chunks = [chunk for chunk in self.chunks if chunk.kind == kind]
+            stats[name] = len(chunks)
+            stats[f'{name}_bytes'] = sum(chunk.length for chunk in chunks)
+        stats['raw_bytes'] = sum(chunk.width * chunk.height * 3 for chunk in self.chunks)
+        return stats
+
+    def close(self):
+        self._cache.clear()
+        self._composite = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # Frames handed out still reference the map; it is released when they are
+            pass
+        self._file.close()
+
+
+class RecordingCapture(CaptureBackend):
+    """Capture backend that replays a session recording; grabs return views into the decoded frames without copying.
+
+    With realtime the recording plays back at its recorded timestamps, otherwise only advance() moves on.
+    """
+
+    name = 'recording'
+
+    def __init__(self, source, loop=True, realtime=True, speed=REPLAY_SPEED):
+        super().__init__()
+        self.reader = source if isinstance(source, SessionReader) else SessionReader(source)
+        self.loop = loop
+        self.index = 0
+        self.clock = ReplayClock(self.reader.tick_times, loop, speed) if realtime else None
+
+    def screen_size(self):
+        return self.reader.screen_size()
+
+    def current_tick(self):
+        if self.clock is not None:
+            self.index = self.clock.index()
+        return self.reader.ticks[min(self.index, len(self.reader.ticks) - 1)]
+
+    def advance(self):
+        """Move to the next recorded frame. Returns False once exhausted when not looping."""
+        if self.clock is not None:
+            self.index = self.clock.index()
+        self.index += 1
+        if self.index >= len(self.reader.ticks):
+            if not self.loop:
+                self.index = len(self.reader.ticks) - 1
+                return False
+            self.index = 0
+        if self.clock is not None:
+            self.clock.seek(self.index)
+        return True
+
+    def grab(self, bbox=None):
+        """Return the (x, y, w, h) box, or the whole screen, as of the current frame.
+
+        Boxes come from the full frame with every ROI recorded since pasted on top, so a grab never
+        mixes a fresh ROI with a full frame that is seconds old.
+        """
+        if bbox is None:
+            width, height = self.screen_size()
+            bbox = (0, 0, width, height)
+        x, y, w, h = bbox
+        tick = self.current_tick()
+        with METRICS.timer('capture_seconds', backend=self.name):
+            composite = self.reader.composite_at(tick)
+            # Without a full frame yet (e.g. its chunk was dropped) the ROIs are all there is
+            frames = [composite] if composite is not None else self.reader.frames_at(tick)
+        for frame in frames:
+            frame_h, frame_w = frame.image.shape[:2]
+            if frame.left <= x and frame.top <= y and x + w <= frame.left + frame_w and y + h <= frame.top + frame_h:
+                self.frames_captured += 1
+                return Frame(frame.region(x, y, w, h), x, y)
+        raise ValueError(f"Recording has no frame covering {bbox} at seq {tick}")
+
+
+# =====================
+# Live recording hook
+# =====================
+_recorder = None
+
+
+def get_recorder():
+    """Return the active SessionRecorder, or None when not recording."""
+    return _recorder
+
+
+def start_recording(regions=None, path=None):
+    """Start recording to path (default: a timestamped file in RECORDING_DIR). regions switches to ROI mode."""
+    global _recorder
+    if path is None:
+        path = os.path.join(RECORDING_DIR, f"session-{time.strftime('%Y%m%d-%H%M%S')}{RECORDING_SUFFIX}")
+    _recorder = SessionRecorder(path, regions)
+    print(f"Recording session to {path}")
+    return _recorder
+
+
+def stop_recording():
+    """Finish the active recording, if any."""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder.report()
+        _recorder = None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'info':
+        reader = SessionReader(sys.argv[2])
+        stats = reader.stats()
+        print(f"{stats['ticks']} frames, {stats['keyframes']} keyframes ({stats['keyframes_bytes'] / 1e6:.1f} MB), "
+              f"{stats['deltas']} deltas ({stats['deltas_bytes'] / 1e6:.1f} MB), {stats['events']} events")
+        print(f"{stats['bytes'] / 1e6:.1f} MB on disk for {stats['raw_bytes'] / 1e6:.1f} MB of raw frames; tracked regions: {reader.regions or 'none'}")
+    elif len(sys.argv) == 4 and sys.argv[1] == 'export':
+        reader = SessionReader(sys.argv[2])
+        os.makedirs(sys.argv[3], exist_ok=True)
+        exported = 0
+        for tick in reader.ticks:
+            frame = reader.frame_at(FULL_STREAM, tick, exact=True)
+            if frame is not None:
+                cv2.imwrite(os.path.join(sys.argv[3], f'{tick:06d}.png'), frame.image)
+                exported += 1
+        print(f"Exported {exported} full frames to {sys.argv[3]}")
+    else:
+        print("Usage: python session_recorder.py info <recording> | export <recording> <directory>")
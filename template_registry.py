@@ -0,0 +1,80 @@
+import os
+import cv2
+
+# Directories whose images are decoded once at startup
+TEMPLATE_DIRECTORIES = ['reference_images', 'Insert_images']
+TEMPLATE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def template_key(path):
+    """Normalise a template path so differently spelled paths share one cache slot."""
+    return os.path.normcase(os.path.normpath(path))
+
+
+class TemplateEntry:
+    """A decoded template image plus any derived forms computed from it."""
+
+    def __init__(self, path, mtime, image):
+        self.path = path
+        self.mtime = mtime
+        # Matching is always done against the BGR channels only
+        self.bgr = image[:, :, :3] if image.ndim == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        self.shape = self.bgr.shape[:2]
+        # Matchers can stash grayscale/downsampled versions here; cleared on reload
+        self.derived = {}
+
+
+class TemplateRegistry:
+    """In-memory cache of template images, reloaded only when the file's mtime changes."""
+
+    def __init__(self, directories=None):
+        self.directories = TEMPLATE_DIRECTORIES if directories is None else directories
+        self._entries = {}
+        self.loads = 0
+
+    def preload(self):
+        """Decode every image under the template directories."""
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.lower().endswith(TEMPLATE_EXTENSIONS):
+                    self.get_entry(os.path.join(directory, file_name))
+        print(f"Template registry loaded {len(self._entries)} images from {', '.join(self.directories)}")
+
+    def get_entry(self, path):
+        """Return the TemplateEntry for path, decoding it if new or modified. None if unreadable."""
+        key = template_key(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._entries.pop(key, None)
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry.mtime == mtime:
+            return entry
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            self._entries.pop(key, None)
+            return None
+        entry = TemplateEntry(path, mtime, image)
+        self._entries[key] = entry
+        self.loads += 1
+        return entry
+
+    def get(self, path):
+        """Return the BGR template for path, or None if it cannot be read."""
+        entry = self.get_entry(path)
+        return None if entry is None else entry.bgr
+
+    def invalidate(self, path=None):
+        """Drop one cached template, or all of them when path is None."""
+        if path is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(template_key(path), None)
+
+
+# Shared registry used by utils, autofarm and battle_engine
+TEMPLATES = TemplateRegistry()
+TEMPLATES.preload()
@@ -0,0 +1,40 @@
+from analytics_store import AnalyticsStore
+
+
+def encounter(started_at, species, is_target, capture_attempts=0, outcome='defeated'):
+    return dict(started_at=started_at, finished_at=started_at + 60, species=species, is_target=is_target, turns=4,
+                capture_attempts=capture_attempts, outcome=outcome, battle_seconds=60, farm_seconds=10, training=False)
+
+
+def test_summary(tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'analytics.db'), batch_size=2, flush_interval=0.1)
+    store.record_encounter(**encounter(0, 'Light Nanaslug', True, capture_attempts=1, outcome='captured'))
+    store.record_encounter(**encounter(1200, 'Hawkai', False))
+    store.record_encounter(**encounter(2400, 'Light Nanaslug', True))
+    store.record_encounter(**encounter(3540, None, False))
+    summary = store.summary()
+    store.close()
+    assert summary['encounters'] == 4
+    assert summary['hours'] == 1.0
+    assert summary['encounters_per_hour'] == 4
+    assert summary['targets_per_hour'] == 2
+    assert summary['capture_attempt_rate'] == 0.5
+    assert summary['captured'] == 1 and summary['capture_rate'] == 1.0
+    assert summary['mean_battle_seconds'] == 60
+    assert summary['mean_phase_seconds']['farm_seconds'] == 10
+    assert summary['outcomes'] == {'captured': 1, 'defeated': 3}
+    assert summary['species'][0] == {'species': 'Light Nanaslug', 'encounters': 2, 'targets': 2}
+    assert {'species': 'unknown', 'encounters': 1, 'targets': 0} in summary['species']
+
+
+def test_summary_since(tmp_path):
+    store = AnalyticsStore(str(tmp_path / 'analytics.db'), flush_interval=0.1)
+    store.record_encounter(**encounter(0, 'Hawkai', False))
+    store.record_encounter(**encounter(1200, 'Hawkai', False))
+    assert store.summary(since=600)['encounters'] == 1
+    assert store.summary(since=5000) == {'encounters': 0}
+    store.close()
+
+
+def test_summary_without_a_database(tmp_path):
+    assert AnalyticsStore(str(tmp_path / 'analytics.db')).summary() is None
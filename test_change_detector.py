@@ -0,0 +1,83 @@
+import numpy as np
+import change_detector
+from change_detector import FrameChangeDetector, FULL_FRAME
+from screen_capture import Frame
+
+REGIONS = {'turn_card': (100, 100, 40, 20), 'capture': (300, 50, 20, 10)}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def blank_frame():
+    return np.zeros((480, 640, 3), np.uint8)
+
+
+def detector(monkeypatch, **options):
+    clock = FakeClock()
+    monkeypatch.setattr(change_detector.time, 'monotonic', clock)
+    return FrameChangeDetector(REGIONS, **options), clock
+
+
+def test_first_frame_marks_everything_dirty(monkeypatch):
+    changes, _ = detector(monkeypatch)
+    assert changes.update(blank_frame()) == {'turn_card', 'capture', FULL_FRAME}
+
+
+def test_unchanged_frame_is_skipped(monkeypatch):
+    changes, clock = detector(monkeypatch)
+    changes.update(blank_frame())
+    clock.now += 0.1
+    assert changes.update(blank_frame()) == set()
+    assert changes.stats()['frames_skipped'] == 1
+
+
+def test_only_changed_regions_are_dirty(monkeypatch):
+    changes, clock = detector(monkeypatch)
+    changes.update(blank_frame())
+    clock.now += 0.1
+    image = blank_frame()
+    image[100:120, 100:140] = 255
+    assert changes.update(image) == {'turn_card'}
+    assert changes.stats()['dirty_counts']['capture'] == 1
+
+
+def test_change_outside_regions_dirties_full_frame(monkeypatch):
+    changes, clock = detector(monkeypatch)
+    changes.update(blank_frame())
+    clock.now += 0.1
+    image = blank_frame()
+    image[300:480, 400:640] = 200
+    assert changes.update(image) == {FULL_FRAME}
+
+
+def test_region_coordinates_follow_frame_offset(monkeypatch):
+    changes, clock = detector(monkeypatch)
+    changes.update(Frame(np.zeros((100, 260, 3), np.uint8), left=80, top=40))
+    clock.now += 0.1
+    image = np.zeros((100, 260, 3), np.uint8)
+    image[60:80, 20:60] = 255
+    dirty = changes.update(Frame(image, left=80, top=40))
+    assert 'turn_card' in dirty and 'capture' not in dirty
+
+
+def test_static_screen_is_rechecked_after_max_skip_seconds(monkeypatch):
+    changes, clock = detector(monkeypatch, max_skip_seconds=2.0)
+    changes.update(blank_frame())
+    clock.now += 1.9
+    assert changes.update(blank_frame()) == set()
+    clock.now += 0.2
+    assert changes.update(blank_frame()) == {'turn_card', 'capture', FULL_FRAME}
+
+
+def test_mark_dirty_forces_one_region(monkeypatch):
+    changes, clock = detector(monkeypatch)
+    changes.update(blank_frame())
+    clock.now += 0.1
+    changes.mark_dirty('capture')
+    assert changes.update(blank_frame()) == {'capture'}
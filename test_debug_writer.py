@@ -0,0 +1,101 @@
+import os
+import threading
+import numpy as np
+from debug_writer import DebugArtifactWriter
+
+
+class BlockingImage:
+    """Stands in for a PIL image whose save() holds the writer thread until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def save(self, path):
+        self.started.set()
+        self.release.wait(5)
+
+
+def crop(value=0):
+    return np.full((4, 4, 3), value, np.uint8)
+
+
+def written_files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+def test_always_writes_every_crop(tmp_path):
+    writer = DebugArtifactWriter(mode='always', ring_size=0)
+    for index in range(3):
+        writer.submit(str(tmp_path / f'crop{index}.png'), crop())
+    writer.close()
+    assert writer.written == 3
+    assert written_files(tmp_path) == ['crop0.png', 'crop1.png', 'crop2.png']
+
+
+def test_every_n_writes_first_of_each_n_per_path_and_mismatches(tmp_path):
+    writer = DebugArtifactWriter(mode='every_n', every_n=3, ring_size=0)
+    path = str(tmp_path / 'crop.png')
+    for index in range(7):
+        writer.submit(path, crop(), mismatch=index == 4)
+    writer.close()
+    # Calls 0, 3 and 6 are sampled, call 4 is a mismatch
+    assert writer.written == 4
+    assert writer.skipped == 3
+
+
+def test_on_mismatch_and_off(tmp_path):
+    writer = DebugArtifactWriter(mode='on_mismatch', ring_size=0)
+    writer.submit(str(tmp_path / 'a.png'), crop())
+    writer.submit(str(tmp_path / 'b.png'), crop(), mismatch=True)
+    writer.close()
+    assert written_files(tmp_path) == ['b.png']
+
+    writer = DebugArtifactWriter(mode='off', ring_size=0)
+    writer.submit(str(tmp_path / 'c.png'), crop(), mismatch=True)
+    writer.close()
+    assert writer.written == 0 and writer.skipped == 1
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    writer = DebugArtifactWriter(mode='always', queue_size=1, ring_size=0)
+    blocking = BlockingImage()
+    writer.submit(str(tmp_path / 'slow.png'), blocking)
+    assert blocking.started.wait(5)
+    writer.submit(str(tmp_path / 'queued.png'), crop())
+    writer.submit(str(tmp_path / 'dropped.png'), crop())
+    assert writer.dropped == 1
+    blocking.release.set()
+    writer.close()
+    assert written_files(tmp_path) == ['queued.png']
+
+
+def test_submit_copies_arrays_from_reused_buffers(tmp_path):
+    writer = DebugArtifactWriter(mode='off', ring_size=2, ring_dir=str(tmp_path / 'ring'))
+    buffer = crop(10)
+    writer.submit('screenshots/area.png', buffer)
+    buffer[:] = 99
+    assert writer._ring[0][2][0, 0, 0] == 10
+
+
+def test_flush_ring_writes_recent_crops_without_blocking(tmp_path):
+    writer = DebugArtifactWriter(mode='off', queue_size=1, ring_size=2, ring_dir=str(tmp_path / 'ring'))
+    for index in range(3):
+        writer.submit(f'screenshots/crop{index}.png', crop(index))
+    writer.flush_ring('test')
+    writer.close()
+    files = written_files(tmp_path / 'ring')
+    assert [name.split('_', 1)[1] for name in files] == ['crop1.png', 'crop2.png']
+
+
+def test_flush_ring_counts_crops_dropped_on_a_full_queue(tmp_path):
+    writer = DebugArtifactWriter(mode='always', queue_size=1, ring_size=3, ring_dir=str(tmp_path / 'ring'))
+    blocking = BlockingImage()
+    writer.submit(str(tmp_path / 'slow.png'), blocking)
+    assert blocking.started.wait(5)
+    writer.submit(str(tmp_path / 'queued.png'), crop())
+    writer.flush_ring('test')
+    # The ring holds both submitted crops and goes as one item
+    assert writer.dropped == 2
+    blocking.release.set()
+    writer.close()
@@ -0,0 +1,82 @@
+from PIL import Image
+
+from digit_recognizer import DigitRecognizer, GLYPH_CONFIRMATIONS
+
+CAPTURE_PERCENT_IMAGE = 'reference_images/Capture percentage area.png'
+
+
+def test_bootstraps_glyphs_without_a_glyph_file(tmp_path):
+    recognizer = DigitRecognizer(path=str(tmp_path / 'glyphs.npz'))
+    assert set(recognizer.labels) == {'3', '9', '%'}
+    assert not (tmp_path / 'glyphs.npz').exists()
+
+
+def confirmed_recognizer(tmp_path):
+    """A recognizer whose bootstrap glyphs were confirmed by as many agreeing reads as it needs."""
+    recognizer = DigitRecognizer(path=str(tmp_path / 'glyphs.npz'))
+    image = Image.open(CAPTURE_PERCENT_IMAGE).convert('RGB')
+    for _ in range(GLYPH_CONFIRMATIONS - 1):
+        recognizer.learn(image, '39%')
+    return recognizer
+
+
+def test_bootstrap_glyphs_are_not_used_until_confirmed(tmp_path):
+    recognizer = DigitRecognizer(path=str(tmp_path / 'glyphs.npz'))
+    image = Image.open(CAPTURE_PERCENT_IMAGE).convert('RGB')
+    assert recognizer.read_number(image) is None
+    for _ in range(GLYPH_CONFIRMATIONS - 2):
+        assert not recognizer.learn(image, '39%')
+        assert recognizer.read_number(image) is None
+    assert recognizer.learn(image, '39%')
+    assert recognizer.read_number(image) == 39
+
+
+def test_reads_capture_percentage_from_reference_crop(tmp_path):
+    recognizer = confirmed_recognizer(tmp_path)
+    assert recognizer.read_number(Image.open(CAPTURE_PERCENT_IMAGE)) == 39
+
+
+def test_confirmations_are_saved(tmp_path):
+    confirmed_recognizer(tmp_path)
+    reloaded = DigitRecognizer(path=str(tmp_path / 'glyphs.npz'))
+    assert reloaded.read_number(Image.open(CAPTURE_PERCENT_IMAGE)) == 39
+
+
+def test_wrong_bootstrap_does_not_stick(tmp_path):
+    image = Image.open(CAPTURE_PERCENT_IMAGE).convert('RGB')
+    recognizer = DigitRecognizer(path=str(tmp_path / 'glyphs.npz'), samples=[(CAPTURE_PERCENT_IMAGE, '38%')])
+    assert recognizer.read_number(image) is None
+    # Tesseract reads the same frame correctly: the mislabelled '8' is dropped instead of confirmed
+    for _ in range(GLYPH_CONFIRMATIONS):
+        recognizer.learn(image, '39%')
+    assert '8' not in recognizer.labels
+    assert recognizer.read_number(image) == 39
+
+
+def test_misread_after_confirmation_is_rejected(tmp_path):
+    recognizer = confirmed_recognizer(tmp_path)
+    image = Image.open(CAPTURE_PERCENT_IMAGE).convert('RGB')
+    for _ in range(GLYPH_CONFIRMATIONS):
+        assert not recognizer.learn(image, '38%')
+    assert '8' not in recognizer.labels
+    assert recognizer.read_number(image) == 39
+
+
+def test_hand_checked_label_is_used_at_once(tmp_path):
+    recognizer = DigitRecognizer(path=str(tmp_path / 'glyphs.npz'), samples=[])
+    image = Image.open(CAPTURE_PERCENT_IMAGE).convert('RGB')
+    assert recognizer.learn(image, '39%', confirmed=True)
+    assert recognizer.read_number(image) == 39
+
+
+def test_reads_inner_crops_of_reference(tmp_path):
+    recognizer = confirmed_recognizer(tmp_path)
+    image = Image.open(CAPTURE_PERCENT_IMAGE)
+    for box in ((8, 5, 48, 23), (6, 6, 46, 24), (12, 5, 52, 23)):
+        assert recognizer.read_number(image.crop(box)) == 39
+
+
+def test_partial_glyph_set_needs_high_confidence(tmp_path):
+    recognizer = confirmed_recognizer(tmp_path)
+    assert not recognizer.knows_all_digits()
+    assert recognizer.read_number(Image.open(CAPTURE_PERCENT_IMAGE), min_confidence=1.01) is None
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+from farm_scheduler import SPOT_MIN_COOLDOWN, FarmScheduler
+
+SPOT_PATH = 'Insert_images/reference_image.png'
+OTHER_SPOT_PATH = 'Insert_images/Alpha.png'
+
+
+def screenshot(*paths):
+    """A dark 600x400 screen with each spot template pasted side by side."""
+    screen = np.full((400, 600, 3), 30, dtype=np.uint8)
+    left = 20
+    for path in paths:
+        template = cv2.imread(path, cv2.IMREAD_COLOR)
+        height, width = template.shape[:2]
+        screen[100:100 + height, left:left + width] = template
+        left += width + 40
+    return screen
+
+
+def scheduler(*paths, cooldown=30):
+    return FarmScheduler(list(paths), cooldown, stats_path=None)
+
+
+def test_picks_a_visible_spot():
+    farm = scheduler(SPOT_PATH)
+    spot = farm.pick(screenshot(SPOT_PATH))
+    assert spot is farm.spots[0]
+    assert spot.location is not None
+
+
+def test_clicked_spot_waits_for_its_cooldown():
+    farm = scheduler(SPOT_PATH, cooldown=30)
+    spot = farm.pick(screenshot(SPOT_PATH))
+    farm.clicked(spot)
+    assert farm.pick(screenshot(SPOT_PATH)) is None
+    # Past the minimum cooldown but still showing, as if it never went away: the timer decides
+    spot.clicked_at -= SPOT_MIN_COOLDOWN + 1
+    assert farm.pick(screenshot(SPOT_PATH)) is None
+    spot.clicked_at -= 30
+    assert farm.pick(screenshot(SPOT_PATH)) is spot
+
+
+def test_spot_is_ready_when_it_reappears():
+    farm = scheduler(SPOT_PATH, cooldown=30)
+    spot = farm.pick(screenshot(SPOT_PATH))
+    farm.clicked(spot)
+    spot.clicked_at -= SPOT_MIN_COOLDOWN + 1
+    assert farm.pick(screenshot()) is None
+    assert farm.pick(screenshot(SPOT_PATH)) is spot
+    assert len(spot.cooldown_samples) == 1
+    assert spot.learned_cooldown() < 30
+
+
+def test_prefers_the_spot_with_more_targets():
+    farm = scheduler(SPOT_PATH, OTHER_SPOT_PATH)
+    farm.spots[1].clicks, farm.spots[1].encounters, farm.spots[1].targets = 10, 8, 6
+    assert farm.pick(screenshot(SPOT_PATH, OTHER_SPOT_PATH)) is farm.spots[1]
@@ -0,0 +1,281 @@
+import asyncio
+import threading
+import cv2
+import numpy as np
+import pytest
+
+import autofarm
+import battle_engine
+from battle_engine import BattleEngine
+from debug_writer import DEBUG_WRITER
+from digit_recognizer import DIGITS
+from farm_state_machine import FarmState, FarmStateMachine, run_replay
+from miscrit_roster import ENCOUNTERS
+from mouse_control import RecordingMouse, set_mouse
+from ocr_service import OCR
+from screen_capture import CaptureBackend, ReplayCapture, set_capture_backend
+
+SCREEN_W, SCREEN_H = 1920, 1080
+FARM_SPOT_AT = (517, 301)
+CONTINUE_AT = (900, 700)
+CAPTURE_BUTTON_AT = (520, 170)
+# OCR regions the battle reads, each painted with a flat grey that stands for its text
+TEXT_REGIONS = {
+    'enemy_name': (battle_engine.ENEMY_NAME_X, battle_engine.ENEMY_NAME_Y, battle_engine.ENEMY_NAME_W, battle_engine.ENEMY_NAME_H),
+    'capture': (battle_engine.CAPTURE_PERC_X, battle_engine.CAPTURE_PERC_Y, battle_engine.CAPTURE_PERC_W, battle_engine.CAPTURE_PERC_H),
+    'ready_to_train': (472, 490, 78, 9),
+    'training_okay': battle_engine.TRAINING_OKAY_AREA,
+    'training_continue': (638, 660, 71, 20),
+}
+
+
+@pytest.fixture
+def headless(tmp_path, monkeypatch):
+    """Keep the battle's files out of the repo and put back the shared capture backend and mouse afterwards."""
+    monkeypatch.setattr(battle_engine.ANALYTICS, 'enabled', False)
+    monkeypatch.setattr(ENCOUNTERS, 'path', str(tmp_path / 'encounters.txt'))
+    monkeypatch.setattr(DIGITS, 'path', str(tmp_path / 'glyphs.npz'))
+    monkeypatch.setattr(DEBUG_WRITER, 'mode', 'off')
+    monkeypatch.setattr(DEBUG_WRITER, 'ring_dir', str(tmp_path / 'ring'))
+    capture, mouse = set_capture_backend(None), set_mouse(None)
+    yield
+    set_capture_backend(capture)
+    set_mouse(mouse)
+
+
+def paste(frame, path, location):
+    template = cv2.imread(path, cv2.IMREAD_COLOR)
+    x, y = location
+    frame[y:y + template.shape[0], x:x + template.shape[1]] = template
+    return x + template.shape[1] // 2, y + template.shape[0] // 2
+
+
+class FakeGame(CaptureBackend):
+    """A scripted game client: a capture backend and mouse whose screen changes when the right spot is clicked.
+
+    farm -> my_turn (capture chance 40%) -> move 1 -> capture_ready (90%) -> capture -> battle_end
+    (ready to train) -> Continue -> training_okay -> every further click shows a new training screen.
+    The first failed_captures captures fail and go back to my_turn; with knock_out the move after a
+    failed capture defeats the enemy. After a move or capture the enemy's turn is shown for a few grabs first.
+    """
+
+    name = 'fake'
+
+    def __init__(self, failed_captures=0, knock_out=False):
+        super().__init__()
+        self.failed_captures = failed_captures
+        self.knock_out = knock_out
+        self.capture_failed = False
+        self.clicks = []
+        self.texts = {}
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(0)
+        self.background = self._rng.integers(0, 256, (SCREEN_H, SCREEN_W, 3), dtype=np.uint8)
+        self.screens = {}
+        self.targets = {}
+        farm = self._screen('farm')
+        self.targets['farm'] = paste(farm, autofarm.REFERENCE_OBJECT_PATH, FARM_SPOT_AT)
+        self._screen('enemy_turn', enemy_name='light nanaslug')
+        for name, percent in (('my_turn', '40%'), ('capture_ready', '90%')):
+            screen = self._screen(name, enemy_name='light nanaslug', capture=percent)
+            paste(screen, battle_engine.TURN_CARD_REFERENCE_PATH, (battle_engine.TURN_CARD_X, battle_engine.TURN_CARD_Y))
+            self.targets['capture'] = paste(screen, battle_engine.CAPTURE_BUTTON_PATH, CAPTURE_BUTTON_AT)
+        self.texts[self.region_bytes('my_turn', (battle_engine.TURN_CARD_X, battle_engine.TURN_CARD_Y,
+                                                 battle_engine.TURN_CARD_W, battle_engine.TURN_CARD_H))] = "it's your turn!"
+        self.targets['continue'] = paste(self._screen('battle_end', ready_to_train='ready to train'), battle_engine.CONTINUE_BUTTON_PATH, CONTINUE_AT)
+        self._screen('training_okay', training_okay='okay')
+        self.screen = 'farm'
+        self.pending = None
+        self.training_screens = 0
+        self.visited = ['farm']
+
+    def _screen(self, name, **texts):
+        frame = self.background.copy()
+        for region_name, (x, y, w, h) in TEXT_REGIONS.items():
+            # Regions without text get a grey of their own, so no two screens share pixels with different text
+            frame[y:y + h, x:x + w] = 20 + 7 * len(self.screens) + 60 * (region_name in texts)
+        self.screens[name] = frame
+        for region_name, text in texts.items():
+            self.texts[self.region_bytes(name, TEXT_REGIONS[region_name])] = text
+        return frame
+
+    def region_bytes(self, name, region):
+        x, y, w, h = region
+        return np.ascontiguousarray(self.screens[name][y:y + h, x:x + w, ::-1]).tobytes()
+
+    def recognize(self, image, psm, whitelist):
+        """Stands in for Tesseract: the text painted into a region, or '' for anything else."""
+        return self.texts.get(np.asarray(image.convert('RGB')).tobytes(), '')
+
+    def screen_size(self):
+        return SCREEN_W, SCREEN_H
+
+    def _grab_into(self, left, top, width, height, out):
+        with self._lock:
+            if self.pending is not None:
+                self.pending[1] -= 1
+                if self.pending[1] <= 0:
+                    self._show(self.pending[0])
+            np.copyto(out, self.screens[self.screen][top:top + height, left:left + width])
+
+    def _show(self, name, after_grabs=0):
+        if after_grabs:
+            self.screen, self.pending = 'enemy_turn', [name, after_grabs]
+            return
+        self.screen, self.pending = name, None
+        self.visited.append(name)
+
+    def click(self, x, y, duration=0.2, clicks=1):
+        self.clicks.append((x, y))
+
+        def near(target):
+            return abs(x - target[0]) <= 5 and abs(y - target[1]) <= 5
+        with self._lock:
+            if self.screen == 'farm' and near(self.targets['farm']):
+                self._show('my_turn')
+            elif self.screen == 'my_turn' and near(battle_engine.ATTACK_COORDS[0]):
+                self._show('battle_end' if self.knock_out and self.capture_failed else 'capture_ready', after_grabs=3)
+            elif self.screen == 'capture_ready' and near(self.targets['capture']):
+                if self.failed_captures:
+                    self.failed_captures -= 1
+                    self.capture_failed = True
+                    self._show('my_turn', after_grabs=3)
+                else:
+                    self._show('battle_end', after_grabs=3)
+            elif self.screen == 'battle_end' and near(self.targets['continue']):
+                self._show('training_okay')
+            elif self.screen == 'training_okay' or self.screen.startswith('training_'):
+                # Each training click opens a new window: fresh pixels everywhere but the text regions
+                self.training_screens += 1
+                name = f'training_{self.training_screens}'
+                self.background = self._rng.integers(0, 256, (SCREEN_H, SCREEN_W, 3), dtype=np.uint8)
+                self._screen(name, training_continue='continue')
+                self._show(name)
+
+
+def test_replay_without_farm_spots_collects_drops_between_scans(headless):
+    machine, clicks = run_replay('screenshots', max_transitions=4)
+    assert [(source, target) for _, source, target, _ in machine.transitions] == [
+        (FarmState.FARM_READY, FarmState.COLLECT_DROPS),
+        (FarmState.COLLECT_DROPS, FarmState.FARM_READY),
+    ] * 2
+    assert all(reason == 'done' for _, _, _, reason in machine.transitions)
+    assert machine.recoveries == 0
+    assert clicks == []
+
+
+def test_run_replay_restores_capture_backend_and_mouse(headless):
+    capture, mouse = ReplayCapture('screenshots'), RecordingMouse()
+    set_capture_backend(capture)
+    set_mouse(mouse)
+    run_replay('screenshots', max_transitions=1)
+    assert set_capture_backend(None) is capture
+    assert set_mouse(None) is mouse
+
+
+def run_fake_battle(game, monkeypatch, max_transitions):
+    """Farm one battle in game with the state machine; returns (machine, engine, analytics rows)."""
+    monkeypatch.setattr(OCR, '_recognize', game.recognize)
+    monkeypatch.setattr(OCR.cache, 'maxsize', 0)
+    rows = []
+    monkeypatch.setattr(battle_engine.ANALYTICS, 'record_encounter', lambda **fields: rows.append(fields))
+    set_capture_backend(game)
+    set_mouse(game)
+    engine = BattleEngine(autofarm.TARGET_MISCRITS, True, policy='first')
+    machine = FarmStateMachine(autofarm, engine, cooldown=0, battle_check_window=2)
+    machine.scheduler.stats_path = None
+    try:
+        asyncio.run(machine.run(max_transitions=max_transitions))
+    finally:
+        machine.close()
+    return machine, engine, rows
+
+
+def test_whole_battle_through_capture_and_training(headless, monkeypatch):
+    game = FakeGame()
+    machine, engine, rows = run_fake_battle(game, monkeypatch, 7)
+
+    assert [(source, target) for _, source, target, _ in machine.transitions] == [
+        (FarmState.FARM_READY, FarmState.AWAIT_BATTLE),
+        (FarmState.AWAIT_BATTLE, FarmState.MY_TURN),
+        (FarmState.MY_TURN, FarmState.CAPTURE),
+        (FarmState.CAPTURE, FarmState.MY_TURN),
+        (FarmState.MY_TURN, FarmState.POST_BATTLE),
+        (FarmState.POST_BATTLE, FarmState.TRAINING),
+        (FarmState.TRAINING, FarmState.COLLECT_DROPS),
+    ]
+    assert machine.recoveries == 0
+    assert game.visited[:5] == ['farm', 'my_turn', 'capture_ready', 'battle_end', 'training_okay']
+    assert game.clicks[:4] == [game.targets['farm'], battle_engine.ATTACK_COORDS[0], game.targets['capture'], game.targets['continue']]
+    assert game.training_screens >= 5
+    assert engine.enemy_species == 'Light Nanaslug'
+    assert engine.battles_fought == 1
+    # finish_battle ran, closed the battle record and saved the encounter counts
+    assert engine._battle_started is None and engine._battle_record is None
+    assert [(row['turns'], row['capture_attempts'], row['outcome']) for row in rows] == [(1, 1, 'captured')]
+    with open(ENCOUNTERS.path) as f:
+        assert 'Light Nanaslug|' in f.read()
+
+
+def test_capture_followed_by_a_move_failed(headless, monkeypatch):
+    game = FakeGame(failed_captures=1, knock_out=True)
+    machine, engine, rows = run_fake_battle(game, monkeypatch, 7)
+    assert machine.transitions[-1][2] == FarmState.COLLECT_DROPS
+    assert [(row['turns'], row['capture_attempts'], row['outcome']) for row in rows] == [(2, 1, 'capture_failed')]
+
+
+def test_only_the_last_capture_attempt_decides_the_outcome(headless, monkeypatch):
+    game = FakeGame(failed_captures=1)
+    machine, engine, rows = run_fake_battle(game, monkeypatch, 9)
+    assert machine.transitions[-1][2] == FarmState.COLLECT_DROPS
+    assert [(row['turns'], row['capture_attempts'], row['outcome']) for row in rows] == [(2, 2, 'captured')]
+
+
+def test_state_timeout_recovers(headless):
+    set_capture_backend(ReplayCapture('screenshots'))
+    set_mouse(RecordingMouse())
+    machine = FarmStateMachine(autofarm, BattleEngine(autofarm.TARGET_MISCRITS, autofarm.PLATINUM_TRAINING, policy='first'),
+                               cooldown=60, timeouts={FarmState.COLLECT_DROPS: 0.5})
+    machine.scheduler.stats_path = None
+
+    async def collect_through_cooldown():
+        # Waiting out a 60 s cooldown while collecting drops outlasts the state's timeout
+        machine._start_cooldown(60)
+        machine.state = FarmState.COLLECT_DROPS
+        await machine.run(max_transitions=1)
+
+    try:
+        asyncio.run(collect_through_cooldown())
+    finally:
+        machine.close()
+    _, source, target, reason = machine.transitions[0]
+    assert (source, target) == (FarmState.COLLECT_DROPS, FarmState.FARM_READY)
+    assert reason.startswith('timed out')
+    assert machine.recoveries == 1
+
+
+def test_post_battle_error_still_finishes_battle(headless, monkeypatch):
+    set_capture_backend(ReplayCapture('screenshots'))
+    set_mouse(RecordingMouse())
+    engine = BattleEngine(autofarm.TARGET_MISCRITS, autofarm.PLATINUM_TRAINING, policy='first')
+    machine = FarmStateMachine(autofarm, engine, cooldown=0)
+    machine.scheduler.stats_path = None
+    finished = []
+    monkeypatch.setattr(engine, 'finish_battle', lambda: finished.append(True))
+
+    def broken_training():
+        raise RuntimeError('training window did not open')
+    monkeypatch.setattr(engine, 'run_training_sequence', broken_training)
+
+    async def fail_training():
+        machine.state = FarmState.TRAINING
+        await machine.run(max_transitions=1)
+
+    try:
+        asyncio.run(fail_training())
+    finally:
+        machine.close()
+    _, source, target, reason = machine.transitions[0]
+    assert (source, target) == (FarmState.TRAINING, FarmState.COLLECT_DROPS)
+    assert reason == 'error: training window did not open'
+    assert finished == [True]
@@ -0,0 +1,32 @@
+import threading
+
+from frame_pipeline import LatestFrameBuffer
+
+
+def test_get_returns_the_latest_frame_and_counts_dropped_ones():
+    frames = LatestFrameBuffer(depth=1)
+    for index in range(3):
+        frames.put(f'frame {index}', float(index))
+    assert frames.get(timeout=0) == (3, 2.0, 'frame 2')
+    assert frames.published == 3
+    assert frames.dropped == 2
+
+
+def test_deeper_buffer_drops_the_oldest():
+    frames = LatestFrameBuffer(depth=2)
+    for index in range(3):
+        frames.put(index, float(index))
+    assert [frames.get(timeout=0)[2] for _ in range(2)] == [1, 2]
+    assert frames.dropped == 1
+
+
+def test_get_times_out_when_empty():
+    assert LatestFrameBuffer().get(timeout=0.01) is None
+
+
+def test_get_wakes_when_a_frame_is_put():
+    frames = LatestFrameBuffer()
+    timer = threading.Timer(0.05, frames.put, ('frame', 1.0))
+    timer.start()
+    assert frames.get(timeout=2) == (1, 1.0, 'frame')
+    timer.join()
@@ -0,0 +1,65 @@
+import json
+from metrics import METRICS, MetricsRegistry, HISTOGRAM_BUCKETS
+from waits import wait_until
+
+
+def registry(tmp_path, enabled=True):
+    return MetricsRegistry(enabled, str(tmp_path / 'metrics' / 'metrics.jsonl'), str(tmp_path / 'metrics' / 'bot.prom'))
+
+
+def test_jsonl_export_appends_one_snapshot_per_line(tmp_path):
+    metrics = registry(tmp_path)
+    metrics.count('clicks_total', kind='move')
+    metrics.observe('ocr_seconds', 0.03, source='tesseract')
+    metrics.observe('ocr_seconds', 0.2, source='tesseract')
+    metrics.export()
+    metrics.count('clicks_total', kind='move')
+    metrics.export()
+    lines = (tmp_path / 'metrics' / 'metrics.jsonl').read_text().splitlines()
+    assert len(lines) == 2
+    first, second = (json.loads(line) for line in lines)
+    assert first['counters'] == {'clicks_total{kind=move}': 1}
+    assert second['counters'] == {'clicks_total{kind=move}': 2}
+    summary = first['histograms']['ocr_seconds{source=tesseract}']
+    assert summary['count'] == 2
+    assert abs(summary['sum'] - 0.23) < 1e-9
+    assert summary['p50'] == 0.05 and summary['max'] == 0.2
+    assert 'ts' in first
+
+
+def test_prometheus_text_format(tmp_path):
+    metrics = registry(tmp_path)
+    metrics.count('battles_total', target='true')
+    metrics.observe('battle_seconds', 0.004, target='true')
+    metrics.observe('battle_seconds', 500.0, target='true')
+    metrics.export()
+    lines = (tmp_path / 'metrics' / 'bot.prom').read_text().splitlines()
+    assert lines[0] == '# TYPE miscrits_battles_total counter'
+    assert lines[1] == 'miscrits_battles_total{target="true"} 1'
+    assert lines[2] == '# TYPE miscrits_battle_seconds histogram'
+    buckets = [line for line in lines if line.startswith('miscrits_battle_seconds_bucket')]
+    assert len(buckets) == len(HISTOGRAM_BUCKETS) + 1
+    assert buckets[0] == 'miscrits_battle_seconds_bucket{target="true",le="0.001"} 0'
+    assert buckets[2] == 'miscrits_battle_seconds_bucket{target="true",le="0.005"} 1'
+    assert buckets[-2] == 'miscrits_battle_seconds_bucket{target="true",le="300.0"} 1'
+    assert buckets[-1] == 'miscrits_battle_seconds_bucket{target="true",le="+Inf"} 2'
+    assert 'miscrits_battle_seconds_sum{target="true"} 500.004' in lines
+    assert 'miscrits_battle_seconds_count{target="true"} 2' in lines
+    assert not (tmp_path / 'metrics' / 'bot.prom.tmp').exists()
+
+
+def test_disabled_registry_records_and_exports_nothing(tmp_path):
+    metrics = registry(tmp_path, enabled=False)
+    metrics.count('clicks_total')
+    with metrics.timer('match_seconds'):
+        pass
+    metrics.export()
+    assert metrics.snapshot()['counters'] == {}
+    assert not (tmp_path / 'metrics').exists()
+
+
+def test_waits_are_recorded_under_their_name():
+    wait_until(lambda: False, 0.01, name='metrics_test_wait')
+    snapshot = METRICS.snapshot()
+    assert snapshot['histograms']['wait_seconds{wait=metrics_test_wait}']['count'] == 1
+    assert snapshot['counters']['wait_timeouts_total{wait=metrics_test_wait}'] == 1
@@ -0,0 +1,43 @@
+from miscrit_roster import ROSTER_MIN_CONFIDENCE, RosterIndex, load_roster, parse_targets
+
+
+def test_lookup_corrects_ocr_misreads():
+    name, confidence = load_roster().lookup('1ight nanas1ug')
+    assert name == 'Light Nanaslug'
+    assert confidence >= ROSTER_MIN_CONFIDENCE
+
+
+def test_lookup_of_a_bare_prefix_is_unknown():
+    _, confidence = load_roster().lookup('light')
+    assert confidence < ROSTER_MIN_CONFIDENCE
+
+
+def test_parse_targets():
+    assert parse_targets('Light Nanaslug:80, Hawkai', default_threshold=85) == {'Light Nanaslug': 80, 'Hawkai': 85}
+
+
+def test_parse_targets_falls_back_on_a_bad_threshold(capsys):
+    assert parse_targets('Light Nanaslug:eighty', default_threshold=85) == {'Light Nanaslug': 85}
+    assert 'eighty' in capsys.readouterr().out
+
+
+def test_off_roster_names_are_unknown():
+    roster = load_roster()
+    # Each of these lands on an unrelated roster name at 0.58-0.65 similarity
+    for text in ('light nessy', 'light sparkspeck', 'dark blazebit', 'dark fl0ue'):
+        name, confidence = roster.resolve(text)
+        assert name is None, (text, name, confidence)
+
+
+def test_resolve_keeps_misreads_of_roster_names():
+    roster = load_roster()
+    for text, expected in (('1ight nanas1ug', 'Light Nanaslug'), ('hawka1', 'Hawkai'), ('lignt hawkai', 'Light Hawkai'), ('Hawkai', 'Hawkai')):
+        assert roster.resolve(text)[0] == expected
+
+
+def test_resolve_refuses_a_read_close_to_two_names():
+    roster = RosterIndex(['Flue', 'Flew'])
+    # 'fle' is as close to both, above the confidence threshold
+    assert roster.lookup('fle')[1] >= ROSTER_MIN_CONFIDENCE
+    assert roster.resolve('fle')[0] is None
+    assert roster.resolve('flu')[0] == 'Flue'
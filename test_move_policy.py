@@ -0,0 +1,25 @@
+from move_policy import BattleSimulator, FirstMovePolicy, LearnedMovePolicy, MoveStats, ALL_SPECIES, MIN_MOVE_SAMPLES
+
+
+def learned_policy():
+    return LearnedMovePolicy(stats=MoveStats(path=None))
+
+
+def test_learned_policy_needs_fewer_turns_than_the_first_move():
+    first = BattleSimulator(seed=1).evaluate(FirstMovePolicy(), 200)
+    learned = BattleSimulator(seed=1).evaluate(learned_policy(), 200)
+    assert learned['target_turns'] < first['target_turns'] / 2
+    assert learned['other_turns'] < first['other_turns'] / 2
+    assert learned['knockout_rate'] <= 0.05
+
+
+def test_exploration_is_shared_between_species():
+    policy = learned_policy()
+    result = BattleSimulator(seed=1).evaluate(policy, 100, species=50)
+    assert result['target_turns'] < 3.5
+    assert min(policy.stats.observations(ALL_SPECIES)) >= MIN_MOVE_SAMPLES
+
+
+def test_learned_policy_without_hp_reads():
+    result = BattleSimulator(hp_visible=False, seed=1).evaluate(learned_policy(), 200)
+    assert result['knockout_rate'] <= 0.05
@@ -0,0 +1,106 @@
+import threading
+import time
+import numpy as np
+import pytest
+
+import autofarm
+import multi_window
+from mouse_control import RecordingMouse
+from multi_window import FakeDesktop, FakeWindow, MouseScheduler, MultiWindowFarm, WindowCapture, WindowMouse, overlapping_windows
+from screen_capture import CaptureBackend, Frame
+
+
+class StaticScreen(CaptureBackend):
+    """A frame source showing one fixed random image."""
+
+    name = 'static'
+
+    def __init__(self, width, height, seed):
+        super().__init__()
+        self.image = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    def screen_size(self):
+        return self.image.shape[1], self.image.shape[0]
+
+    def grab(self, bbox=None):
+        x, y, w, h = bbox
+        return Frame(self.image[y:y + h, x:x + w], x, y)
+
+
+class SlowMouse:
+    """Records clicks and activations in order, and notices two clicks running at once."""
+
+    def __init__(self, log):
+        self.log = log
+        self.active = 0
+        self.most_active = 0
+        self._lock = threading.Lock()
+
+    def click(self, x, y, duration=0.2, clicks=1):
+        with self._lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.001)
+        self.log.append(('click', x, y))
+        with self._lock:
+            self.active -= 1
+
+
+def test_window_capture_and_clicks_use_game_area_coordinates(monkeypatch):
+    monkeypatch.setattr(multi_window, 'CLIENT_AREA_OFFSET', (8, 31))
+    first = FakeWindow('Miscrits 1', 0, 0, 208, 131)
+    second = FakeWindow('Miscrits 2', 208, 0, 208, 131)
+    screens = [StaticScreen(200, 100, 1), StaticScreen(200, 100, 2)]
+    desktop = FakeDesktop(zip([first, second], screens))
+    capture = WindowCapture(second, desktop)
+    assert capture.screen_size() == (200, 100)
+
+    frame = capture.grab((10, 20, 30, 15))
+    assert (frame.left, frame.top) == (10, 20)
+    assert np.array_equal(frame.image, screens[1].image[20:35, 10:40])
+    assert np.array_equal(capture.grab().image, screens[1].image)
+
+    mouse = RecordingMouse()
+    WindowMouse(second, MouseScheduler(mouse)).click(10, 20)
+    assert [(x, y) for _, x, y, _ in mouse.clicks] == [(208 + 8 + 10, 31 + 20)]
+    assert second.activations == 1 and first.activations == 0
+
+
+def test_clicks_from_two_windows_are_serialized(monkeypatch):
+    log = []
+    windows = [FakeWindow(f'Miscrits {index + 1}', 300 * index, 0, 300, 200) for index in range(2)]
+    for window in windows:
+        monkeypatch.setattr(window, 'activate', lambda window=window: log.append(('activate', window)))
+    mouse = SlowMouse(log)
+    scheduler = MouseScheduler(mouse)
+
+    def click_many(window):
+        window_mouse = WindowMouse(window, scheduler)
+        for index in range(20):
+            window_mouse.click(10 + index, 50)
+    threads = [threading.Thread(target=click_many, args=(window,)) for window in windows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert mouse.most_active == 1
+    assert scheduler.clicks == 40
+    # Every click lands inside the window activated last, i.e. no click of one window slipped in after another's activation
+    current = None
+    for entry in log:
+        if entry[0] == 'activate':
+            current = entry[1]
+        else:
+            _, x, y = entry
+            assert current.left <= x < current.left + current.width and current.top <= y < current.top + current.height
+
+
+def test_overlapping_windows_are_refused():
+    first = FakeWindow('Miscrits 1', 0, 0, 300, 200)
+    touching = FakeWindow('Miscrits 2', 300, 0, 300, 200)
+    covering = FakeWindow('Miscrits 3', 250, 150, 300, 200)
+    assert overlapping_windows([first, touching]) == []
+    assert overlapping_windows([first, touching, covering]) == [(first, covering), (touching, covering)]
+    with pytest.raises(ValueError, match="'Miscrits 1' and 'Miscrits 3'"):
+        MultiWindowFarm(autofarm, [first, touching, covering], MouseScheduler(RecordingMouse()))
@@ -0,0 +1,95 @@
+import threading
+import numpy as np
+from PIL import Image
+from ocr_service import OcrResultCache, OcrService, OcrRegion
+from screen_capture import Frame
+
+
+def solid_image(value, size=(20, 10)):
+    return Image.new('RGB', size, (value, value, value))
+
+
+def test_cache_key_depends_on_pixels_and_config():
+    image = solid_image(10)
+    key = OcrResultCache.key(image, 7, None)
+    assert OcrResultCache.key(solid_image(10), 7, None) == key
+    assert OcrResultCache.key(solid_image(11), 7, None) != key
+    assert OcrResultCache.key(image, 8, None) != key
+    assert OcrResultCache.key(image, 7, '0123456789') != key
+
+
+def test_cache_evicts_least_recently_used():
+    cache = OcrResultCache(maxsize=2)
+    cache.put('a', 'alpha')
+    cache.put('b', 'beta')
+    assert cache.get('a') == 'alpha'
+    cache.put('c', 'gamma')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'alpha'
+    assert cache.get('c') == 'gamma'
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_resize_and_invalidate():
+    cache = OcrResultCache(maxsize=3)
+    for key in 'abc':
+        cache.put(key, key)
+    cache.resize(1)
+    assert cache.stats()['size'] == 1
+    assert cache.get('c') == 'c'
+    cache.invalidate()
+    assert cache.get('c') is None
+
+
+def fake_service(recognize):
+    service = OcrService(workers=2)
+    service._recognize = recognize
+    return service
+
+
+def test_recognize_serves_identical_pixels_from_cache():
+    calls = []
+    service = fake_service(lambda image, psm, whitelist: calls.append(psm) or 'okay')
+    try:
+        assert service.recognize(solid_image(50)) == 'okay'
+        assert service.recognize(solid_image(50)) == 'okay'
+        assert service.recognize(solid_image(50), psm=8) == 'okay'
+    finally:
+        service.close()
+    assert calls == [7, 8]
+    assert service.latency_stats()['calls'] == 3
+
+
+def test_recognize_batch_reads_regions_in_parallel():
+    # Each region blocks until the other has started, so this only finishes if both run at once
+    barrier = threading.Barrier(2, timeout=5)
+
+    def recognize(image, psm, whitelist):
+        barrier.wait()
+        return f"{image.size[0]}:{psm}:{whitelist}"
+
+    frame = Frame(np.zeros((100, 200, 3), np.uint8), left=100, top=50)
+    regions = [OcrRegion('name', 110, 60, 30, 10), OcrRegion('percent', 150, 80, 20, 10, 8, '0123456789%')]
+    service = fake_service(recognize)
+    try:
+        results = service.recognize_batch(frame, regions)
+    finally:
+        service.close()
+    assert results['name'][0] == '30:7:None'
+    assert results['percent'][0] == '20:8:0123456789%'
+    assert results['percent'][1].size == (20, 10)
+
+
+def test_recognize_batch_uses_cache():
+    calls = []
+    frame = Frame(np.full((40, 40, 3), 90, np.uint8))
+    service = fake_service(lambda image, psm, whitelist: calls.append(psm) or 'okay')
+    try:
+        service.recognize_batch(frame, [OcrRegion('okay', 0, 0, 10, 10)])
+        results = service.recognize_batch(frame, [OcrRegion('okay', 0, 0, 10, 10), OcrRegion('other', 10, 10, 10, 10, 8)])
+    finally:
+        service.close()
+    assert calls == [7, 8]
+    assert results['okay'][0] == 'okay'
+    assert service.cache.stats()['hits'] == 1
@@ -0,0 +1,41 @@
+import cv2
+import pytest
+
+from pyramid_matcher import PyramidMatcher, _full_resolution_match
+from template_registry import TEMPLATES
+
+SCREENSHOT_PATH = 'screenshots/eyesight.png'
+TEMPLATE_PATHS = ['Insert_images/reference_image.png', 'Insert_images/Alpha.png', 'reference_images/gold drop.png',
+                  'reference_images/potion drop.png', 'reference_images/okay.png']
+
+
+@pytest.fixture(scope='module')
+def screenshot():
+    return cv2.imread(SCREENSHOT_PATH, cv2.IMREAD_COLOR)
+
+
+@pytest.mark.parametrize('template_path', TEMPLATE_PATHS)
+def test_pyramid_finds_a_pasted_template_where_full_resolution_does(screenshot, template_path):
+    template = TEMPLATES.get(template_path)
+    height, width = template.shape[:2]
+    frame = screenshot.copy()
+    frame[301:301 + height, 517:517 + width] = template
+    full_val, full_loc = _full_resolution_match(frame, template_path)
+    pyramid_val, pyramid_loc, shape = PyramidMatcher().match(frame, template_path)
+    assert full_loc == (517, 301)
+    assert max(abs(pyramid_loc[0] - 517), abs(pyramid_loc[1] - 301)) <= 3
+    assert shape == (height, width)
+    assert pyramid_val > 0.9 and abs(pyramid_val - full_val) < 0.05
+
+
+@pytest.mark.parametrize('template_path', TEMPLATE_PATHS)
+def test_pyramid_agrees_on_the_unmodified_screenshot(screenshot, template_path):
+    full_val, full_loc = _full_resolution_match(screenshot, template_path)
+    pyramid_val, pyramid_loc, _ = PyramidMatcher().match(screenshot, template_path)
+    assert (pyramid_val > 0.7) == (full_val > 0.7)
+    if full_val > 0.7:
+        assert max(abs(pyramid_loc[0] - full_loc[0]), abs(pyramid_loc[1] - full_loc[1])) <= 3
+
+
+def test_missing_template():
+    assert PyramidMatcher().match(cv2.imread(SCREENSHOT_PATH), 'reference_images/missing.png') == (None, None, None)
@@ -0,0 +1,45 @@
+import numpy as np
+from screen_capture import ReplayCapture, union_bbox
+
+
+def replay(buffer_count=2):
+    frames = [np.full((60, 80, 3), value, np.uint8) for value in (10, 20, 30)]
+    return ReplayCapture(frames, realtime=False, buffer_count=buffer_count)
+
+
+def test_grabs_cycle_through_preallocated_buffers():
+    capture = replay(buffer_count=2)
+    first = capture.grab()
+    second = capture.grab()
+    third = capture.grab()
+    assert first.image is not second.image
+    assert third.image is first.image
+    assert capture.frames_captured == 3
+
+
+def test_each_size_gets_its_own_ring():
+    capture = replay(buffer_count=2)
+    full = capture.grab()
+    region = capture.grab((10, 5, 20, 10))
+    assert region.image.shape == (10, 20, 3)
+    capture.grab((10, 5, 20, 10))
+    assert capture.grab().image is not full.image
+    assert capture.grab((0, 0, 20, 10)).image is region.image
+
+
+def test_reused_buffer_holds_the_new_frame():
+    capture = replay(buffer_count=1)
+    first = capture.grab()
+    assert first.image[0, 0, 0] == 10
+    capture.advance()
+    second = capture.grab()
+    assert second.image is first.image
+    assert second.image[0, 0, 0] == 20
+
+
+def test_grab_regions_captures_the_union():
+    capture = replay()
+    frame = capture.grab_regions([(10, 5, 20, 10), (40, 30, 10, 10)])
+    assert union_bbox([(10, 5, 20, 10), (40, 30, 10, 10)]) == (10, 5, 40, 35)
+    assert (frame.left, frame.top) == (10, 5)
+    assert frame.region(40, 30, 10, 10).shape == (10, 10, 3)
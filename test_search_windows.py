@@ -0,0 +1,56 @@
+import numpy as np
+
+from search_windows import SpatialPriorIndex
+
+TEMPLATE_PATH = 'templates/button.png'
+
+
+def screen_with_template(template, x, y, shape=(300, 400)):
+    screen = np.zeros(shape + (3,), dtype=np.uint8)
+    screen[y:y + template.shape[0], x:x + template.shape[1]] = template
+    return screen
+
+
+def make_template():
+    return np.random.default_rng(0).integers(0, 256, (20, 30, 3), dtype=np.uint8)
+
+
+def test_first_match_searches_the_frame_then_the_window():
+    template = make_template()
+    index = SpatialPriorIndex(padding=10)
+    screen = screen_with_template(template, 200, 150)
+    max_val, location, shape = index.match(TEMPLATE_PATH, screen, template)
+    assert location == (200, 150) and shape == (20, 30) and max_val > 0.99
+    assert index.match(TEMPLATE_PATH, screen_with_template(template, 205, 147), template)[1] == (205, 147)
+    assert (index.hits, index.misses, index.full_searches) == (1, 0, 1)
+
+
+def test_miss_falls_back_to_the_full_frame_at_most_once_per_interval():
+    template = make_template()
+    index = SpatialPriorIndex(padding=10, full_search_interval=60)
+    index.match(TEMPLATE_PATH, screen_with_template(template, 200, 150), template)
+    moved = screen_with_template(template, 20, 30)
+    # The full search on the first match is recent, so the miss is answered from the window alone
+    max_val, _, _ = index.match(TEMPLATE_PATH, moved, template)
+    assert max_val < 0.7
+    assert (index.misses, index.full_searches) == (1, 1)
+
+
+def test_miss_searches_the_full_frame_once_the_interval_passed():
+    template = make_template()
+    index = SpatialPriorIndex(padding=10, full_search_interval=0)
+    index.match(TEMPLATE_PATH, screen_with_template(template, 200, 150), template)
+    assert index.match(TEMPLATE_PATH, screen_with_template(template, 20, 30), template)[1] == (20, 30)
+    assert (index.misses, index.full_searches) == (1, 2)
+
+
+def test_fixed_template_is_only_searched_at_its_seed():
+    template = make_template()
+    index = SpatialPriorIndex(padding=10, full_search_interval=0)
+    index.seed(TEMPLATE_PATH, (200, 150), fixed=True)
+    assert index.match(TEMPLATE_PATH, screen_with_template(template, 200, 150), template)[1] == (200, 150)
+    max_val, _, _ = index.match(TEMPLATE_PATH, screen_with_template(template, 20, 30), template)
+    assert max_val < 0.7
+    assert index.full_searches == 0
+    index.forget(TEMPLATE_PATH)
+    assert index.match(TEMPLATE_PATH, screen_with_template(template, 20, 30), template)[1] == (20, 30)
@@ -0,0 +1,74 @@
+import threading
+import numpy as np
+
+from session_recorder import FULL_STREAM, RecordingCapture, SessionReader, SessionRecorder
+from waits import wait_until
+
+
+def frames(count, shape=(60, 80, 3)):
+    random = np.random.default_rng(0)
+    base = random.integers(0, 256, shape, dtype=np.uint8)
+    return [np.where(random.random(shape) < 0.05, 255 - base, base).astype(np.uint8) for _ in range(count)]
+
+
+def test_full_frames_round_trip(tmp_path):
+    path = str(tmp_path / 'session.msr')
+    recorded = frames(5)
+    recorder = SessionRecorder(path, keyframe_every=2)
+    for index, image in enumerate(recorded):
+        recorder.record_frame(image, timestamp=100.0 + index)
+        recorder.record_event('detector', {'turn_card': index % 2 == 0})
+    recorder.close()
+    reader = SessionReader(path)
+    assert reader.ticks == [1, 2, 3, 4, 5]
+    assert reader.tick_times == [100.0, 101.0, 102.0, 103.0, 104.0]
+    stats = reader.stats()
+    assert stats['keyframes'] == 2 and stats['deltas'] == 3
+    for tick, image in zip(reader.ticks, recorded):
+        assert np.array_equal(reader.frame_at(FULL_STREAM, tick, exact=True).image, image)
+    assert reader.events_at(3) == [{'turn_card': True, 'type': 'detector'}]
+    reader.close()
+
+
+def test_roi_recording_pastes_newer_regions_onto_the_full_frame(tmp_path):
+    path = str(tmp_path / 'session.msr')
+    recorded = frames(3)
+    recorder = SessionRecorder(path, regions={'card': (10, 20, 30, 15)}, full_frame_interval=60)
+    for index, image in enumerate(recorded):
+        recorder.record_frame(image, timestamp=100.0 + index)
+    recorder.close()
+    capture = RecordingCapture(path, realtime=False)
+    capture.advance()
+    capture.advance()
+    screen = capture.grab().image
+    # Only the first full frame was kept; the region is from the latest frame
+    assert np.array_equal(screen[20:35, 10:40], recorded[2][20:35, 10:40])
+    assert np.array_equal(screen[:20], recorded[0][:20])
+    assert np.array_equal(capture.grab((10, 20, 30, 15)).image, recorded[2][20:35, 10:40])
+
+
+def test_full_queue_counts_dropped_frames_and_events_separately(tmp_path):
+    recorder = SessionRecorder(str(tmp_path / 'session.msr'), queue_size=1)
+    started, release = threading.Event(), threading.Event()
+    write_frame = recorder._write_frame
+
+    def slow_write_frame(*args):
+        started.set()
+        release.wait(5)
+        write_frame(*args)
+    recorder._write_frame = slow_write_frame
+    # Let the writer take the 'streams' event first so the one-slot queue starts empty
+    assert wait_until(recorder._queue.empty, 5, name='test_recorder_queue')
+    recorded = frames(3)
+    recorder.record_frame(recorded[0], timestamp=100.0)
+    assert started.wait(5)
+    recorder.record_frame(recorded[1], timestamp=101.0)
+    recorder.record_frame(recorded[2], timestamp=102.0)
+    recorder.record_event('detector', {'turn_card': True})
+    assert (recorder.frames_recorded, recorder.frames_dropped, recorder.events_dropped) == (3, 1, 1)
+    release.set()
+    recorder.close()
+    reader = SessionReader(recorder.path)
+    assert reader.ticks == [1, 2]
+    assert reader.screen_size() == (80, 60)
+    reader.close()
@@ -0,0 +1,52 @@
+import os
+
+import cv2
+import numpy as np
+
+from template_registry import TemplateRegistry
+
+
+def write_image(path, value, mtime_ns):
+    cv2.imwrite(str(path), np.full((8, 10, 3), value, dtype=np.uint8))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_template_is_decoded_once_while_unchanged(tmp_path):
+    path = tmp_path / 'button.png'
+    write_image(path, 40, 1_000_000_000)
+    registry = TemplateRegistry(directories=[])
+    first = registry.get(str(path))
+    assert registry.get(str(path)) is first
+    # Differently spelled paths share the cache slot
+    assert registry.get(str(tmp_path / '.' / 'button.png')) is first
+    assert registry.loads == 1
+
+
+def test_template_is_reloaded_when_its_mtime_changes(tmp_path):
+    path = tmp_path / 'button.png'
+    write_image(path, 40, 1_000_000_000)
+    registry = TemplateRegistry(directories=[])
+    registry.get_entry(str(path)).derived['gray'] = 'stale'
+    write_image(path, 200, 2_000_000_000)
+    entry = registry.get_entry(str(path))
+    assert entry.bgr[0, 0, 0] == 200
+    assert entry.derived == {}
+    assert registry.loads == 2
+
+
+def test_missing_template_is_dropped(tmp_path):
+    path = tmp_path / 'button.png'
+    write_image(path, 40, 1_000_000_000)
+    registry = TemplateRegistry(directories=[])
+    registry.get(str(path))
+    os.remove(path)
+    assert registry.get(str(path)) is None
+
+
+def test_preload_reads_every_image_in_the_directories(tmp_path):
+    for name in ('a.png', 'b.png'):
+        write_image(tmp_path / name, 40, 1_000_000_000)
+    (tmp_path / 'notes.txt').write_text('not an image')
+    registry = TemplateRegistry(directories=[str(tmp_path), str(tmp_path / 'missing')])
+    registry.preload()
+    assert registry.loads == 2
@@ -0,0 +1,70 @@
+import asyncio
+import waits
+from waits import AdaptiveBackoff, FixedInterval, wait_until, async_wait_until, wait_stats
+
+
+class FakeTime:
+    """monotonic() and sleep() on a clock that only moves when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+def fake_time(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(waits.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(waits.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_backoff_grows_to_ceiling():
+    intervals = AdaptiveBackoff(0.1, 0.5, 2.0).intervals()
+    assert [round(next(intervals), 6) for _ in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+    fixed = FixedInterval(0.2).intervals()
+    assert [next(fixed) for _ in range(3)] == [0.2, 0.2, 0.2]
+
+
+def test_wait_returns_first_truthy_value(monkeypatch):
+    clock = fake_time(monkeypatch)
+    results = iter([None, None, (5, 6)])
+    assert wait_until(lambda: next(results), 10, AdaptiveBackoff(0.1, 1.0, 2.0), name='test_found') == (5, 6)
+    assert clock.sleeps == [0.1, 0.2]
+    assert wait_stats()['test_found']['satisfied'] >= 1
+
+
+def test_wait_times_out_with_last_sleep_clipped(monkeypatch):
+    clock = fake_time(monkeypatch)
+    assert wait_until(lambda: False, 1.0, AdaptiveBackoff(0.1, 0.5, 2.0), name='test_timeout') is False
+    # 0.1 + 0.2 + 0.4 = 0.7, then only the 0.3 s left before the timeout
+    assert clock.sleeps == [0.1, 0.2, 0.4, 0.3]
+    assert clock.now == 1.0
+    stats = wait_stats()['test_timeout']
+    assert stats['count'] - stats['satisfied'] >= 1
+
+
+def test_condition_is_checked_once_without_sleeping_when_already_true(monkeypatch):
+    clock = fake_time(monkeypatch)
+    assert wait_until(lambda: True, 1.0, name='test_immediate')
+    assert clock.sleeps == []
+
+
+def test_async_wait_times_out(monkeypatch):
+    calls = []
+
+    def condition():
+        calls.append(1)
+        return False
+
+    async def run():
+        return await async_wait_until(condition, 0.05, FixedInterval(0.01), name='test_async')
+
+    assert asyncio.run(run()) is False
+    assert len(calls) >= 2
@@ -1,49 +1,65 @@
-import cv2
-import numpy as np
-import pyautogui
-import pytesseract
 import difflib
+from template_registry import TEMPLATES
+from search_windows import SEARCH_WINDOWS
+from ocr_service import OCR
+from screen_capture import get_capture_backend
+from mouse_control import click_at
+from metrics import METRICS
 
-def extract_text_from_screen_region(screenshot, x, y, w, h):
-    """Extract text from a specific screen region using OCR (pytesseract)."""
+def extract_text_from_screen_region(screenshot, x, y, w, h, psm=7, whitelist=None):
+    """Extract text from a specific screen region using the persistent OCR workers."""
     region = screenshot.crop((x, y, x + w, y + h))
-    return pytesseract.image_to_string(region, config='--psm 7').strip().lower(), region
+    return OCR.recognize(region, psm, whitelist), region
+
+def extract_text_from_screen_regions(screenshot, regions):
+    """Extract text from several OcrRegions of one screenshot in a single batched call. Returns {name: (text, region)}."""
+    return OCR.recognize_batch(screenshot, regions)
+
+def match_template(screenshot_bgr, template_path, threshold=0.7):
+    """Match a registered template, searching near its last location first. Returns (max_val, max_loc, (h, w)) or (None, None, None) if the template is missing."""
+    template = TEMPLATES.get(template_path)
+    if template is None:
+        return None, None, None
+    with METRICS.timer('match_seconds', matcher='window'):
+        return SEARCH_WINDOWS.match(template_path, screenshot_bgr, template, threshold)
 
 def find_and_click_template_on_screen(screenshot_bgr, template_path, threshold=0.7):
     """Find a template image on screen using OpenCV template matching and click its center if found."""
-    template = cv2.imread(template_path, cv2.IMREAD_UNCHANGED)
-    if template is None:
+    max_val, max_loc, template_shape = match_template(screenshot_bgr, template_path, threshold)
+    if max_val is None:
         print(f"Reference image not found at {template_path}")
         return False
-    result = cv2.matchTemplate(screenshot_bgr, template[:, :, :3], cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, max_loc = cv2.minMaxLoc(result)
     if max_val > threshold:
-        template_h, template_w = template.shape[:2]
+        template_h, template_w = template_shape
         center_x = max_loc[0] + template_w // 2
         center_y = max_loc[1] + template_h // 2
         print(f"Template match found for {template_path} at ({center_x}, {center_y}) with match {max_val:.2f}. Clicking...")
-        pyautogui.moveTo(center_x, center_y, duration=0.3)
-        pyautogui.click()
+        click_at(center_x, center_y, 0.3)
         return True
     return False
 
 def find_template_on_screen(screenshot_bgr, template_path, threshold=0.7):
     """Find a template image on screen using OpenCV template matching and return (location, shape) if found, else (None, None)."""
-    template = cv2.imread(template_path, cv2.IMREAD_UNCHANGED)
-    if template is None:
+    max_val, max_loc, template_shape = match_template(screenshot_bgr, template_path, threshold)
+    if max_val is None:
         print(f"Reference image not found at {template_path}")
         return None, None
-    result = cv2.matchTemplate(screenshot_bgr, template[:, :, :3], cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
     if max_val > threshold:
-        return max_loc, template.shape[:2]
+        return max_loc, template_shape
     return None, None
 
+def capture_frame(bbox=None):
+    """Capture the (x, y, w, h) box, or the whole screen, into a reusable buffer and return a screen_capture.Frame."""
+    return get_capture_backend().grab(bbox)
+
+def capture_regions(regions):
+    """Capture only the union of several (x, y, w, h) regions and return a screen_capture.Frame."""
+    return get_capture_backend().grab_regions(regions)
+
 def convert_screenshot_to_bgr():
-    """Take a screenshot and convert it to BGR format for OpenCV processing."""
-    screenshot = pyautogui.screenshot()
-    screenshot_np = np.array(screenshot)
-    return cv2.cvtColor(screenshot_np, cv2.COLOR_RGB2BGR), screenshot
+    """Take a screenshot and return (BGR array for OpenCV, Frame usable wherever a PIL screenshot was cropped)."""
+    frame = get_capture_backend().grab()
+    return frame.image, frame
 
 def fuzzy_text_match(text, target, threshold=0.7):
     """Compare text with target using fuzzy matching (difflib)."""
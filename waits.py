@@ -0,0 +1,135 @@
+import asyncio
+import time
+import numpy as np
+from metrics import METRICS
+from utils import capture_frame, convert_screenshot_to_bgr, match_template, extract_text_from_screen_region, fuzzy_text_match
+
+# Default adaptive polling: start fast, back off geometrically while the condition stays false
+WAIT_INITIAL_POLL = 0.05
+WAIT_MAX_POLL = 0.5
+WAIT_BACKOFF_FACTOR = 1.5
+# Mean absolute per-channel difference that counts as a region having changed
+REGION_CHANGE_TOLERANCE = 8.0
+
+
+class AdaptiveBackoff:
+    """Poll interval that starts short and grows geometrically up to a ceiling."""
+
+    def __init__(self, initial=WAIT_INITIAL_POLL, maximum=WAIT_MAX_POLL, factor=WAIT_BACKOFF_FACTOR):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+
+    def intervals(self):
+        interval = self.initial
+        while True:
+            yield interval
+            interval = min(interval * self.factor, self.maximum)
+
+
+class FixedInterval(AdaptiveBackoff):
+    """Constant poll interval."""
+
+    def __init__(self, interval):
+        super().__init__(interval, interval, 1.0)
+
+
+# name -> [(elapsed seconds, condition satisfied)]
+WAIT_STATS = {}
+
+
+def _record_wait(name, elapsed, result):
+    WAIT_STATS.setdefault(name, []).append((elapsed, bool(result)))
+    METRICS.observe('wait_seconds', elapsed, wait=name)
+    if not result:
+        METRICS.count('wait_timeouts_total', wait=name)
+
+
+def wait_until(condition, timeout, poll_strategy=None, name='wait'):
+    """Poll condition() until it returns something truthy or timeout seconds pass. Returns the last value.
+
+    Every wait is recorded in WAIT_STATS under name with how long it actually took.
+    """
+    intervals = (poll_strategy or AdaptiveBackoff()).intervals()
+    started = time.monotonic()
+    while True:
+        result = condition()
+        elapsed = time.monotonic() - started
+        if result or elapsed >= timeout:
+            _record_wait(name, elapsed, result)
+            return result
+        time.sleep(min(next(intervals), timeout - elapsed))
+
+
+async def async_wait_until(condition, timeout, poll_strategy=None, name='wait', executor=None):
+    """wait_until for the asyncio state machine: condition() runs in executor and the loop stays free between polls."""
+    loop = asyncio.get_running_loop()
+    intervals = (poll_strategy or AdaptiveBackoff()).intervals()
+    started = time.monotonic()
+    while True:
+        result = await loop.run_in_executor(executor, condition)
+        elapsed = time.monotonic() - started
+        if result or elapsed >= timeout:
+            _record_wait(name, elapsed, result)
+            return result
+        await asyncio.sleep(min(next(intervals), timeout - elapsed))
+
+
+def wait_stats():
+    """Return {name: {'count', 'satisfied', 'mean', 'max'}} for every recorded wait."""
+    summary = {}
+    for name, records in WAIT_STATS.items():
+        durations = [elapsed for elapsed, _ in records]
+        summary[name] = {'count': len(records), 'satisfied': sum(1 for _, satisfied in records if satisfied),
+                         'mean': sum(durations) / len(durations), 'max': max(durations)}
+    return summary
+
+
+def report_wait_stats():
+    """Print how long each named wait actually took compared with how often it timed out."""
+    for name, stats in sorted(wait_stats().items()):
+        print(f"Wait '{name}': {stats['count']} waits, {stats['count'] - stats['satisfied']} timeouts, mean {stats['mean']:.2f}s, max {stats['max']:.2f}s")
+
+
+# =====================
+# Visual predicates
+# =====================
+def around(x, y, radius=20):
+    """Return an (x, y, w, h) box centred on a click point."""
+    return x - radius, y - radius, 2 * radius, 2 * radius
+
+
+def template_visible(template_path, threshold=0.7):
+    """Predicate: True (the match location) while the template is on screen."""
+    def condition():
+        screenshot_bgr, _ = convert_screenshot_to_bgr()
+        max_val, max_loc, _ = match_template(screenshot_bgr, template_path, threshold)
+        return max_loc if max_val is not None and max_val > threshold else None
+    return condition
+
+
+def template_gone(template_path, threshold=0.7):
+    """Predicate: True once the template is no longer on screen."""
+    visible = template_visible(template_path, threshold)
+    return lambda: not visible()
+
+
+def text_visible(region, expected, threshold=0.7):
+    """Predicate: True when OCR of the (x, y, w, h) region fuzzily matches expected."""
+    def condition():
+        text, _ = extract_text_from_screen_region(capture_frame(region), *region)
+        return fuzzy_text_match(text, expected, threshold)[0]
+    return condition
+
+
+def region_changed(region, tolerance=REGION_CHANGE_TOLERANCE):
+    """Predicate: True once the (x, y, w, h) region differs from how it looked when the predicate was created.
+
+    Create it before the click whose effect you are waiting for.
+    """
+    baseline = capture_frame(region).image.astype(np.int16)
+
+    def condition():
+        current = capture_frame(region).image.astype(np.int16)
+        return np.abs(current - baseline).mean() > tolerance
+    return condition